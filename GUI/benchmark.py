@@ -0,0 +1,299 @@
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+# Replays run without a display unless one is asked for
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication, QGraphicsItemGroup
+from PyQt5.QtCore import Qt, QEvent, QPoint, QPointF, QRectF
+from PyQt5.QtGui import QMouseEvent
+
+from backend.tracing import tracer
+from GUI import diagram_file
+from GUI.blocks import Block
+
+BASELINE_PATH = os.path.join(os.path.expanduser("~"), ".bdsimgui", "gui_benchmark.json")
+STEPS = ("load", "select", "drag", "zoom", "group", "properties")
+PERCENTILES = (50, 90, 99)
+TOLERANCE = 0.25  # Relative slowdown of a p90 over its baseline reported as a regression
+SLACK_MS = 2.0  # Absolute slack, so steps of a few milliseconds don't flag on timer noise
+BLOCK_SPACING = (140, 90)  # Scene distance between generated blocks
+
+
+def generate_diagram(count, columns=40):
+    """
+    A diagram of count blocks in rows of STEP -> GAIN ... GAIN -> SCOPE chains.
+
+    Blocks are laid out on a grid, columns per row, in the blocks/wires dict
+    format, so the first n blocks always fill the top rows.
+    """
+    blocks = []
+    wires = []
+    for i in range(count):
+        column = i % columns
+        if column == 0:
+            block_type = "STEP"
+        elif column == columns - 1 or i == count - 1:
+            block_type = "SCOPE"
+        else:
+            block_type = "GAIN"
+        blocks.append({
+            "type": block_type,
+            "name": f"{block_type} {i + 1}",
+            "properties": {},
+            "x": column * BLOCK_SPACING[0],
+            "y": (i // columns) * BLOCK_SPACING[1],
+        })
+        if column > 0:
+            wires.append({
+                "start": blocks[i - 1]["name"], "start_port_index": 0,
+                "end": blocks[i]["name"], "end_port_index": 0,
+            })
+    return {"blocks": blocks, "wires": wires, "groups": []}
+
+
+class GuiReplay:
+    """
+    Replays scripted interactions against a MainWindow and times every event.
+
+    Mouse events are sent to the canvas viewport as a user's would be, then
+    pending events are processed and the viewport repainted, so an event's
+    latency covers handling through to the finished frame. Paint time is
+    the part spent in DiagramCanvas.paintEvent, read from the frame times
+    the canvas keeps while tracing is on.
+    """
+
+    def __init__(self, window, diagram_path, select_count=1000, clicks=100):
+        self.window = window
+        self.canvas = window.canvas
+        self.diagram_path = diagram_path
+        self.select_count = select_count
+        self.clicks = clicks
+        self.samples = {}  # Step -> ([latency ms], [paint ms])
+
+    def measure(self, step, action):
+        """Run one event and record its latency and paint time under step."""
+        self.canvas.frame_times.clear()
+        start = time.perf_counter()
+        action()
+        QApplication.processEvents()
+        self.canvas.viewport().repaint()
+        latency = (time.perf_counter() - start) * 1e3
+        paint = sum(duration for _, duration in self.canvas.frame_times) / 1e6
+        latencies, paints = self.samples.setdefault(step, ([], []))
+        latencies.append(latency)
+        paints.append(paint)
+
+    def mouse(self, event_type, pos, button=Qt.LeftButton, buttons=Qt.LeftButton):
+        """Send a mouse event at a viewport position."""
+        viewport = self.canvas.viewport()
+        # The scene finds items under the cursor from the global position, so it must be real
+        event = QMouseEvent(
+            event_type, QPointF(pos), QPointF(viewport.mapTo(viewport.window(), pos)),
+            QPointF(viewport.mapToGlobal(pos)), button, buttons, Qt.NoModifier,
+        )
+        QApplication.sendEvent(viewport, event)
+
+    def show_region(self, rect):
+        """Fit a scene rectangle in the view, outside of any measurement."""
+        self.canvas.fitInView(rect.adjusted(-40, -40, 40, 40), Qt.KeepAspectRatio)
+        QApplication.processEvents()
+
+    def target_blocks(self):
+        """The first select_count blocks of the generated diagram, whose grid fills the top rows."""
+        blocks = [item for item in self.canvas.scene.items() if isinstance(item, Block)]
+        blocks.sort(key=lambda block: (block.scenePos().y(), block.scenePos().x()))
+        return blocks[:self.select_count]
+
+    def run(self, steps=STEPS, repeat=1):
+        """Replay the steps in order, repeat times, pooling the samples of each step."""
+        for _ in range(repeat):
+            for step in steps:
+                getattr(self, f"replay_{step}")()
+        return self.samples
+
+    def replay_load(self):
+        """Open the diagram file as MainWindow does once its worker has read it."""
+        def load():
+            Block.reset_instance_counter()
+            self.canvas.load_diagram(diagram_file.load_diagram(self.diagram_path))
+        self.measure("load", load)
+        self.canvas.selection_timer.stop()
+
+    def replay_select(self):
+        """Rubber-band select the target blocks, one event per mouse move."""
+        blocks = self.target_blocks()
+        region = QRectF()
+        for block in blocks:
+            region = region.united(block.sceneBoundingRect())
+        self.show_region(region)
+        self.canvas.scene.clearSelection()
+
+        # Drag from just outside the region's top left to past its bottom right
+        start = self.canvas.mapFromScene(region.topLeft()) - QPoint(2, 2)
+        end = self.canvas.mapFromScene(region.bottomRight()) + QPoint(2, 2)
+        self.measure("select", lambda: self.mouse(QEvent.MouseButtonPress, start))
+        for fraction in np.linspace(0.1, 1.0, 10):
+            pos = start + (end - start) * fraction
+            self.measure("select", lambda pos=pos: self.mouse(QEvent.MouseMove, pos, Qt.NoButton))
+        self.measure("select", lambda: self.mouse(QEvent.MouseButtonRelease, end, buttons=Qt.NoButton))
+
+    def replay_drag(self):
+        """Drag the selected blocks by one of them in small mouse moves."""
+        selected = self.canvas.selected_blocks() or self.target_blocks()[:1]
+        handle = self.canvas.mapFromScene(selected[0].sceneBoundingRect().center())
+        end = handle + QPoint(60, 40)
+        self.measure("drag", lambda: self.mouse(QEvent.MouseButtonPress, handle))
+        for fraction in np.linspace(0.05, 1.0, 20):
+            pos = handle + (end - handle) * fraction
+            self.measure("drag", lambda pos=pos: self.mouse(QEvent.MouseMove, pos, Qt.NoButton))
+        self.measure("drag", lambda: self.mouse(QEvent.MouseButtonRelease, end, buttons=Qt.NoButton))
+
+    def replay_zoom(self):
+        """Zoom in and back out in steps; the canvas zooms through its view transform."""
+        for factor in [1.25] * 8 + [0.8] * 8:
+            self.measure("zoom", lambda factor=factor: self.canvas.scale(factor, factor))
+
+    def replay_group(self):
+        """Group the selected blocks and ungroup them again, several times."""
+        blocks = self.canvas.selected_blocks() or self.target_blocks()
+        for _ in range(5):
+            for block in blocks:
+                # Blocks taken out of a group report being selected but are not in the
+                # scene's selection, so deselect them first for setSelected to register
+                block.setSelected(False)
+                block.setSelected(True)
+            self.measure("group", self.canvas.group_selected_items)
+            for item in self.canvas.scene.items():
+                if isinstance(item, QGraphicsItemGroup):
+                    item.setSelected(True)
+            self.measure("group", self.canvas.ungroup_selected_items)
+        self.canvas.scene.clearSelection()
+
+    def replay_properties(self):
+        """Click through blocks one by one at full size, showing each in the properties editor."""
+        self.canvas.resetTransform()
+
+        def click(pos):
+            self.mouse(QEvent.MouseButtonPress, pos)
+            self.mouse(QEvent.MouseButtonRelease, pos, buttons=Qt.NoButton)
+            self.canvas.selection_timer.stop()
+            self.canvas.show_selected_properties()  # The coalesced update the timer would make
+
+        for block in self.target_blocks()[:self.clicks]:
+            self.canvas.ensureVisible(block)  # Scrolling to the block is not timed
+            QApplication.processEvents()
+            pos = self.canvas.mapFromScene(block.sceneBoundingRect().center())
+            self.measure("properties", lambda pos=pos: click(pos))
+
+
+def summarize(samples):
+    """Percentiles of latency and paint time per step, in milliseconds."""
+    summary = {}
+    for step, (latencies, paints) in samples.items():
+        summary[step] = {"events": len(latencies)}
+        for label, values in (("latency", latencies), ("paint", paints)):
+            for p in PERCENTILES:
+                summary[step][f"{label}_p{p}"] = float(np.percentile(values, p))
+            summary[step][f"{label}_max"] = float(max(values))
+    return summary
+
+
+def compare(summary, baseline, tolerance=TOLERANCE, slack=SLACK_MS):
+    """Descriptions of the steps whose p90 latency or paint time regressed from the baseline."""
+    regressions = []
+    for step, stats in summary.items():
+        reference = baseline.get(step)
+        if reference is None:
+            continue
+        for key in ("latency_p90", "paint_p90"):
+            limit = reference[key] * (1 + tolerance) + slack
+            if stats[key] > limit:
+                regressions.append(f"{step} {key} {stats[key]:.2f} ms, baseline {reference[key]:.2f} ms")
+    return regressions
+
+
+def run_benchmark(blocks=5000, select_count=1000, clicks=100, steps=STEPS, repeat=1, file_format=".bdz"):
+    """Replay the scripted steps on a generated diagram of the given size and return the summary."""
+    import main
+
+    app = QApplication.instance() or QApplication([])
+    was_enabled = tracer.enabled
+    with tempfile.TemporaryDirectory() as directory:
+        # Autosave into the temporary directory: a new, empty session there never asks to
+        # recover anything, and the user's own autosave sessions are left alone
+        window = main.MainWindow(autosave_dir=os.path.join(directory, "autosave"))
+        window.resize(1600, 1000)
+        window.show()
+        QApplication.processEvents()
+
+        tracer.enable(True)  # The canvas only keeps frame times while tracing
+        try:
+            path = os.path.join(directory, f"benchmark{file_format}")
+            diagram_file.save_diagram(path, generate_diagram(blocks))
+            samples = GuiReplay(window, path, select_count, clicks).run(steps, repeat)
+        finally:
+            tracer.enable(was_enabled)
+            window.close()
+            app.processEvents()
+    return summarize(samples)
+
+
+def print_summary(summary):
+    header = f"{'step':<12}{'events':>7}" + "".join(
+        f"{f'{label} p{p}':>14}" for label in ("latency", "paint") for p in PERCENTILES
+    )
+    print(header)
+    for step, stats in summary.items():
+        print(f"{step:<12}{stats['events']:>7}" + "".join(
+            f"{stats[f'{label}_p{p}']:>14.2f}" for label in ("latency", "paint") for p in PERCENTILES
+        ))
+
+
+if __name__ == "__main__":
+    # Example: python -m GUI.benchmark --blocks 5000 --update-baseline
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Replay scripted GUI interactions and time every event.")
+    parser.add_argument("--blocks", type=int, default=5000, help="Blocks in the generated diagram")
+    parser.add_argument("--select", type=int, default=1000, help="Blocks rubber-band selected and dragged")
+    parser.add_argument("--clicks", type=int, default=100, help="Blocks clicked through in the properties editor")
+    parser.add_argument("--steps", nargs="+", choices=STEPS, default=list(STEPS), help="Steps to replay, in order")
+    parser.add_argument("--repeat", type=int, default=3, help="Times the steps are replayed; samples are pooled")
+    parser.add_argument("--format", choices=(".bdz", ".json"), default=".bdz", help="File format of the loaded diagram")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file of per-step percentiles")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Relative slowdown allowed over the baseline")
+    args = parser.parse_args()
+
+    summary = run_benchmark(args.blocks, args.select, args.clicks, args.steps, args.repeat, args.format)
+    print_summary(summary)
+
+    # Baselines are kept per configuration: latencies grow with the diagram, and
+    # loading .json and .bdz files or pooling more events are not comparable
+    key = f"{args.blocks} blocks, {args.select} selected, {args.clicks} clicks, {args.repeat} repeats, {args.format}"
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baselines = json.load(file)
+
+    if args.update_baseline:
+        baselines[key] = {**baselines.get(key, {}), **summary}
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(baselines, file, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+    elif key in baselines:
+        regressions = compare(summary, baselines[key], args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline.")
+    else:
+        print(f"No baseline for {key}; run with --update-baseline to store one.")
@@ -1,20 +1,47 @@
-from PyQt5.QtGui import QPen, QColor, QFont
-from PyQt5.QtWidgets import QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsItem, QGraphicsTextItem
-from PyQt5.QtCore import Qt, QPointF
+from PyQt5.QtGui import QPen, QColor, QFont, QStaticText, QPainterPath
+from PyQt5.QtWidgets import QGraphicsRectItem, QGraphicsItem, QStyle
+from PyQt5.QtCore import Qt, QPointF, QRectF
 import logging
 
+from backend.subsystem import subsystem_port_counts
+from backend.tracing import traced
+
 # Set up logging
 logging.basicConfig(level=logging.ERROR, format="%(asctime)s - %(levelname)s - %(message)s")
 
 
 class Block(QGraphicsRectItem):
-    """A draggable block with connection ports and editable properties."""
+    """
+    A draggable block with connection ports and editable properties.
+
+    The name label and ports are painted by the block itself rather than being
+    child items, so each block is a single scene item. Ports are found by
+    hit-testing their circles in port_at.
+    """
     instance_counter = {}  # Keeps track of instance numbers per block type
     GRID_SIZE = 20  # Grid size for snap-to-grid functionality
+    COLOR_MAP = {
+        "STEP": QColor(200, 200, 255),
+        "GAIN": QColor(200, 255, 200),
+        "SUM": QColor(255, 200, 200),
+        "SCOPE": QColor(255, 255, 200),
+        "RAMP": QColor(200, 255, 255),
+        "WAVEFORM": QColor(255, 200, 255),
+        "CONSTANT": QColor(240, 240, 240),
+        "LTI": QColor(255, 220, 180),
+        "SUBSYSTEM": QColor(180, 200, 220),
+        "INPORT": QColor(220, 220, 220),
+        "OUTPORT": QColor(220, 220, 220),
+        "EXT_SOURCE": QColor(200, 230, 210),
+        "FROM_FILE": QColor(210, 210, 240),
+        "EXT_SINK": QColor(230, 230, 200),
+    }
+    PORT_RADIUS = 5
+    LABEL_OFFSET = QPointF(10, -20)  # Label position relative to the block's top left
+    label_font = None  # Shared label font, created on first use
 
-    def __init__(self, block_type, width=100, height=50, properties=None, name=None):
+    def __init__(self, block_type, width=100, height=50, properties=None, name=None, contents=None):
         super().__init__(0, 0, float(width), float(height))
-        self.setBrush(Qt.lightGray)
         self.setFlags(
             QGraphicsItem.ItemIsMovable |
             QGraphicsItem.ItemIsSelectable |
@@ -23,6 +50,12 @@ class Block(QGraphicsRectItem):
         self.block_type = block_type
         self.properties = properties or {}
 
+        # Inner diagram of a SUBSYSTEM block, kept as blocks/wires data until it is opened
+        if block_type == "SUBSYSTEM":
+            self.contents = contents or {"blocks": [], "wires": [], "groups": []}
+        else:
+            self.contents = None
+
         # Assign a unique name
         if block_type not in Block.instance_counter:
             Block.instance_counter[block_type] = 1
@@ -33,11 +66,12 @@ class Block(QGraphicsRectItem):
         else:
             self.name = f"{block_type} {Block.instance_counter[block_type]}"
 
-        # Display the block name
-        self.name_label = QGraphicsTextItem(self.name, self)
-        self.name_label.setDefaultTextColor(Qt.white)
-        self.name_label.setFont(QFont("Arial", 10))
-        self.name_label.setPos(10, -20)  # Position above the block
+        # Display the block name, laid out once and reused on every paint
+        if Block.label_font is None:
+            Block.label_font = QFont("Arial", 10)
+        self.name_label = QStaticText(self.name)
+        self.name_label.setPerformanceHint(QStaticText.AggressiveCaching)
+        self.name_label.prepare(font=Block.label_font)
 
         # Add ports dynamically based on block type
         self.input_ports = []
@@ -54,17 +88,57 @@ class Block(QGraphicsRectItem):
 
     def set_block_color(self):
         """Set block color based on its type."""
-        color_map = {
-            "STEP": QColor(200, 200, 255),
-            "GAIN": QColor(200, 255, 200),
-            "SUM": QColor(255, 200, 200),
-            "SCOPE": QColor(255, 255, 200),
-            "RAMP": QColor(200, 255, 255),
-            "WAVEFORM": QColor(255, 200, 255),
-            "CONSTANT": QColor(240, 240, 240),
-            "LTI": QColor(255, 220, 180),
-        }
-        self.setBrush(color_map.get(self.block_type, Qt.lightGray))
+        self.setBrush(Block.COLOR_MAP.get(self.block_type, Qt.lightGray))
+
+    def boundingRect(self):
+        """Block rectangle extended to cover the label and the ports."""
+        r = self.PORT_RADIUS
+        label = self.name_label.size()
+        return self.rect().adjusted(-10 - r, 0, r, 0).united(
+            QRectF(self.LABEL_OFFSET, label)
+        ).adjusted(-1, -1, 1, 1)
+
+    def shape(self):
+        """Clickable area: the block rectangle and its port circles."""
+        path = QPainterPath()
+        path.addRect(self.rect())
+        for port in self.input_ports + self.output_ports:
+            path.addEllipse(port.pos(), self.PORT_RADIUS, self.PORT_RADIUS)
+        return path
+
+    def paint(self, painter, option, widget=None):
+        """Draw the block, its ports and its name label."""
+        painter.setPen(self.pen())
+        painter.setBrush(self.brush())
+        painter.drawRect(self.rect())
+
+        if option.state & QStyle.State_Selected:
+            painter.setPen(QPen(Qt.black, 0, Qt.DashLine))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(self.rect())
+            painter.setPen(self.pen())
+
+        # Zoomed far out, e.g. in the minimap, ports and labels would be a pixel or less
+        if option.levelOfDetailFromTransform(painter.worldTransform()) < 0.3:
+            return
+
+        painter.setBrush(Qt.darkGray)
+        for port in self.input_ports + self.output_ports:
+            painter.drawEllipse(port.pos(), self.PORT_RADIUS, self.PORT_RADIUS)
+
+        painter.setPen(Qt.white)
+        painter.setFont(Block.label_font)
+        painter.drawStaticText(self.LABEL_OFFSET, self.name_label)
+
+    def port_at(self, scene_pos):
+        """Return the port whose circle contains a scene position, or None."""
+        pos = self.mapFromScene(scene_pos)
+        r2 = self.PORT_RADIUS * self.PORT_RADIUS
+        for port in self.input_ports + self.output_ports:
+            d = pos - port.pos()
+            if d.x() * d.x() + d.y() * d.y() <= r2:
+                return port
+        return None
 
     def snap_to_grid(self, pos):
         """Snap the block position to the nearest grid point."""
@@ -72,6 +146,7 @@ class Block(QGraphicsRectItem):
         y = round(pos.y() / Block.GRID_SIZE) * Block.GRID_SIZE
         return QPointF(x, y)
 
+    @traced()
     def itemChange(self, change, value):
         """Update ports when block is moved."""
         if change == QGraphicsItem.ItemPositionChange:
@@ -143,8 +218,6 @@ class Block(QGraphicsRectItem):
 
     def add_ports(self):
         """Add ports to the block based on its type."""
-        port_spacing = 20  # Space between ports
-
         # Define ports based on the block type
         if self.block_type == "STEP":
             num_inputs, num_outputs = 0, 1  # STEP block only has an output port
@@ -157,7 +230,8 @@ class Block(QGraphicsRectItem):
             self.properties = {"Inputs": "+-"}
         elif self.block_type == "SCOPE":
             num_inputs, num_outputs = 1, 0
-            self.properties = {"Style": "Line"}
+            # "Stream To" names a directory to stream samples to instead of keeping them in memory
+            self.properties = {"Style": "Line", "Stream To": "", "Stream Format": "npy"}
         elif self.block_type == "RAMP":
             num_inputs, num_outputs = 0, 1
             self.properties = {"Start Time": 0, "Slope": 1}
@@ -176,38 +250,102 @@ class Block(QGraphicsRectItem):
         elif self.block_type == "LTI":
             num_inputs, num_outputs = 1, 1
             self.properties = {"Numerator": [1], "Denominator": [1, 1]}
+        elif self.block_type == "FROM_FILE":
+            num_inputs, num_outputs = 0, 1
+            # .npy with time in column 0, .npz with "t" and "y", or CSV
+            self.properties = {"File": "", "Interpolation": "linear"}
+        elif self.block_type == "EXT_SOURCE":
+            num_inputs, num_outputs = 0, 1
+            # Address is "host:port" for udp, or the shared memory name for shm
+            self.properties = {
+                "Transport": "udp",
+                "Address": "127.0.0.1:9870",
+                "Width": 1,
+                "Initial": 0,
+                "Buffer": 1024,
+            }
+        elif self.block_type == "EXT_SINK":
+            num_inputs, num_outputs = 1, 0
+            self.properties = {
+                "Transport": "udp",
+                "Address": "127.0.0.1:9871",
+                "Width": 1,
+                "Buffer": 1024,
+            }
+        elif self.block_type == "SUBSYSTEM":
+            num_inputs, num_outputs = subsystem_port_counts(self.contents)
+            self.properties = {}
+        elif self.block_type == "INPORT":
+            num_inputs, num_outputs = 0, 1
+            self.properties = {"Port": 0}
+        elif self.block_type == "OUTPORT":
+            num_inputs, num_outputs = 1, 0
+            self.properties = {"Port": 0}
         else:
             num_inputs, num_outputs = 0, 0  # Default for unknown types
 
         # Clear existing ports
         self.input_ports = []
         self.output_ports = []
+        self.resize_ports(num_inputs, num_outputs)
 
-        # Create input ports
-        for i in range(num_inputs):
-            port = Port(self, "input")
-            port.setPos(self.rect().left() - 10, self.rect().top() + i * port_spacing + 10)
-            self.input_ports.append(port)
+    def resize_ports(self, num_inputs, num_outputs):
+        """Add or remove ports at the end so the block has the given number of each."""
+        port_spacing = 20  # Space between ports
 
-        # Create output ports
-        for i in range(num_outputs):
-            port = Port(self, "output")
-            port.setPos(self.rect().right(), self.rect().top() + i * port_spacing + 10)
-            self.output_ports.append(port)
+        # Ports are painted by the block, so its bounds and shape change with them
+        self.prepareGeometryChange()
 
-    def __del__(self):
-        """Ensure all connected wires are removed when the block is deleted."""
-        for port in self.input_ports + self.output_ports:
-            port.remove_connected_wires()
+        # Grow the block if the ports do not fit
+        rect = self.rect()
+        needed_height = max(num_inputs, num_outputs) * port_spacing + 10
+        if needed_height > rect.height():
+            self.setRect(rect.x(), rect.y(), rect.width(), needed_height)
+
+        for ports, count, port_type, x in (
+            (self.input_ports, num_inputs, "input", rect.left() - 10),
+            (self.output_ports, num_outputs, "output", rect.right()),
+        ):
+            # Remove surplus ports together with their wires
+            while len(ports) > count:
+                port = ports.pop()
+                port.remove_connected_wires()
+
+            # Create missing ports
+            while len(ports) < count:
+                port = Port(self, port_type)
+                port.setPos(x, rect.top() + len(ports) * port_spacing + 10)
+                ports.append(port)
 
+    def update_boundary_ports(self):
+        """Match a subsystem's ports to the INPORT/OUTPORT blocks in its contents."""
+        self.resize_ports(*subsystem_port_counts(self.contents))
 
-class Port(QGraphicsEllipseItem):
-    def __init__(self, parent, port_type, radius=5):
-        super().__init__(-radius, -radius, 2 * radius, 2 * radius, parent)
+
+class Port:
+    """A connection point on a block, drawn and hit-tested by the block."""
+    __slots__ = ("block", "port_type", "position", "connected_wires")
+
+    def __init__(self, parent, port_type):
+        self.block = parent
         self.port_type = port_type
-        self.setBrush(Qt.darkGray)
+        self.position = QPointF()  # Centre, in block coordinates
         self.connected_wires = []  # Track wires connected to this port
 
+    def parentItem(self):
+        """Block the port belongs to."""
+        return self.block
+
+    def pos(self):
+        return self.position
+
+    def setPos(self, x, y):
+        self.position = QPointF(x, y)
+
+    def scenePos(self):
+        """Centre of the port in scene coordinates."""
+        return self.block.mapToScene(self.position)
+
     def notify_wires(self):
         """Safely notify connected wires to update their positions."""
         try:
@@ -223,10 +361,3 @@ class Port(QGraphicsEllipseItem):
             if wire:  # Check if wire is not None
                 wire.remove_wire()
         self.connected_wires.clear()  # Clear the list
-
-    def __del__(self):
-        """Safely clean up wires connected to this port."""
-        try:
-            self.remove_connected_wires()  # Remove wires directly connected to this port
-        except Exception as e:
-            logging.error(f"Error during port deletion: {e}")
@@ -1,22 +1,48 @@
+import os
+import time
+from collections import deque
+
 from PyQt5.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsItem
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from GUI.blocks import Block, Port
 from GUI.wires import Wire
+from GUI import diagram_file
 from PyQt5.QtGui import QPainter
-import json
 from PyQt5.QtGui import QPen, QColor
 from PyQt5.QtCore import QRectF
 from PyQt5.QtWidgets import QGraphicsItemGroup
+from backend.subsystem import boundary_ports, wire_sources
+from backend import library
+from backend.tracing import tracer, traced
+
+LAYOUT_OPS = ("move", "group", "ungroup")  # Journaled edits that leave the simulated diagram unchanged
 
 
 class DiagramCanvas(QGraphicsView):
     GRID_SIZE = 20  # Size of each grid cell
     """Canvas for the diagram editor."""
+    wire_added = pyqtSignal()
+    simulation_changed = pyqtSignal()  # An edit that changes what the diagram simulates
+    scene_swapped = pyqtSignal(object)  # New scene
+
     def __init__(self, properties_editor=None):
         super().__init__()
 
+        # Incremented on every edit, so results can be matched to the diagram they came from
+        self.diagram_version = 0
+        # Incremented only by edits that change what is simulated, unlike moves or opening subsystems
+        self.simulation_version = 0
+
+        # (start, duration) in ns of recent viewport repaints, kept while tracing for the overlay
+        self.frame_times = deque(maxlen=120)
+
+        # Selection changes are coalesced so a rubber-band drag updates the properties editor once
+        self.selection_timer = QTimer(self)
+        self.selection_timer.setSingleShot(True)
+        self.selection_timer.timeout.connect(self.show_selected_properties)
+
         # Set up the scene
-        self.scene = QGraphicsScene()
+        self.scene = self.create_scene()
         self.setScene(self.scene)
         self.setRenderHint(QPainter.Antialiasing)
         self.setDragMode(QGraphicsView.RubberBandDrag)
@@ -35,32 +61,184 @@ class DiagramCanvas(QGraphicsView):
         self.redo_stack = []
         self.current_group = None  # Store the current active group
 
+        # Optional DiagramJournal that every edit is appended to
+        self.journal = None
+        self.press_positions = {}  # Block positions at mouse press, to detect moves
+
+        # Open subsystems, outermost first: (subsystem block, parent scene, parent undo, parent redo)
+        self.subsystem_stack = []
+
+        # Component library files that subsystems were instanced from, saved with the diagram
+        self.libraries = []
+
+        if self.properties_editor:
+            self.properties_editor.property_changed.connect(self.property_changed)
+
+    def create_scene(self):
+        """Create an empty scene for the canvas."""
+        scene = QGraphicsScene()
+        scene.selectionChanged.connect(self.selection_timer.start)
+        return scene
+
+    def show_selected_properties(self):
+        """Edit the selected blocks of the same type as the first one together."""
+        if not self.properties_editor:
+            return
+        blocks = [item for item in self.scene.selectedItems() if isinstance(item, Block)]
+        if blocks:
+            block_type = blocks[0].block_type
+            blocks = [block for block in blocks if block.block_type == block_type]
+        self.properties_editor.set_blocks(blocks)
+
+    def swap_scene(self, scene):
+        """Replace the current scene with another one and return the previous scene."""
+        # Abandon any wire that is still being drawn in the old scene
+        if self.temp_wire:
+            self.scene.removeItem(self.temp_wire)
+            self.temp_wire = None
+        self.start_port = None
+
+        old_scene = self.scene
+        self.scene = scene
+        self.setScene(scene)
+        self.diagram_version += 1
+        self.show_selected_properties()  # Stop editing blocks of the scene swapped out
+        self.scene_swapped.emit(scene)
+        return old_scene
+
+    @traced()
     def get_blocks_and_wires(self):
-        """Retrieve all blocks and wires from the canvas for simulation or saving."""
+        """Retrieve all blocks and wires of the top-level diagram for simulation or saving."""
+        self.sync_subsystems()
+        return self.scene_blocks_and_wires(self.root_scene())
+
+    def scene_blocks_and_wires(self, scene):
+        """Retrieve the blocks and wires in one scene."""
         blocks = []
         wires = []
 
-        for item in self.scene.items():
+        for item in scene.items():
             if isinstance(item, Block):
-                block_data = {
-                    "type": item.block_type,
-                    "name": item.name,
-                    "properties": item.properties,
-                    "x": item.pos().x(),
-                    "y": item.pos().y(),
-                }
-                blocks.append(block_data)
-            elif isinstance(item, Wire):
-                wire_data = {
-                    "start": item.start_port.parentItem().name,
-                    "end": item.end_port.parentItem().name,
-                    "start_port_index": self.get_port_index(item.start_port),
-                    "end_port_index": self.get_port_index(item.end_port),
-                }
-                wires.append(wire_data)
+                blocks.append(self.block_record(item))
+            elif isinstance(item, Wire) and item.end_port:  # Skip a wire still being drawn
+                wires.append(self.wire_record(item))
 
         return blocks, wires
 
+    def scene_data(self, scene):
+        """Return a copy of one scene's blocks, wires and groups."""
+        blocks, wires = self.scene_blocks_and_wires(scene)
+        for block in blocks:
+            block["properties"] = dict(block["properties"])
+        return {"blocks": blocks, "wires": wires, "groups": self.scene_groups(scene)}
+
+    def root_scene(self):
+        """Return the scene of the top-level diagram, even while a subsystem is open."""
+        if self.subsystem_stack:
+            return self.subsystem_stack[0][1]
+        return self.scene
+
+    def block_record(self, block):
+        """Describe a block in the blocks/wires dict format."""
+        # Use the scene position so blocks inside a moved group are placed correctly
+        pos = block.scenePos()
+        record = {
+            "type": block.block_type,
+            "name": block.name,
+            "properties": block.properties,
+            "x": pos.x(),
+            "y": pos.y(),
+        }
+        if block.contents is not None:
+            record["contents"] = block.contents
+        return record
+
+    def wire_record(self, wire):
+        """Describe a wire in the blocks/wires dict format."""
+        return {
+            "start": wire.start_port.parentItem().name,
+            "end": wire.end_port.parentItem().name,
+            "start_port_index": self.get_port_index(wire.start_port),
+            "end_port_index": self.get_port_index(wire.end_port),
+        }
+
+    def show_signal_widths(self, widths, blocks, wires):
+        """
+        Label the wires of the open scene with the channels they carry.
+
+        widths is by flattened block name, and blocks and wires are the
+        diagram as get_blocks_and_wires returned it for working them out.
+        """
+        sources = wire_sources(blocks, wires)
+        prefix = "".join(subsystem.name + "/" for subsystem, *_ in self.subsystem_stack)
+        for item in self.scene.items():
+            if isinstance(item, Wire) and item.end_port:
+                start = (prefix + item.start_port.parentItem().name, self.get_port_index(item.start_port))
+                source = sources.get(start)
+                item.set_width(widths.get(source[0], 1) if source else 1)
+
+    def get_groups(self):
+        """Return the names of the blocks in each group of the top-level diagram."""
+        self.sync_subsystems()
+        return self.scene_groups(self.root_scene())
+
+    def scene_groups(self, scene):
+        """Return the names of the blocks in each group in one scene."""
+        return [
+            self.group_block_names(item)
+            for item in scene.items()
+            if isinstance(item, QGraphicsItemGroup)
+        ]
+
+    def group_block_names(self, group):
+        """Return the names of the blocks directly inside a group."""
+        return [item.name for item in group.childItems() if isinstance(item, Block)]
+
+    def get_diagram_data(self):
+        """Return a snapshot of the diagram that is safe to serialize on another thread."""
+        self.sync_subsystems()
+        diagram_data = self.scene_data(self.root_scene())
+        if self.libraries:
+            diagram_data["libraries"] = list(self.libraries)
+        return diagram_data
+
+    def record(self, op, **data):
+        """Append an edit to the journal, if one is attached."""
+        self.diagram_version += 1
+        if op not in LAYOUT_OPS:
+            self.simulation_edited()
+
+        # Edits inside open subsystems name the subsystems leading to them
+        if self.journal:
+            if self.subsystem_stack:
+                data["path"] = [subsystem.name for subsystem, *_ in self.subsystem_stack]
+            self.journal.append(op, **data)
+
+    def simulation_edited(self):
+        """Note an edit that changes the simulated diagram, so live results before it are stale."""
+        self.simulation_version += 1
+        self.simulation_changed.emit()
+
+    def reset_journal(self):
+        """Replace the journal contents with a snapshot of the whole diagram."""
+        if self.journal:
+            self.journal.reset(self.get_diagram_data())
+
+    def property_changed(self, blocks, prop, value):
+        """Journal a property edited in the properties editor."""
+        self.record("set_property", names=[block.name for block in blocks], property=prop, value=value)
+
+    def paintEvent(self, event):
+        """Repaint the viewport, timing the frame while tracing."""
+        if not tracer.enabled:
+            return super().paintEvent(event)
+        start = time.perf_counter_ns()
+        super().paintEvent(event)
+        duration = time.perf_counter_ns() - start
+        tracer.record("DiagramCanvas.paintEvent", "paint", start, duration)
+        self.frame_times.append((start, duration))
+
+    @traced(category="paint")
     def drawBackground(self, painter, rect):
         """Draw a grid on the canvas."""
         super().drawBackground(painter, rect)
@@ -84,8 +262,8 @@ class DiagramCanvas(QGraphicsView):
             painter.drawLine(int(rect.left()), int(y), int(rect.right()), int(y))
             y += self.GRID_SIZE
 
-    def add_block(self, block_type, x=None, y=None, name=None):
-        """Add a block of the specified type to the canvas."""
+    def add_block(self, block_type, x=None, y=None, name=None, contents=None):
+        """Add a block of the specified type to the canvas, with the given contents for a SUBSYSTEM."""
         if x is None or y is None:
             # Get the center of the visible area in the scene
             visible_rect = self.mapToScene(self.viewport().rect()).boundingRect()
@@ -93,18 +271,36 @@ class DiagramCanvas(QGraphicsView):
             print(f"Spawning block at scene center: x={x}, y={y}")  # Debugging output
 
         # Create the block
-        if name:
-            block = Block(block_type, name=name)
-        else:
-            block = Block(block_type)
+        block = Block(block_type, name=name, contents=contents)
+
+        # Number new boundary blocks after the existing ones so subsystem ports keep their order
+        if block_type in ("INPORT", "OUTPORT"):
+            block.properties["Port"] = sum(
+                1 for item in self.scene.items() if isinstance(item, Block) and item.block_type == block_type
+            )
 
         block.setPos(x, y)  # Position the block
         self.scene.addItem(block)
+        self.record("add_block", **self.block_record(block))
         # Push action to Undo stack
         self.undo_stack.append(("add_block", block))
         self.redo_stack.clear()  # Clear Redo stack
         return block
 
+    def add_component(self, library_path, reference, x=None, y=None):
+        """
+        Instance a library component as a SUBSYSTEM block.
+
+        Every instance shares the contents parsed from the library, and the
+        diagram keeps a link to the library so saving it stores a reference
+        rather than another copy.
+        """
+        block = self.add_block("SUBSYSTEM", x, y, contents=library.library_contents(library_path, reference))
+        library_path = os.path.abspath(library_path)
+        if library_path not in self.libraries:
+            self.libraries.append(library_path)
+        return block
+
     def add_wire(self, start_block_name, start_port_index, end_block_name, end_port_index):
         """Add a wire between two ports on the canvas."""
         # Find the blocks by their names
@@ -122,10 +318,12 @@ class DiagramCanvas(QGraphicsView):
         # Create and connect the wire
         wire = Wire(start_port, end_port)
         self.scene.addItem(wire)
+        self.record("add_wire", **self.wire_record(wire))
 
         # Push action to Undo stack
         self.undo_stack.append(("add_wire", wire))
         self.redo_stack.clear()  # Clear Redo stack
+        self.wire_added.emit()
 
     def delete_selected(self):
         """Delete all selected items (blocks, wires, or groups)."""
@@ -134,6 +332,7 @@ class DiagramCanvas(QGraphicsView):
                 if isinstance(item, Block):
                     # Save state for Undo
                     self.undo_stack.append(("delete_block", item))
+                    self.record("delete_block", name=item.name)
                     # Remove wires connected to the block
                     for port in item.input_ports + item.output_ports:
                         if hasattr(port, "remove_connected_wires"):
@@ -149,6 +348,7 @@ class DiagramCanvas(QGraphicsView):
                         "wire": item,
                     }
                     self.undo_stack.append(("delete_wire", wire_data))
+                    self.record("delete_wire", **self.wire_record(item))
                     self.scene.removeItem(item)
 
             except Exception as e:
@@ -158,10 +358,13 @@ class DiagramCanvas(QGraphicsView):
 
     def clear(self):
         """Clear all blocks and wires from the canvas."""
-        # Save current state for Undo
-        self.undo_stack.append(("clear", self.get_blocks_and_wires()))
-        for item in self.scene.items():
-            self.scene.removeItem(item)
+        # Swap in an empty scene instead of removing items one by one;
+        # the old scene is kept on the Undo stack so it can be restored as is
+        new_scene = self.create_scene()
+        old_scene = self.swap_scene(new_scene)
+        self.undo_stack.append(("clear", old_scene, new_scene))
+        self.reset_journal()
+        self.simulation_edited()
 
         self.redo_stack.clear()  # Clear Redo stack
 
@@ -185,8 +388,26 @@ class DiagramCanvas(QGraphicsView):
 
         # Add the group to the undo stack
         self.undo_stack.append(("group", group, selected_items))
+        self.record("group", blocks=self.group_block_names(group))
         print("Grouped items successfully.")
 
+    def group_blocks(self, scene, blocks):
+        """Group existing blocks, e.g. when rebuilding groups from a file."""
+        group = QGraphicsItemGroup()
+        group.setFlag(QGraphicsItem.ItemIsMovable, True)
+        group.setFlag(QGraphicsItem.ItemIsSelectable, True)
+        scene.addItem(group)
+        for block in blocks:
+            group.addToGroup(block)
+        return group
+
+    def dissolve_group(self, group, items):
+        """Take items out of a group and remove the group, keeping the items in the scene."""
+        for item in items:
+            group.removeFromGroup(item)
+            item.setSelected(True)
+        self.scene.removeItem(group)
+
     def ungroup_selected_items(self):
         """Ungroup selected QGraphicsItemGroup and ensure wires remain visually connected."""
         selected_items = self.scene.selectedItems()
@@ -203,6 +424,7 @@ class DiagramCanvas(QGraphicsView):
                     if isinstance(item, Wire):
                         item.update_position()  # Refresh wire endpoints visually
 
+                self.record("ungroup", blocks=[item.name for item in items_in_group if isinstance(item, Block)])
                 self.scene.removeItem(group)  # Remove the group container
 
                 # Reconnect wires and update their visual positions
@@ -219,50 +441,224 @@ class DiagramCanvas(QGraphicsView):
 
     def save_to_file(self, file_path):
         """Save the current diagram to a file."""
-        blocks, wires = self.get_blocks_and_wires()
-        diagram_data = {"blocks": blocks, "wires": wires}
+        diagram_data = self.get_diagram_data()
 
         try:
-            with open(file_path, "w") as file:
-                json.dump(diagram_data, file, indent=4)
+            diagram_file.save_diagram(file_path, diagram_data)
             print(f"Diagram saved to {file_path}")
         except Exception as e:
             print(f"Error saving diagram: {e}")
 
+    @traced()
     def load_from_file(self, file_path):
         """Load a diagram from a file."""
         try:
-            with open(file_path, "r") as file:
-                diagram_data = json.load(file)
-
-            # Clear the current canvas
-            self.clear()
-
-            # Add blocks
-            for block_data in diagram_data["blocks"]:
-                block = self.add_block(
-                    block_type=block_data["type"],
-                    x=block_data["x"],
-                    y=block_data["y"],
-                    name=block_data["name"],  # Pass the name to preserve it
-                )
-                block.properties.update(block_data["properties"])
-
-            # Add wires
-            for wire_data in diagram_data["wires"]:
-                self.add_wire(
-                    start_block_name=wire_data["start"],
-                    start_port_index=wire_data["start_port_index"],
-                    end_block_name=wire_data["end"],
-                    end_port_index=wire_data["end_port_index"],
-                )
+            diagram_data = diagram_file.load_diagram(file_path)
+            self.load_diagram(diagram_data)
             print(f"Diagram loaded from {file_path}")
         except Exception as e:
             print(f"Error loading diagram: {e}")
 
+    @traced()
+    def load_diagram(self, diagram_data):
+        """Replace the canvas contents with a diagram in a single batch."""
+        self.close_all_subsystems()
+        scene = self.build_scene(diagram_data)
+        self.libraries = list(diagram_data.get("libraries", []))
+
+        # Swap the finished scene in
+        old_scene = self.swap_scene(scene)
+
+        # Record the whole load as one Undo entry
+        self.undo_stack.append(("load", old_scene, scene))
+        self.redo_stack.clear()  # Clear Redo stack
+        if self.journal:
+            self.journal.reset(diagram_data)
+        self.simulation_edited()
+
+    def build_scene(self, diagram_data):
+        """Build a new scene holding a diagram given in the blocks/wires dict format."""
+        # Build everything in a detached scene with indexing suspended, so no
+        # view updates or index maintenance happen per item
+        scene = self.create_scene()
+        scene.setItemIndexMethod(QGraphicsScene.NoIndex)
+
+        # Add blocks
+        blocks_by_name = {}
+        for block_data in diagram_data["blocks"]:
+            block = Block(block_data["type"], name=block_data["name"],  # Preserve the name
+                          contents=block_data.get("contents"))
+            block.setPos(block_data["x"], block_data["y"])
+            block.properties.update(block_data["properties"])
+            scene.addItem(block)
+            blocks_by_name[block.name] = block
+
+        # Add wires
+        for wire_data in diagram_data["wires"]:
+            start_block = blocks_by_name.get(wire_data["start"])
+            end_block = blocks_by_name.get(wire_data["end"])
+            if not start_block or not end_block:
+                print(f"Error: Could not find blocks {wire_data['start']} or {wire_data['end']} for wire.")
+                continue
+
+            wire = Wire(
+                start_block.output_ports[wire_data["start_port_index"]],
+                end_block.input_ports[wire_data["end_port_index"]],
+            )
+            scene.addItem(wire)
+
+        # Add groups
+        for names in diagram_data.get("groups", []):
+            self.group_blocks(scene, [blocks_by_name[name] for name in names if name in blocks_by_name])
+
+        # Rebuild the index once
+        scene.setItemIndexMethod(QGraphicsScene.BspTreeIndex)
+        return scene
+
+    def create_subsystem(self):
+        """Collapse the selected blocks into a single SUBSYSTEM block."""
+        blocks = [item for item in self.scene.selectedItems() if isinstance(item, Block)]
+        if not blocks:
+            print("No blocks selected for the subsystem.")
+            return
+
+        names = {block.name for block in blocks}
+        bounds = blocks[0].sceneBoundingRect()
+        for block in blocks[1:]:
+            bounds = bounds.united(block.sceneBoundingRect())
+
+        # Sort the wires touching the selection into inner and boundary-crossing wires
+        old_wires = []
+        for block in blocks:
+            for port in block.input_ports + block.output_ports:
+                for wire in port.connected_wires:
+                    if wire.scene() is self.scene and wire.end_port and wire not in old_wires:
+                        old_wires.append(wire)
+
+        contents = {"blocks": [], "wires": [], "groups": []}
+        for block in blocks:
+            record = self.block_record(block)
+            record["properties"] = dict(record["properties"])
+            contents["blocks"].append(record)
+
+        inports = {}  # (outer start block, port) -> INPORT name
+        outports = {}  # (inner start block, port) -> OUTPORT name
+        incoming = []  # (outer start port, INPORT name)
+        outgoing = []  # (OUTPORT name, outer end port)
+        for wire in old_wires:
+            record = self.wire_record(wire)
+            start_inside = record["start"] in names
+            end_inside = record["end"] in names
+            if start_inside and end_inside:
+                contents["wires"].append(record)
+            elif end_inside:
+                key = (record["start"], record["start_port_index"])
+                if key not in inports:
+                    inports[key] = f"In {len(inports) + 1}"
+                    incoming.append((wire.start_port, inports[key]))
+                contents["wires"].append({**record, "start": inports[key], "start_port_index": 0})
+            else:
+                key = (record["start"], record["start_port_index"])
+                if key not in outports:
+                    outports[key] = f"Out {len(outports) + 1}"
+                    contents["wires"].append({**record, "end": outports[key], "end_port_index": 0})
+                outgoing.append((outports[key], wire.end_port))
+
+        # Boundary blocks just outside the collapsed blocks
+        for port_type, ports, x in (("INPORT", inports, bounds.left() - 150),
+                                    ("OUTPORT", outports, bounds.right() + 50)):
+            for i, port_name in enumerate(ports.values()):
+                contents["blocks"].append({
+                    "type": port_type, "name": port_name, "properties": {"Port": i},
+                    "x": x, "y": bounds.top() + i * 80,
+                })
+
+        # Replace the blocks with the subsystem and rewire its boundary
+        for block in blocks:
+            block.setSelected(False)
+            self.scene.removeItem(block)
+        for wire in old_wires:
+            if wire.scene():
+                self.scene.removeItem(wire)
+
+        subsystem = Block("SUBSYSTEM", contents=contents)
+        subsystem.setPos(bounds.topLeft())
+        self.scene.addItem(subsystem)
+
+        inport_order = boundary_ports(contents, "INPORT")
+        outport_order = boundary_ports(contents, "OUTPORT")
+        new_wires = []
+        for start_port, port_name in incoming:
+            new_wires.append(Wire(start_port, subsystem.input_ports[inport_order.index(port_name)]))
+        for port_name, end_port in outgoing:
+            new_wires.append(Wire(subsystem.output_ports[outport_order.index(port_name)], end_port))
+        for wire in new_wires:
+            self.scene.addItem(wire)
+
+        self.undo_stack.append(("create_subsystem", subsystem, blocks, old_wires, new_wires))
+        self.redo_stack.clear()
+        self.record_subsystem_swap(blocks, [subsystem], new_wires)
+        return subsystem
+
+    def record_subsystem_swap(self, removed_blocks, added_blocks, added_wires):
+        """Journal blocks replaced by others, e.g. when collapsing a subsystem."""
+        for block in removed_blocks:
+            self.record("delete_block", name=block.name)
+        for block in added_blocks:
+            self.record("add_block", **self.block_record(block))
+        for wire in added_wires:
+            self.record("add_wire", **self.wire_record(wire))
+
+    def open_subsystem(self, subsystem=None):
+        """Show the inside of a subsystem, building its scene only now."""
+        if subsystem is None:
+            selected = [item for item in self.scene.selectedItems()
+                        if isinstance(item, Block) and item.block_type == "SUBSYSTEM"]
+            if not selected:
+                print("No subsystem selected.")
+                return
+            subsystem = selected[0]
+
+        scene = self.build_scene(subsystem.contents)
+        self.subsystem_stack.append((subsystem, self.scene, self.undo_stack, self.redo_stack))
+        self.swap_scene(scene)
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def close_subsystem(self):
+        """Return to the parent diagram, writing the open subsystem's contents back."""
+        if not self.subsystem_stack:
+            return
+
+        contents = self.scene_data(self.scene)
+        subsystem, parent_scene, self.undo_stack, self.redo_stack = self.subsystem_stack.pop()
+        subsystem.contents = contents
+        self.swap_scene(parent_scene)  # The inner scene is dropped until the subsystem is opened again
+        subsystem.update_boundary_ports()
+
+        # Inner edits were journaled as they happened; the contents are also journaled
+        # whole once back at the top level, covering anything not journaled as an edit
+        if not self.subsystem_stack:
+            self.record("set_contents", name=subsystem.name, contents=contents)
+
+    def close_all_subsystems(self):
+        """Return to the top-level diagram."""
+        while self.subsystem_stack:
+            self.close_subsystem()
+
+    def sync_subsystems(self):
+        """Write the contents of open subsystems back into their blocks without closing them."""
+        scene = self.scene
+        for subsystem, parent_scene, _, _ in reversed(self.subsystem_stack):
+            subsystem.contents = self.scene_data(scene)
+            scene = parent_scene
+
     def mousePressEvent(self, event):
         """Handle mouse press for selecting or starting a wire."""
         item = self.itemAt(event.pos())
+        if isinstance(item, Block):
+            # Ports are part of their block's item, so look for one under the cursor
+            item = item.port_at(self.mapToScene(event.pos())) or item
 
         if isinstance(item, Block):
             # Pass the selected block to the properties editor
@@ -279,8 +675,10 @@ class DiagramCanvas(QGraphicsView):
             # Complete the wire connection to a valid input port
             if self.temp_wire:
                 self.temp_wire.set_end_port(item)  # Dynamically set the end_port
+                self.record("add_wire", **self.wire_record(self.temp_wire))
                 self.temp_wire = None
                 self.start_port = None
+                self.wire_added.emit()
 
         else:
             # Reset wire drawing if no valid connection
@@ -291,6 +689,41 @@ class DiagramCanvas(QGraphicsView):
 
         super().mousePressEvent(event)
 
+        # Remember where the selected blocks are, to journal them if they get dragged
+        if self.journal:
+            self.press_positions = {block: block.scenePos() for block in self.selected_blocks()}
+
+    def mouseReleaseEvent(self, event):
+        """Journal blocks moved by a drag."""
+        super().mouseReleaseEvent(event)
+
+        moved = [
+            [block.name, block.scenePos().x(), block.scenePos().y()]
+            for block, pos in self.press_positions.items()
+            if block.scene() is self.scene and block.scenePos() != pos
+        ]
+        self.press_positions = {}
+        if moved:
+            self.record("move", blocks=moved)
+
+    def selected_blocks(self):
+        """Return the selected blocks, including blocks inside selected groups."""
+        blocks = []
+        for item in self.scene.selectedItems():
+            if isinstance(item, Block):
+                blocks.append(item)
+            elif isinstance(item, QGraphicsItemGroup):
+                blocks.extend(child for child in item.childItems() if isinstance(child, Block))
+        return blocks
+
+    def mouseDoubleClickEvent(self, event):
+        """Open a subsystem when it is double-clicked."""
+        item = self.itemAt(event.pos())
+        if isinstance(item, Block) and item.block_type == "SUBSYSTEM":
+            self.open_subsystem(item)
+            return
+        super().mouseDoubleClickEvent(event)
+
     def mouseMoveEvent(self, event):
         """Update the temporary wire during wire drawing."""
         if self.start_port and self.temp_wire:
@@ -302,8 +735,7 @@ class DiagramCanvas(QGraphicsView):
         """Handle key presses for operations like deletion."""
         if event.key() == Qt.Key_Delete:
             # Delete selected items (blocks or wires)
-            for item in self.scene.selectedItems():
-                self.scene.removeItem(item)
+            self.delete_selected()
         super().keyPressEvent(event)
 
     def find_block_by_name(self, name):
@@ -329,31 +761,42 @@ class DiagramCanvas(QGraphicsView):
         action, *args = self.undo_stack.pop()
         if action == "group":
             group, items = args
-            self.scene.removeItem(group)
-            for item in items:
-                item.setSelected(True)
+            self.record("ungroup", blocks=self.group_block_names(group))
+            self.dissolve_group(group, items)
         elif action == "ungroup":
             group, items = args
             self.scene.addItem(group)
             for item in items:
                 group.addToGroup(item)
+            self.record("group", blocks=self.group_block_names(group))
         elif action == "add_block":
             self.scene.removeItem(args[0])
+            self.record("delete_block", name=args[0].name)
         elif action == "delete_block":
             self.scene.addItem(args[0])
+            self.record("add_block", **self.block_record(args[0]))
         elif action == "add_wire":
+            self.record("delete_wire", **self.wire_record(args[0]))
             self.scene.removeItem(args[0])
         elif action == "delete_wire":
             wire_data = args[0]
             new_wire = Wire(wire_data["start_port"], wire_data["end_port"])
             self.scene.addItem(new_wire)
-        elif action == "clear":
-            blocks, wires = args[0]
-            for block_data in blocks:
-                self.add_block(block_data["type"], block_data["x"], block_data["y"], block_data["name"])
-            for wire_data in wires:
-                self.add_wire(wire_data["start"], wire_data["start_port_index"],
-                              wire_data["end"], wire_data["end_port_index"])
+            wire_data["wire"] = new_wire  # Redo removes the restored wire
+            self.record("add_wire", **self.wire_record(new_wire))
+        elif action in ("clear", "load"):
+            old_scene, new_scene = args
+            self.swap_scene(old_scene)
+            self.reset_journal()
+            self.simulation_edited()
+        elif action == "create_subsystem":
+            subsystem, blocks, old_wires, new_wires = args
+            for wire in new_wires:
+                self.scene.removeItem(wire)
+            self.scene.removeItem(subsystem)
+            for item in blocks + old_wires:
+                self.scene.addItem(item)
+            self.record_subsystem_swap([subsystem], blocks, old_wires)
 
         self.redo_stack.append((action, *args))
 
@@ -368,20 +811,35 @@ class DiagramCanvas(QGraphicsView):
             self.scene.addItem(group)
             for item in items:
                 group.addToGroup(item)
+            self.record("group", blocks=self.group_block_names(group))
         elif action == "ungroup":
             group, items = args
-            self.scene.removeItem(group)
-            for item in items:
-                item.setSelected(True)
+            self.record("ungroup", blocks=self.group_block_names(group))
+            self.dissolve_group(group, items)
         elif action == "add_block":
             self.scene.addItem(args[0])
+            self.record("add_block", **self.block_record(args[0]))
         elif action == "delete_block":
             self.scene.removeItem(args[0])
+            self.record("delete_block", name=args[0].name)
         elif action == "add_wire":
             self.scene.addItem(args[0])
+            self.record("add_wire", **self.wire_record(args[0]))
         elif action == "delete_wire":
+            self.record("delete_wire", **self.wire_record(args[0]["wire"]))
             self.scene.removeItem(args[0]["wire"])
-        elif action == "clear":
-            self.clear()
+        elif action in ("clear", "load"):
+            old_scene, new_scene = args
+            self.swap_scene(new_scene)
+            self.reset_journal()
+            self.simulation_edited()
+        elif action == "create_subsystem":
+            subsystem, blocks, old_wires, new_wires = args
+            for item in blocks + old_wires:
+                self.scene.removeItem(item)
+            self.scene.addItem(subsystem)
+            for wire in new_wires:
+                self.scene.addItem(wire)
+            self.record_subsystem_swap(blocks, [subsystem], new_wires)
 
         self.undo_stack.append((action, *args))
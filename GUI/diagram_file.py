@@ -0,0 +1,299 @@
+import json
+import os
+import sys
+import zlib
+from array import array
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from backend.tracing import traced
+from backend.library import pack_diagram, unpack_diagram
+
+COMPACT_EXTENSION = ".bdz"  # Compact binary diagram files
+COMPACT_MAGIC = b"BDZ1"
+PROGRESS_INTERVAL = 1024  # Report progress every this many blocks or wires
+NO_CONTENTS = 0xFFFFFFFF  # Component index of blocks that are not subsystems
+
+
+def is_compact_file(file_path):
+    """Return True if the file should be read and written in the compact format."""
+    return file_path.lower().endswith(COMPACT_EXTENSION)
+
+
+@traced(category="file")
+def save_diagram(file_path, diagram_data, progress=None):
+    """
+    Save diagram data to a file, choosing the format from the file extension.
+
+    Subsystems are stored once per distinct contents; see library.pack_diagram.
+    """
+    diagram_data = pack_diagram(diagram_data, os.path.dirname(os.path.abspath(file_path)))
+    if is_compact_file(file_path):
+        payload = encode_compact(diagram_data, progress)
+        with open(file_path, "wb") as file:
+            file.write(payload)
+    else:
+        with open(file_path, "w") as file:
+            json.dump(diagram_data, file, indent=4)
+
+
+@traced(category="file")
+def load_diagram(file_path, progress=None):
+    """Load diagram data from a file, choosing the format from the file extension."""
+    if is_compact_file(file_path):
+        with open(file_path, "rb") as file:
+            diagram_data = decode_compact(file.read(), progress)
+    else:
+        with open(file_path, "r") as file:
+            diagram_data = json.load(file)
+    return unpack_diagram(diagram_data, os.path.dirname(os.path.abspath(file_path)))
+
+
+def _to_bytes(values):
+    """Serialize an array in little-endian byte order."""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data, offset, count):
+    """Read count little-endian values of the given typecode starting at offset."""
+    values = array(typecode)
+    end = offset + count * values.itemsize
+    values.frombytes(data[offset:end])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values, end
+
+
+def encode_compact(diagram_data, progress=None):
+    """
+    Encode diagram data as compressed columnar arrays.
+
+    Block types, names and properties are stored once in a string table and
+    referenced by index; positions and wire endpoints are stored as flat
+    numeric columns. diagram_data must already be packed by
+    library.pack_diagram, as save_diagram does; its table of components is
+    stored as JSON strings, and blocks refer to them by the index of their
+    component id in the string table.
+    """
+    blocks = diagram_data["blocks"]
+    wires = diagram_data["wires"]
+    total = len(blocks) + len(wires)
+
+    strings = []
+    string_index = {}
+
+    def intern(text):
+        index = string_index.get(text)
+        if index is None:
+            index = string_index[text] = len(strings)
+            strings.append(text)
+        return index
+
+    # Block columns
+    types = array("I")
+    names = array("I")
+    properties = array("I")
+    contents = array("I")  # Component id, or NO_CONTENTS for blocks that are not subsystems
+    xs = array("d")
+    ys = array("d")
+    block_index = {}
+    for i, block in enumerate(blocks):
+        types.append(intern(block["type"]))
+        names.append(intern(block["name"]))
+        properties.append(intern(json.dumps(block["properties"], sort_keys=True)))
+        if block.get("component") is None:
+            contents.append(NO_CONTENTS)
+        else:
+            contents.append(intern(block["component"]))
+        xs.append(block["x"])
+        ys.append(block["y"])
+        block_index[block["name"]] = i
+        if progress and i % PROGRESS_INTERVAL == 0:
+            progress(i, total)
+
+    # Wire columns
+    starts = array("I")
+    ends = array("I")
+    start_ports = array("H")
+    end_ports = array("H")
+    for i, wire in enumerate(wires):
+        try:
+            starts.append(block_index[wire["start"]])
+            ends.append(block_index[wire["end"]])
+        except KeyError as e:
+            raise ValueError(f"Wire refers to unknown block {e}")
+        start_ports.append(wire["start_port_index"])
+        end_ports.append(wire["end_port_index"])
+        if progress and i % PROGRESS_INTERVAL == 0:
+            progress(len(blocks) + i, total)
+
+    # Groups, stored as member counts and member block indices
+    groups = diagram_data.get("groups", [])
+    group_sizes = array("I", (len(group) for group in groups))
+    group_members = array("I", (block_index[name] for group in groups for name in group))
+
+    # Component table, as id and contents string pairs, and linked library files
+    components = diagram_data.get("components", {})
+    component_ids = array("I", (intern(reference) for reference in components))
+    component_contents = array("I", (intern(json.dumps(inner, sort_keys=True)) for inner in components.values()))
+    libraries = intern(json.dumps(diagram_data.get("libraries", [])))
+
+    # String table
+    encoded = [text.encode("utf-8") for text in strings]
+    lengths = array("I", (len(data) for data in encoded))
+
+    counts = array("I", [len(strings), len(blocks), len(wires)])
+    body = b"".join([
+        _to_bytes(counts),
+        _to_bytes(lengths),
+        b"".join(encoded),
+        _to_bytes(types),
+        _to_bytes(names),
+        _to_bytes(properties),
+        _to_bytes(xs),
+        _to_bytes(ys),
+        _to_bytes(starts),
+        _to_bytes(ends),
+        _to_bytes(start_ports),
+        _to_bytes(end_ports),
+        _to_bytes(array("I", [len(groups)])),
+        _to_bytes(group_sizes),
+        _to_bytes(group_members),
+        _to_bytes(contents),
+        _to_bytes(array("I", [len(components)])),
+        _to_bytes(component_ids),
+        _to_bytes(component_contents),
+        _to_bytes(array("I", [libraries])),
+    ])
+    if progress:
+        progress(total, total)
+    return COMPACT_MAGIC + zlib.compress(body, 1)
+
+
+def decode_compact(payload, progress=None):
+    """
+    Decode data written by encode_compact back into the blocks/wires dict format.
+
+    Subsystems are returned packed, as for a JSON file; library.unpack_diagram
+    gives them their contents back.
+    """
+    if payload[:len(COMPACT_MAGIC)] != COMPACT_MAGIC:
+        raise ValueError("Not a compact diagram file.")
+    body = zlib.decompress(payload[len(COMPACT_MAGIC):])
+
+    counts, offset = _from_bytes("I", body, 0, 3)
+    num_strings, num_blocks, num_wires = counts
+    total = num_blocks + num_wires
+
+    # String table
+    lengths, offset = _from_bytes("I", body, offset, num_strings)
+    strings = []
+    for length in lengths:
+        strings.append(body[offset:offset + length].decode("utf-8"))
+        offset += length
+
+    # Block columns
+    types, offset = _from_bytes("I", body, offset, num_blocks)
+    names, offset = _from_bytes("I", body, offset, num_blocks)
+    properties, offset = _from_bytes("I", body, offset, num_blocks)
+    xs, offset = _from_bytes("d", body, offset, num_blocks)
+    ys, offset = _from_bytes("d", body, offset, num_blocks)
+
+    # Wire columns
+    starts, offset = _from_bytes("I", body, offset, num_wires)
+    ends, offset = _from_bytes("I", body, offset, num_wires)
+    start_ports, offset = _from_bytes("H", body, offset, num_wires)
+    end_ports, offset = _from_bytes("H", body, offset, num_wires)
+
+    # Each distinct properties string is parsed once and copied per block
+    parsed_properties = {}
+    blocks = []
+    for i in range(num_blocks):
+        index = properties[i]
+        if index not in parsed_properties:
+            parsed_properties[index] = json.loads(strings[index])
+        block_properties = {
+            key: list(value) if isinstance(value, list) else value
+            for key, value in parsed_properties[index].items()
+        }
+        blocks.append({
+            "type": strings[types[i]],
+            "name": strings[names[i]],
+            "properties": block_properties,
+            "x": xs[i],
+            "y": ys[i],
+        })
+        if progress and i % PROGRESS_INTERVAL == 0:
+            progress(i, total)
+
+    wires = []
+    for i in range(num_wires):
+        wires.append({
+            "start": blocks[starts[i]]["name"],
+            "end": blocks[ends[i]]["name"],
+            "start_port_index": start_ports[i],
+            "end_port_index": end_ports[i],
+        })
+        if progress and i % PROGRESS_INTERVAL == 0:
+            progress(num_blocks + i, total)
+
+    # Groups
+    (num_groups,), offset = _from_bytes("I", body, offset, 1)
+    group_sizes, offset = _from_bytes("I", body, offset, num_groups)
+    group_members, offset = _from_bytes("I", body, offset, sum(group_sizes))
+    groups = []
+    start = 0
+    for size in group_sizes:
+        groups.append([blocks[i]["name"] for i in group_members[start:start + size]])
+        start += size
+
+    # Subsystem components and linked library files
+    contents, offset = _from_bytes("I", body, offset, num_blocks)
+    (num_components,), offset = _from_bytes("I", body, offset, 1)
+    component_ids, offset = _from_bytes("I", body, offset, num_components)
+    component_contents, offset = _from_bytes("I", body, offset, num_components)
+    (libraries,), offset = _from_bytes("I", body, offset, 1)
+    for block, index in zip(blocks, contents):
+        if index != NO_CONTENTS:
+            block["component"] = strings[index]
+
+    diagram_data = {"blocks": blocks, "wires": wires, "groups": groups}
+    if num_components:
+        diagram_data["components"] = {
+            strings[reference]: json.loads(strings[inner])
+            for reference, inner in zip(component_ids, component_contents)
+        }
+    libraries = json.loads(strings[libraries])
+    if libraries:
+        diagram_data["libraries"] = libraries
+
+    if progress:
+        progress(total, total)
+    return diagram_data
+
+
+class DiagramFileWorker(QThread):
+    """Runs a diagram load or save on a background thread."""
+    progress = pyqtSignal(int, int)  # done, total
+    succeeded = pyqtSignal(object)  # Loaded diagram data, or None after a save
+    failed = pyqtSignal(str)
+
+    def __init__(self, file_path, diagram_data=None, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.diagram_data = diagram_data  # None means load
+
+    def run(self):
+        """Load or save the diagram, reporting progress through signals."""
+        try:
+            if self.diagram_data is None:
+                result = load_diagram(self.file_path, self.progress.emit)
+            else:
+                save_diagram(self.file_path, self.diagram_data, self.progress.emit)
+                result = None
+            self.succeeded.emit(result)
+        except Exception as e:
+            self.failed.emit(str(e))
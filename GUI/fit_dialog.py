@@ -0,0 +1,105 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QComboBox, QLineEdit, QPushButton, QSpinBox,
+    QTableWidget, QTableWidgetItem, QDialogButtonBox, QFileDialog, QHeaderView
+)
+from PyQt5.QtCore import Qt
+
+from backend.fitting import FIT_METHODS, fittable_parameters, parameter_label, get_parameter
+from GUI.properties import parse_number
+
+RECORDING_FILE_FILTER = "Recordings (*.npy *.npz *.csv);;All Files (*)"
+
+
+class FitDialog(QDialog):
+    """Choose the parameters, SCOPE and measured recording for a parameter fit."""
+
+    def __init__(self, blocks, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Fit Parameters")
+        self.resize(520, 480)
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        # One row per parameter: tick to fit it, with optional bounds
+        properties = {block["name"]: block["properties"] for block in blocks}
+        self.parameters = fittable_parameters(blocks)
+        self.table = QTableWidget(len(self.parameters), 4)
+        self.table.setHorizontalHeaderLabels(["Parameter", "Value", "Lower", "Upper"])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        for row, parameter in enumerate(self.parameters):
+            label = QTableWidgetItem(parameter_label(parameter))
+            label.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+            label.setCheckState(Qt.Unchecked)
+            self.table.setItem(row, 0, label)
+            value = QTableWidgetItem(f"{get_parameter(properties[parameter[0]], parameter):g}")
+            value.setFlags(Qt.ItemIsEnabled)
+            self.table.setItem(row, 1, value)
+            self.table.setItem(row, 2, QTableWidgetItem(""))
+            self.table.setItem(row, 3, QTableWidgetItem(""))
+        layout.addWidget(self.table)
+
+        form = QFormLayout()
+        self.scope_selector = QComboBox()
+        self.scope_selector.addItems([block["name"] for block in blocks if block["type"] == "SCOPE"])
+        form.addRow("Compare SCOPE:", self.scope_selector)
+
+        self.file_input = QLineEdit()
+        browse_button = QPushButton("Browse...")
+        browse_button.clicked.connect(self.browse)
+        file_row = QHBoxLayout()
+        file_row.addWidget(self.file_input)
+        file_row.addWidget(browse_button)
+        form.addRow("Measured data:", file_row)
+
+        self.method_selector = QComboBox()
+        self.method_selector.addItems(FIT_METHODS)
+        form.addRow("Method:", self.method_selector)
+
+        self.workers_input = QSpinBox()
+        self.workers_input.setRange(0, 256)
+        self.workers_input.setSpecialValueText("one per CPU")
+        form.addRow("Worker processes:", self.workers_input)
+        layout.addLayout(form)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def browse(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, "Measured Data", "", RECORDING_FILE_FILTER)
+        if file_name:
+            self.file_input.setText(file_name)
+
+    def bound(self, row, column):
+        """Bound entered in a cell, or None if it is empty; raises ValueError if invalid."""
+        text = self.table.item(row, column).text().strip()
+        return float(parse_number(text)) if text else None
+
+    def options(self):
+        """Return the chosen fit_parameters arguments, raising ValueError if any are missing or invalid."""
+        parameters = []
+        bounds = []
+        for row, parameter in enumerate(self.parameters):
+            if self.table.item(row, 0).checkState() != Qt.Checked:
+                continue
+            try:
+                lower, upper = self.bound(row, 2), self.bound(row, 3)
+            except ValueError:
+                raise ValueError(f"Invalid bounds for {parameter_label(parameter)}.")
+            parameters.append(parameter)
+            bounds.append((lower, upper))
+        if not parameters:
+            raise ValueError("Tick at least one parameter to fit.")
+        if not self.scope_selector.currentText():
+            raise ValueError("The diagram has no SCOPE to compare with the measured data.")
+        if not self.file_input.text().strip():
+            raise ValueError("Choose a file of measured data.")
+        return {
+            "parameters": parameters,
+            "bounds": bounds,
+            "scope": self.scope_selector.currentText(),
+            "measured": self.file_input.text().strip(),
+            "method": self.method_selector.currentText(),
+            "workers": self.workers_input.value() or None,
+        }
@@ -0,0 +1,207 @@
+import numpy as np
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QLabel, QPushButton, QTabWidget
+)
+from PyQt5.QtGui import QPainter, QPen, QColor, QPolygonF
+from PyQt5.QtCore import Qt, QPointF, QRectF, pyqtSignal
+
+from backend.frequency import SOURCE_TYPES
+from backend.subsystem import SINK_TYPES
+from GUI.results_viewer import TRACE_COLORS
+
+
+class XYPlot(QWidget):
+    """Plot of curves and markers on linear or logarithmic x axes, fitted to the data."""
+
+    MARGIN = 60
+
+    def __init__(self, x_label="", y_label="", log_x=False, equal_aspect=False):
+        super().__init__()
+        self.setMinimumHeight(120)
+        self.x_label = x_label
+        self.y_label = y_label
+        self.log_x = log_x
+        self.equal_aspect = equal_aspect  # Same scale on both axes, for the complex plane
+        self.curves = []  # (x, y, color)
+        self.markers = []  # (x, y, color, symbol) with symbol "x" or "o"
+        self.reference = None  # Point drawn as a "+", e.g. -1 on a Nyquist plot
+
+    def set_data(self, curves=(), markers=(), reference=None):
+        self.curves = [(np.asarray(x, dtype=float), np.asarray(y, dtype=float), color) for x, y, color in curves]
+        self.markers = [(np.asarray(x, dtype=float), np.asarray(y, dtype=float), color, symbol)
+                        for x, y, color, symbol in markers]
+        self.reference = reference
+        self.update()
+
+    def data_range(self):
+        """Finite x and y limits of everything drawn, padded by 5%."""
+        xs = [x for x, _, _ in self.curves] + [x for x, _, _, _ in self.markers]
+        ys = [y for _, y, _ in self.curves] + [y for _, y, _, _ in self.markers]
+        if self.reference is not None:
+            xs.append(np.array([self.reference[0]]))
+            ys.append(np.array([self.reference[1]]))
+        x = np.concatenate(xs) if xs else np.empty(0)
+        y = np.concatenate(ys) if ys else np.empty(0)
+        if self.log_x:
+            x = np.log10(x[x > 0])
+        x, y = x[np.isfinite(x)], y[np.isfinite(y)]
+        if not len(x) or not len(y):
+            return None
+        limits = []
+        for values in (x, y):
+            low, high = float(values.min()), float(values.max())
+            if high - low < 1e-12:
+                low, high = low - 1, high + 1
+            pad = (high - low) * 0.05
+            limits.append((low - pad, high + pad))
+        return limits
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        area = QRectF(self.rect()).adjusted(self.MARGIN, 10, -10, -32)
+        painter.setPen(QPen(Qt.gray))
+        painter.drawRect(area)
+        limits = self.data_range()
+        if limits is None or area.width() < 2 or area.height() < 2:
+            return
+        (x0, x1), (y0, y1) = limits
+        x_scale = area.width() / (x1 - x0)
+        y_scale = area.height() / (y1 - y0)
+        if self.equal_aspect:
+            scale = min(x_scale, y_scale)
+            # Widen whichever axis has room to spare, keeping it centred
+            x_mid, y_mid = (x0 + x1) / 2, (y0 + y1) / 2
+            x0, x1 = x_mid - area.width() / scale / 2, x_mid + area.width() / scale / 2
+            y0, y1 = y_mid - area.height() / scale / 2, y_mid + area.height() / scale / 2
+            x_scale = y_scale = scale
+
+        def to_widget(x, y):
+            if self.log_x:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    x = np.log10(x)
+            return area.left() + (x - x0) * x_scale, area.bottom() - (y - y0) * y_scale
+
+        painter.setClipRect(area)
+        painter.setRenderHint(QPainter.Antialiasing)
+        if self.equal_aspect:
+            # Axes through the origin
+            painter.setPen(QPen(QColor(220, 220, 220)))
+            ox, oy = to_widget(0.0, 0.0)
+            painter.drawLine(QPointF(area.left(), oy), QPointF(area.right(), oy))
+            painter.drawLine(QPointF(ox, area.top()), QPointF(ox, area.bottom()))
+        for x, y, color in self.curves:
+            px, py = to_widget(x, y)
+            keep = np.isfinite(px) & np.isfinite(py)
+            painter.setPen(QPen(QColor(color), 1.5))
+            painter.drawPolyline(QPolygonF([QPointF(a, b) for a, b in zip(px[keep].tolist(), py[keep].tolist())]))
+        for x, y, color, symbol in self.markers:
+            painter.setPen(QPen(QColor(color), 2))
+            px, py = to_widget(x, y)
+            for a, b in zip(px.tolist(), py.tolist()):
+                if symbol == "x":
+                    painter.drawLine(QPointF(a - 5, b - 5), QPointF(a + 5, b + 5))
+                    painter.drawLine(QPointF(a - 5, b + 5), QPointF(a + 5, b - 5))
+                else:
+                    painter.drawEllipse(QPointF(a, b), 5, 5)
+        if self.reference is not None:
+            painter.setPen(QPen(Qt.red, 2))
+            a, b = to_widget(*self.reference)
+            painter.drawLine(QPointF(a - 6, b), QPointF(a + 6, b))
+            painter.drawLine(QPointF(a, b - 6), QPointF(a, b + 6))
+        painter.setClipping(False)
+
+        # Axis limits and labels
+        def x_text(value):
+            return f"{10 ** value:.3g}" if self.log_x else f"{value:.3g}"
+
+        painter.setPen(QPen(Qt.black))
+        painter.drawText(QRectF(area.left(), area.bottom() + 2, 100, 16), Qt.AlignLeft, x_text(x0))
+        painter.drawText(QRectF(area.right() - 100, area.bottom() + 2, 100, 16), Qt.AlignRight, x_text(x1))
+        painter.drawText(QRectF(area.left(), area.bottom() + 14, area.width(), 16), Qt.AlignHCenter, self.x_label)
+        painter.drawText(QRectF(0, area.top(), self.MARGIN - 4, 16), Qt.AlignRight, f"{y1:.3g}")
+        painter.drawText(QRectF(0, area.bottom() - 16, self.MARGIN - 4, 16), Qt.AlignRight, f"{y0:.3g}")
+        painter.drawText(QRectF(0, area.center().y() - 8, self.MARGIN - 4, 16), Qt.AlignRight, self.y_label)
+
+
+class FrequencyViewer(QWidget):
+    """Panel showing Bode, Nyquist and pole-zero plots between two chosen blocks."""
+    analyze_requested = pyqtSignal(str, str)  # Input block name, output block name
+
+    def __init__(self):
+        super().__init__()
+        self.layout = QVBoxLayout()
+        self.setLayout(self.layout)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Input:"))
+        self.input_selector = QComboBox()
+        controls.addWidget(self.input_selector)
+        controls.addWidget(QLabel("Output:"))
+        self.output_selector = QComboBox()
+        controls.addWidget(self.output_selector)
+        analyze_button = QPushButton("Analyze")
+        analyze_button.clicked.connect(
+            lambda: self.analyze_requested.emit(self.input_selector.currentText(), self.output_selector.currentText())
+        )
+        controls.addWidget(analyze_button)
+        controls.addStretch()
+        self.layout.addLayout(controls)
+
+        self.tabs = QTabWidget()
+        bode = QWidget()
+        bode_layout = QVBoxLayout()
+        bode.setLayout(bode_layout)
+        self.magnitude_plot = XYPlot("rad/s", "dB", log_x=True)
+        self.phase_plot = XYPlot("rad/s", "deg", log_x=True)
+        bode_layout.addWidget(self.magnitude_plot)
+        bode_layout.addWidget(self.phase_plot)
+        self.tabs.addTab(bode, "Bode")
+        self.nyquist_plot = XYPlot("Re", "Im", equal_aspect=True)
+        self.tabs.addTab(self.nyquist_plot, "Nyquist")
+        self.pole_zero_plot = XYPlot("Re", "Im", equal_aspect=True)
+        self.tabs.addTab(self.pole_zero_plot, "Pole-Zero")
+        self.layout.addWidget(self.tabs)
+
+        self.summary = QLabel()
+        self.summary.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.layout.addWidget(self.summary)
+
+    def set_blocks(self, blocks):
+        """Offer the blocks of a diagram as inputs and outputs, keeping the current choices."""
+        for selector, names, preferred in (
+            (self.input_selector, [b["name"] for b in blocks if b["type"] not in SINK_TYPES], SOURCE_TYPES),
+            (self.output_selector, [b["name"] for b in blocks], ("SCOPE",)),
+        ):
+            current = selector.currentText()
+            selector.clear()
+            selector.addItems(sorted(names))
+            if current not in names:
+                # Default to a source as the input and a SCOPE as the output
+                current = min((b["name"] for b in blocks if b["type"] in preferred), default=None)
+            if current is not None:
+                selector.setCurrentText(current)
+
+    def set_analysis(self, analysis):
+        """Plot the dict returned by analyze_frequency_response."""
+        omega = analysis["omega"]
+        response = analysis["response"]
+        self.magnitude_plot.set_data([(omega, analysis["magnitude_db"], TRACE_COLORS[0])])
+        self.phase_plot.set_data([(omega, analysis["phase_deg"], TRACE_COLORS[0])])
+        # Negative frequencies mirror the positive ones in the Nyquist plot
+        self.nyquist_plot.set_data(
+            [(response.real, response.imag, TRACE_COLORS[0]), (response.real, -response.imag, "#aaaaaa")],
+            reference=(-1.0, 0.0),
+        )
+        poles, zeros = analysis["poles"], analysis["zeros"]
+        self.pole_zero_plot.set_data(markers=[
+            (poles.real, poles.imag, TRACE_COLORS[3], "x"),
+            (zeros.real, zeros.imag, TRACE_COLORS[0], "o"),
+        ], reference=(0.0, 0.0))
+
+        stable = bool(len(poles) == 0 or np.all(poles.real < 0))
+        self.summary.setText(
+            f"Poles: {', '.join(f'{p:.4g}' for p in poles) or 'none'}\n"
+            f"Zeros: {', '.join(f'{z:.4g}' for z in zeros) or 'none'}\n"
+            f"Gain {analysis['gain']:.4g}, {'stable' if stable else 'unstable'}"
+        )
@@ -0,0 +1,128 @@
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QLabel, QSpinBox,
+    QHeaderView, QAbstractItemView
+)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+
+from backend.job_queue import format_bytes
+
+COLUMNS = ["#", "Job", "T", "Priority", "Memory", "Status", "Time"]
+
+
+class JobPanel(QWidget):
+    """
+    Table of the simulations in a JobQueue, with controls to reorder and cancel them.
+
+    Polls the queue on a timer, which is also what starts waiting jobs.
+    """
+    job_finished = pyqtSignal(object)  # SimulationJob that is done or failed
+    show_requested = pyqtSignal(object)  # SimulationJob whose results should be shown
+
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+        self.layout = QVBoxLayout()
+        self.setLayout(self.layout)
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.verticalHeader().hide()
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.cellDoubleClicked.connect(lambda row, column: self.show_selected())
+        self.layout.addWidget(self.table)
+
+        controls = QHBoxLayout()
+        for label, handler in (
+            ("Raise", lambda: self.change_priority(1)),
+            ("Lower", lambda: self.change_priority(-1)),
+            ("Cancel", self.cancel_selected),
+            ("Show Results", self.show_selected),
+            ("Clear Finished", self.clear_finished),
+        ):
+            button = QPushButton(label)
+            button.clicked.connect(handler)
+            controls.addWidget(button)
+        controls.addStretch()
+        controls.addWidget(QLabel("Run at once:"))
+        self.concurrency_input = QSpinBox()
+        self.concurrency_input.setRange(1, 64)
+        self.concurrency_input.setValue(queue.concurrency)
+        self.concurrency_input.valueChanged.connect(self.set_concurrency)
+        controls.addWidget(self.concurrency_input)
+        self.layout.addLayout(controls)
+
+        self.summary = QLabel()
+        self.layout.addWidget(self.summary)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(250)
+        self.poll_timer.timeout.connect(self.poll)
+        self.poll_timer.start()
+        self.refresh()
+
+    def poll(self):
+        """Let the queue collect and start jobs, then update the table."""
+        for job in self.queue.poll():
+            if job.state in ("done", "failed"):
+                self.job_finished.emit(job)
+        if self.queue.jobs:
+            self.refresh()
+
+    def refresh(self):
+        # Running jobs first, then waiting ones in start order, then finished ones
+        jobs = self.queue.running() + self.queue.waiting()
+        jobs += [job for job in self.queue.jobs if job not in jobs]
+        selected = self.selected_job()
+        self.table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            status = job.state if job.error is None else f"{job.state}: {job.error}"
+            cells = [
+                str(job.id), job.name, f"{job.T:g}", str(job.priority), format_bytes(job.memory), status,
+                f"{job.elapsed:.1f} s" if job.started else "",
+            ]
+            for column, text in enumerate(cells):
+                item = self.table.item(row, column)
+                if item is None:
+                    item = QTableWidgetItem()
+                    self.table.setItem(row, column, item)
+                item.setText(text)
+                item.setData(Qt.UserRole, job.id)
+            if job is selected:
+                self.table.selectRow(row)
+
+        budget = self.queue.memory_budget
+        self.summary.setText(
+            f"{len(self.queue.running())} running, {len(self.queue.waiting())} waiting; "
+            f"estimated memory {format_bytes(self.queue.memory_in_use())}"
+            + (f" of {format_bytes(budget)}" if budget != float("inf") else "")
+        )
+
+    def selected_job(self):
+        items = self.table.selectedItems()
+        return self.queue.get(items[0].data(Qt.UserRole)) if items else None
+
+    def change_priority(self, delta):
+        job = self.selected_job()
+        if job is not None:
+            self.queue.set_priority(job.id, job.priority + delta)
+            self.refresh()
+
+    def cancel_selected(self):
+        job = self.selected_job()
+        if job is not None:
+            self.queue.cancel(job.id)
+            self.refresh()
+
+    def show_selected(self):
+        job = self.selected_job()
+        if job is not None and job.state == "done":
+            self.show_requested.emit(job)
+
+    def clear_finished(self):
+        self.queue.remove_finished()
+        self.refresh()
+
+    def set_concurrency(self, value):
+        self.queue.concurrency = value
@@ -0,0 +1,290 @@
+import glob
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from PyQt5.QtCore import QLockFile
+
+from GUI import diagram_file
+
+AUTOSAVE_DIR = os.path.join(os.path.expanduser("~"), ".bdsimgui", "autosave")
+FILE_PATTERN = re.compile(r"^(journal|snapshot)-(\d+)\.(jsonl|bdz)$")
+SESSION_PREFIX = "session-"  # One directory per running editor under the autosave directory
+LOCK_FILE = "owner.lock"
+
+
+def _lock_session(directory):
+    """Lock a session directory for this process; returns the lock, or None if a live editor owns it."""
+    lock = QLockFile(os.path.join(directory, LOCK_FILE))
+    lock.setStaleLockTime(0)  # Only a dead owner makes the lock stale, however old it is
+    return lock if lock.tryLock(0) else None
+
+
+class DiagramJournal:
+    """
+    Append-only log of canvas edits, periodically compacted into a snapshot.
+
+    Files are numbered by generation: journal-<n>.jsonl holds the edits made
+    after snapshot-<n>.bdz. A new generation starts at every compaction, and
+    older files are only deleted once the new snapshot is fully written, so a
+    crash at any point leaves a snapshot plus journals that replay on top of it.
+    Snapshots are written on background threads.
+
+    Every running editor journals into its own session directory under
+    directory, locked for as long as it runs. A session whose editor died
+    without closing it is adopted by the next journal, which then offers
+    to recover it.
+    """
+
+    def __init__(self, directory=AUTOSAVE_DIR, compact_every=1000, compact_interval=60.0):
+        self.compact_every = compact_every  # Entries before a compaction is due
+        self.compact_interval = compact_interval  # Seconds before pending entries are compacted
+        os.makedirs(directory, exist_ok=True)
+        self.directory, self.lock = self.claim_session(directory)
+
+        existing = self.list_files()
+        self.generation = max((gen for gen, _, _ in existing), default=-1) + 1
+        self.file = None
+        self.entry_count = 0
+        self.last_snapshot_time = time.monotonic()
+        self.workers = []  # DiagramFileWorkers writing snapshots
+
+    def claim_session(self, root):
+        """
+        Lock a session directory under root: one left behind with edits by an
+        editor that is no longer running, or else a new one. Abandoned
+        sessions without edits are removed on the way.
+        """
+        for path in sorted(glob.glob(os.path.join(root, SESSION_PREFIX + "*"))):
+            lock = _lock_session(path) if os.path.isdir(path) else None
+            if lock is None:
+                continue  # Another editor's live session
+            self.directory = path
+            if self.has_recovery():
+                return path, lock
+            lock.unlock()
+            shutil.rmtree(path, ignore_errors=True)
+        path = tempfile.mkdtemp(prefix=SESSION_PREFIX, dir=root)
+        return path, _lock_session(path)
+
+    def path(self, kind, generation):
+        """Return the path of a journal or snapshot file for a generation."""
+        extension = "jsonl" if kind == "journal" else "bdz"
+        return os.path.join(self.directory, f"{kind}-{generation}.{extension}")
+
+    def list_files(self):
+        """List (generation, kind, path) for the journal and snapshot files on disk."""
+        files = []
+        for path in glob.glob(os.path.join(self.directory, "*")):
+            match = FILE_PATTERN.match(os.path.basename(path))
+            if match:
+                files.append((int(match.group(2)), match.group(1), path))
+        return sorted(files)
+
+    def append(self, op, **data):
+        """Append one edit to the journal."""
+        if self.file is None:
+            self.file = open(self.path("journal", self.generation), "a")
+        data["op"] = op
+        self.file.write(json.dumps(data) + "\n")
+        self.file.flush()
+        self.entry_count += 1
+
+    def needs_compaction(self):
+        """Return True if enough edits have accumulated to be worth a new snapshot."""
+        if not self.entry_count:
+            return False
+        return (self.entry_count >= self.compact_every or
+                time.monotonic() - self.last_snapshot_time >= self.compact_interval)
+
+    def compacting(self):
+        """Return True while a snapshot is being written."""
+        return bool(self.workers)
+
+    def compact(self, diagram_data, reset=False):
+        """
+        Start a new generation and write diagram_data as its snapshot on a
+        background thread.
+
+        With reset, the diagram does not follow from the previous generation's
+        edits, e.g. after a clear or load. The new journal then starts with a
+        reset entry, so a crash before the snapshot is written recovers the
+        diagram from before the reset rather than a mix of the two.
+        """
+        generation, temp_path = self.begin_compaction()
+        if reset:
+            self.append("reset")
+            self.entry_count = 0
+
+        worker = diagram_file.DiagramFileWorker(temp_path, diagram_data)
+        worker.succeeded.connect(lambda _: self.finish_compaction(generation))
+        worker.failed.connect(lambda error: print(f"Autosave snapshot failed: {error}"))
+        worker.finished.connect(lambda: self.workers.remove(worker))
+        worker.finished.connect(worker.deleteLater)
+        self.workers.append(worker)
+        worker.start()
+
+    def wait(self):
+        """Block until the snapshots being written are finished."""
+        for worker in list(self.workers):
+            worker.wait()
+
+    def begin_compaction(self):
+        """Start a new generation and return it with the path its snapshot should be written to."""
+        if self.file:
+            self.file.close()
+            self.file = None
+        self.generation += 1
+        self.entry_count = 0
+        self.last_snapshot_time = time.monotonic()
+        return self.generation, self.temp_snapshot_path(self.generation)
+
+    def temp_snapshot_path(self, generation):
+        """Return the path a snapshot is written to before it is complete."""
+        return os.path.join(self.directory, f"snapshot-{generation}.tmp{diagram_file.COMPACT_EXTENSION}")
+
+    def finish_compaction(self, generation):
+        """Publish a written snapshot and delete the files it supersedes."""
+        if not os.path.exists(self.temp_snapshot_path(generation)):
+            return  # Discarded while it was being written
+        os.replace(self.temp_snapshot_path(generation), self.path("snapshot", generation))
+        for gen, _, path in self.list_files():
+            if gen < generation:
+                os.remove(path)
+
+    def reset(self, diagram_data):
+        """Compact to the given diagram right away, e.g. after a clear or load."""
+        self.compact(diagram_data, reset=True)
+
+    def has_recovery(self):
+        """Return True if a previous session left recoverable edits behind."""
+        for _, kind, path in self.list_files():
+            if kind == "snapshot" or os.path.getsize(path) > 0:
+                return True
+        return False
+
+    def recover(self):
+        """Rebuild the last journaled diagram from the newest snapshot and the journals after it."""
+        files = self.list_files()
+        snapshots = [(gen, path) for gen, kind, path in files if kind == "snapshot"]
+
+        base_generation = 0
+        diagram_data = {"blocks": [], "wires": [], "groups": []}
+        if snapshots:
+            base_generation, snapshot_path = snapshots[-1]
+            diagram_data = diagram_file.load_diagram(snapshot_path)
+
+        entries = []
+        for gen, kind, path in files:
+            if kind == "journal" and gen >= base_generation:
+                generation_entries = []
+                with open(path, "r") as file:
+                    for line in file:
+                        try:
+                            generation_entries.append(json.loads(line))
+                        except ValueError:
+                            break  # Torn write at the end of a journal
+                if gen > base_generation and generation_entries[:1] == [{"op": "reset"}]:
+                    break  # The diagram was replaced but its snapshot never finished
+                entries.extend(generation_entries)
+        return replay(diagram_data, entries)
+
+    def close(self):
+        """End the session on a clean shutdown: delete its files and release its directory."""
+        self.wait()
+        self.discard()
+        self.lock.unlock()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def discard(self):
+        """Close the journal and delete all autosave files."""
+        if self.file:
+            self.file.close()
+            self.file = None
+        for _, _, path in self.list_files():
+            os.remove(path)
+        for path in glob.glob(self.temp_snapshot_path("*")):
+            os.remove(path)  # Snapshots left half-written by a crash
+        self.entry_count = 0
+
+
+WIRE_KEYS = ("start", "end", "start_port_index", "end_port_index")
+
+
+def replay(diagram_data, entries):
+    """
+    Apply journal entries to diagram data in the blocks/wires dict format.
+
+    Entries made inside an open subsystem carry the names of the subsystems
+    leading to it as "path". Each run of entries for one subsystem is replayed
+    on its contents in one go. Blocks are copied rather than edited, as
+    contents may be shared between blocks, so diagram_data is left unchanged.
+    """
+    # Index by name and by endpoints so each entry costs O(1) (moves and
+    # deletions aside, which cost O(size of the edit))
+    blocks = {block["name"]: block for block in diagram_data["blocks"]}
+    wires = {tuple(wire[key] for key in WIRE_KEYS): wire for wire in diagram_data["wires"]}
+    groups = [list(group) for group in diagram_data.get("groups", [])]
+    wires_by_block = {}
+    for key in wires:
+        wires_by_block.setdefault(key[0], set()).add(key)
+        wires_by_block.setdefault(key[1], set()).add(key)
+
+    for path, run in itertools.groupby(entries, key=lambda entry: tuple(entry.get("path", ()))):
+        if path:
+            subsystem = blocks.get(path[0])
+            if subsystem is not None and subsystem.get("contents") is not None:
+                inner = [{**entry, "path": list(path[1:])} for entry in run]
+                blocks[path[0]] = {**subsystem, "contents": replay(subsystem["contents"], inner)}
+            continue
+
+        for entry in run:
+            op = entry["op"]
+            if op == "add_block":
+                blocks[entry["name"]] = {key: value for key, value in entry.items() if key not in ("op", "path")}
+            elif op == "delete_block":
+                blocks.pop(entry["name"], None)
+                for key in wires_by_block.pop(entry["name"], ()):
+                    wires.pop(key, None)
+            elif op in ("add_wire", "delete_wire"):
+                wire_key = tuple(entry[key] for key in WIRE_KEYS)
+                if op == "add_wire":
+                    wires[wire_key] = dict(zip(WIRE_KEYS, wire_key))
+                    wires_by_block.setdefault(wire_key[0], set()).add(wire_key)
+                    wires_by_block.setdefault(wire_key[1], set()).add(wire_key)
+                else:
+                    wires.pop(wire_key, None)
+            elif op == "set_property":
+                for name in entry["names"]:
+                    if name in blocks:
+                        block = blocks[name]
+                        blocks[name] = {**block, "properties": {**block["properties"], entry["property"]: entry["value"]}}
+            elif op == "move":
+                for name, x, y in entry["blocks"]:
+                    if name in blocks:
+                        blocks[name] = {**blocks[name], "x": x, "y": y}
+            elif op == "set_contents":
+                if entry["name"] in blocks:
+                    blocks[entry["name"]] = {**blocks[entry["name"]], "contents": entry["contents"]}
+            elif op == "group":
+                groups.append(list(entry["blocks"]))
+            elif op == "ungroup":
+                members = set(entry["blocks"])
+                groups = [group for group in groups if set(group) != members]
+            elif op == "reset":
+                pass  # Marks a generation that starts from its own snapshot
+            else:
+                print(f"Unknown journal entry: {op}")
+
+    replayed = {
+        "blocks": list(blocks.values()),
+        "wires": list(wires.values()),
+        "groups": [[name for name in group if name in blocks] for group in groups],
+    }
+    if diagram_data.get("libraries"):
+        replayed["libraries"] = diagram_data["libraries"]
+    return replayed
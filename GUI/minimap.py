@@ -0,0 +1,176 @@
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QPainter, QPixmap, QPen, QColor, QTransform
+from PyQt5.QtCore import Qt, QTimer, QRectF, QPointF
+
+from GUI.blocks import Block
+from GUI.wires import Wire
+
+
+class Minimap(QWidget):
+    """
+    Overview of the whole scene of a DiagramCanvas with the visible area outlined.
+
+    The scene is drawn once into a low-resolution pixmap, each block as a
+    filled rect and each wire as a line, rather than painted in full by
+    QGraphicsScene.render. After that only the tiles of the pixmap the scene
+    reports as changed are redrawn, batched by a short timer, so moving or
+    adding blocks never repaints the whole diagram. While items are being
+    dragged, redrawing waits until they are dropped. Clicking or dragging
+    centres the canvas on that point.
+    """
+    BACKGROUND = QColor(40, 40, 40)
+    WIRE_COLOR = QColor(200, 200, 200)
+    TILE_SIZE = 16  # Minimap pixels per side of the tiles that are marked dirty
+
+    def __init__(self, canvas):
+        super().__init__()
+        self.canvas = canvas
+        self.setMinimumSize(150, 100)
+
+        self.scene = None
+        self.cache = None  # Pixmap of the scene at minimap scale
+        self.source_rect = QRectF()  # Scene area covered by the cache
+        self.transform = QTransform()  # Scene to minimap coordinates
+        self.dirty = set()  # (column, row) of the tiles waiting to be redrawn
+        self.full_render = True
+
+        self.render_timer = QTimer(self)
+        self.render_timer.setSingleShot(True)
+        self.render_timer.setInterval(100)
+        self.render_timer.timeout.connect(self.render_dirty)
+
+        # Keep the viewport outline in step with scrolling and zooming
+        canvas.horizontalScrollBar().valueChanged.connect(self.update)
+        canvas.verticalScrollBar().valueChanged.connect(self.update)
+        canvas.scene_swapped.connect(self.set_scene)
+        self.set_scene(canvas.scene)
+
+    def set_scene(self, scene):
+        """Follow a new scene, such as after loading a diagram or opening a subsystem."""
+        if self.scene is not None:
+            self.scene.changed.disconnect(self.scene_changed)
+            self.scene.sceneRectChanged.disconnect(self.invalidate)
+        self.scene = scene
+        scene.changed.connect(self.scene_changed)
+        scene.sceneRectChanged.connect(self.invalidate)
+        self.invalidate()
+
+    def invalidate(self, *args):
+        """Re-render the whole cache, e.g. when the scene grows or the minimap is resized."""
+        self.full_render = True
+        self.dirty = set()
+        self.render_timer.start()
+
+    def scene_changed(self, regions):
+        """Mark the tiles the changed scene regions cover for redrawing."""
+        if self.full_render:
+            return
+        if not self.isVisible():
+            self.full_render = True  # Re-rendered in full when shown
+            return
+        tile = self.TILE_SIZE
+        for region in regions:
+            # Pad by a pixel so antialiased edges of moved items are cleared too
+            target = self.transform.mapRect(region).adjusted(-1, -1, 1, 1)
+            columns = range(max(int(target.left()) // tile, 0), int(target.right()) // tile + 1)
+            rows = range(max(int(target.top()) // tile, 0), int(target.bottom()) // tile + 1)
+            self.dirty.update((column, row) for column in columns for row in rows)
+        self.render_timer.start()
+
+    def update_transform(self):
+        """Fit the scene rect into the widget, keeping its aspect ratio."""
+        self.source_rect = self.scene.sceneRect()
+        width = max(self.source_rect.width(), 1)
+        height = max(self.source_rect.height(), 1)
+        scale = min(self.width() / width, self.height() / height)
+        self.transform = QTransform()
+        self.transform.scale(scale, scale)
+        self.transform.translate(-self.source_rect.left(), -self.source_rect.top())
+
+    def render_dirty(self):
+        """Bring the cached pixmap up to date with the scene."""
+        if not self.isVisible():
+            return  # Rendered when the dock is shown again
+        if self.scene.mouseGrabberItem() is not None:
+            self.render_timer.start()  # Items are being dragged; redraw once they are dropped
+            return
+        if self.full_render or self.cache is None or self.cache.size() != self.size():
+            self.update_transform()
+            self.cache = QPixmap(self.size())
+            targets = [None]  # Everything, without querying the scene's index
+            self.full_render = False
+        else:
+            targets = self.dirty_spans()
+        self.dirty = set()
+
+        painter = QPainter(self.cache)
+        for target in targets:
+            if target is None:
+                painter.fillRect(self.cache.rect(), self.BACKGROUND)
+                items = self.scene.items()
+            else:
+                painter.setClipRect(target)
+                painter.fillRect(target, self.BACKGROUND)
+                items = self.scene.items(self.transform.inverted()[0].mapRect(target))
+            painter.setTransform(self.transform)
+            self.draw_items(painter, items)
+            painter.resetTransform()
+        painter.end()
+        self.update()
+
+    def dirty_spans(self):
+        """Dirty tiles as pixmap rects, each run of neighbouring tiles in a row merged into one."""
+        tile = self.TILE_SIZE
+        spans = []
+        for column, row in sorted(self.dirty, key=lambda cell: (cell[1], cell[0])):
+            last = spans[-1] if spans else None
+            if last is not None and last[1] == row and last[2] == column:
+                last[2] = column + 1
+            else:
+                spans.append([column, row, column + 1])
+        return [QRectF(start * tile, row * tile, (end - start) * tile, tile) for start, row, end in spans]
+
+    def draw_items(self, painter, items):
+        """Draw the wires and blocks among items, in descending stacking order, at minimap detail."""
+        painter.setPen(QPen(self.WIRE_COLOR, 0))  # Cosmetic: one pixel wide at any scale
+        for item in items:
+            if isinstance(item, Wire) and item.end_port:
+                line = item.line()
+                painter.drawLine(item.mapToScene(line.p1()), item.mapToScene(line.p2()))
+        for item in reversed(items):  # Lowest first, so blocks stacked on top stay on top
+            if isinstance(item, Block):
+                painter.fillRect(item.mapRectToScene(item.rect()), item.brush())
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.BACKGROUND)
+        if self.cache is not None:
+            painter.drawPixmap(0, 0, self.cache)
+
+        # Outline of the area shown by the canvas
+        visible = self.canvas.mapToScene(self.canvas.viewport().rect()).boundingRect()
+        painter.setPen(QPen(QColor(255, 200, 0), 1))
+        painter.drawRect(self.transform.mapRect(visible))
+
+    def resizeEvent(self, event):
+        self.invalidate()
+        super().resizeEvent(event)
+
+    def showEvent(self, event):
+        self.invalidate()
+        super().showEvent(event)
+
+    def mousePressEvent(self, event):
+        """Jump to the clicked point."""
+        if event.button() == Qt.LeftButton:
+            self.centre_canvas(event.pos())
+
+    def mouseMoveEvent(self, event):
+        """Keep following the cursor while dragging."""
+        if event.buttons() & Qt.LeftButton:
+            self.centre_canvas(event.pos())
+
+    def centre_canvas(self, pos):
+        """Centre the canvas on the scene point under a minimap position."""
+        self.canvas.centerOn(self.transform.inverted()[0].map(QPointF(pos)))
+        self.update()
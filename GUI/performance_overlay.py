@@ -0,0 +1,80 @@
+import time
+
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtGui import QFont
+from PyQt5.QtCore import Qt, QTimer, QEvent
+
+from backend.tracing import tracer
+
+
+class PerformanceOverlay(QLabel):
+    """
+    Box in the corner of a DiagramCanvas showing frame times and recent slow operations.
+
+    It is opaque, so refreshing it never makes the diagram underneath repaint
+    and skew the frame times it shows.
+    """
+    MARGIN = 8
+    SLOW_SHOWN = 8  # Slow spans listed
+    SLOW_MAX_AGE = 30  # Seconds a slow span stays listed
+
+    def __init__(self, canvas):
+        super().__init__(canvas)
+        self.canvas = canvas
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setAutoFillBackground(True)
+        self.setStyleSheet("background-color: rgb(30, 30, 30); color: rgb(200, 255, 200); padding: 4px;")
+        self.setFont(QFont("Monospace", 8))
+        self.setTextFormat(Qt.PlainText)
+        self.hide()
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(250)
+        self.refresh_timer.timeout.connect(self.refresh)
+        canvas.installEventFilter(self)
+
+    def set_active(self, active):
+        """Show the overlay and turn tracing on, or hide it and turn tracing off."""
+        tracer.enable(active)
+        self.setVisible(active)
+        if active:
+            self.canvas.frame_times.clear()
+            self.refresh()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+
+    def refresh(self):
+        frames = list(self.canvas.frame_times)
+        if frames:
+            durations = [duration / 1e6 for _, duration in frames]
+            lines = [f"Frame {durations[-1]:6.2f} ms  avg {sum(durations) / len(durations):.2f}  "
+                     f"max {max(durations):.2f}"]
+            if len(frames) > 1:
+                # Repaints per second over the frames kept, as a rough frame rate while interacting
+                span = (frames[-1][0] - frames[0][0]) / 1e9
+                lines[0] += f"  {(len(frames) - 1) / span:.0f} fps" if span > 0 else ""
+        else:
+            lines = ["Frame    --"]
+
+        now = time.time()
+        slow = [entry for entry in tracer.slow if now - entry[2] < self.SLOW_MAX_AGE][-self.SLOW_SHOWN:]
+        if slow:
+            lines.append("Slow operations:")
+            for name, duration, when in reversed(slow):
+                lines.append(f"  {duration:8.1f} ms  {name}  ({now - when:.0f} s ago)")
+        lines.append(f"{len(tracer.events)} spans recorded")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        self.place()
+
+    def place(self):
+        """Keep the overlay in the top-right corner of the viewport."""
+        viewport = self.canvas.viewport().geometry()
+        self.move(viewport.right() - self.width() - self.MARGIN, viewport.top() + self.MARGIN)
+        self.raise_()
+
+    def eventFilter(self, watched, event):
+        if watched is self.canvas and event.type() == QEvent.Resize and self.isVisible():
+            self.place()
+        return False
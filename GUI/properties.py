@@ -1,8 +1,138 @@
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QLineEdit, QFormLayout, QScrollArea
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QLabel, QLineEdit, QFormLayout, QScrollArea, QStackedWidget
+)
+from PyQt5.QtCore import pyqtSignal
+
+from backend.streaming import STREAM_FORMATS
+from backend.external_io import TRANSPORTS
+from backend.file_source import INTERPOLATIONS
+from backend.tracing import traced
+from backend.vectors import CHANNEL_PROPERTIES
+
+
+def parse_number(text):
+    """Parse an int if the text is integral, otherwise a float."""
+    text = text.strip()
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_list(text):
+    """Parse a list of numbers such as "[1, 2]", "1, 2" or "1 2"."""
+    text = text.strip().lstrip("[").rstrip("]")
+    items = text.replace(",", " ").split()
+    if not items:
+        raise ValueError("expected at least one number")
+    return [parse_number(item) for item in items]
+
+
+def parse_channels(text):
+    """Parse one number, or a list with one number per channel such as "[1, 2, 3]"."""
+    values = parse_list(text)
+    if len(values) == 1 and not text.strip().startswith("["):
+        return values[0]
+    return values
+
+
+def parse_signs(text):
+    """Parse a SUM sign string such as "+-"."""
+    text = text.strip()
+    if not text or set(text) - {"+", "-"}:
+        raise ValueError("expected a string of + and - signs")
+    return text
+
+
+def parse_stream_format(text):
+    """Parse the file format of a streamed SCOPE."""
+    text = text.strip().lower()
+    if text not in STREAM_FORMATS:
+        raise ValueError(f"expected one of {', '.join(STREAM_FORMATS)}")
+    return text
+
+
+def parse_transport(text):
+    """Parse the transport of an external source or sink."""
+    text = text.strip().lower()
+    if text not in TRANSPORTS:
+        raise ValueError(f"expected one of {', '.join(TRANSPORTS)}")
+    return text
+
+
+def parse_interpolation(text):
+    """Parse how a FROM_FILE block interpolates between samples."""
+    text = text.strip().lower()
+    if text not in INTERPOLATIONS:
+        raise ValueError(f"expected one of {', '.join(INTERPOLATIONS)}")
+    return text
+
+
+# Properties whose type can't be inferred from their current value
+PROPERTY_PARSERS = {
+    **{prop: parse_channels for props in CHANNEL_PROPERTIES.values() for prop in props},
+    "Numerator": parse_list,
+    "Denominator": parse_list,
+    "Inputs": parse_signs,
+    "Stream Format": parse_stream_format,
+    "Transport": parse_transport,
+    "Interpolation": parse_interpolation,
+}
+
+
+def parse_property(prop, text, current):
+    """Parse text entered for a property, using the property's known type or its current value's type."""
+    parser = PROPERTY_PARSERS.get(prop)
+    if parser is None:
+        if isinstance(current, list):
+            parser = parse_list
+        elif isinstance(current, (int, float)) and not isinstance(current, bool):
+            parser = parse_number
+        else:
+            parser = str
+    return parser(text)
+
+
+class PropertyForm(QWidget):
+    """Editor rows for one block type, created once and rebound to each selection."""
+
+    def __init__(self, property_names, on_edit):
+        super().__init__()
+        self.property_names = property_names
+        self.layout = QFormLayout()
+        self.setLayout(self.layout)
+
+        self.title = QLabel()
+        self.layout.addRow(self.title)
+
+        self.fields = {}
+        for prop in property_names:
+            field = QLineEdit()
+            field.editingFinished.connect(lambda p=prop: on_edit(p))
+            self.layout.addRow(QLabel(prop), field)
+            self.fields[prop] = field
+
+    def bind(self, blocks):
+        """Show the property values of the given blocks."""
+        if len(blocks) == 1:
+            self.title.setText(blocks[0].name)
+        else:
+            self.title.setText(f"{len(blocks)} {blocks[0].block_type} blocks")
+
+        for prop, field in self.fields.items():
+            values = {repr(block.properties.get(prop)) for block in blocks}
+            if len(values) == 1:
+                field.setText(str(blocks[0].properties.get(prop)))
+                field.setPlaceholderText("")
+            else:
+                field.clear()
+                field.setPlaceholderText("(multiple values)")
+            field.setModified(False)
 
 
 class PropertiesEditor(QWidget):
     """Widget to display and edit block properties."""
+    property_changed = pyqtSignal(object, str, object)  # blocks, property name, new value
 
     def __init__(self):
         super().__init__()
@@ -12,78 +142,77 @@ class PropertiesEditor(QWidget):
         # Add a scroll area for better usability
         self.scroll_area = QScrollArea()
         self.scroll_area.setWidgetResizable(True)
-        self.scroll_content = QWidget()
-        self.scroll_layout = QFormLayout()
-        self.scroll_content.setLayout(self.scroll_layout)
-        self.scroll_area.setWidget(self.scroll_content)
+        self.forms_stack = QStackedWidget()
+        self.scroll_area.setWidget(self.forms_stack)
+        self.empty_page = QWidget()  # Shown while no block is selected
+        self.forms_stack.addWidget(self.empty_page)
 
         self.layout.addWidget(self.scroll_area)
 
+        self.forms = {}  # One form per block type
+        self.blocks = []  # Blocks the current form is bound to
+
+    @traced()
     def set_block(self, block):
         """Set the properties of the selected block."""
-        # Clear the previous properties
-        for i in reversed(range(self.scroll_layout.count())):
-            widget = self.scroll_layout.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-
-        # Add properties for the selected block
-        block_label = QLabel(f"{block.name}")
-        self.scroll_layout.addRow(block_label)
-
-        # Handle different block types and their properties
-        for prop, value in block.properties.items():
-            label = QLabel(prop)
-            input_field = QLineEdit(str(value))
-
-            # Use lambda with default argument to avoid reference issues
-            input_field.editingFinished.connect(
-                lambda p=prop, field=input_field: self.update_property(block, p, field.text())
-            )
-            self.scroll_layout.addRow(label, input_field)
+        self.set_blocks([block])
+
+    @traced()
+    def set_blocks(self, blocks):
+        """Show the properties of one or more blocks of the same type for editing together, or none."""
+        if not blocks:
+            # Unbind, so later edits can't reach blocks that were deselected or deleted
+            self.blocks = []
+            self.forms_stack.setCurrentWidget(self.empty_page)
+            return
+
+        block_type = blocks[0].block_type
+        property_names = list(blocks[0].properties)
+        form = self.forms.get(block_type)
+        if form is None or form.property_names != property_names:
+            # Only built the first time a block type is shown, or if its properties differ
+            if form is not None:
+                self.forms_stack.removeWidget(form)
+                form.deleteLater()
+            form = PropertyForm(property_names, self.field_edited)
+            self.forms[block_type] = form
+            self.forms_stack.addWidget(form)
+
+        self.blocks = blocks
+        form.bind(blocks)
+        self.forms_stack.setCurrentWidget(form)
+
+    def field_edited(self, prop):
+        """Apply an edited field to every bound block."""
+        if not self.blocks:
+            return  # The form was unbound before focus left the field
+        form = self.forms_stack.currentWidget()
+        field = form.fields[prop]
+        if not field.isModified():
+            return  # Focus left the field without an edit
+        field.setModified(False)
 
-    def update_property(self, block, prop, value):
-        """Update the property of the block."""
         try:
-            # Convert value to its original type
-            block.properties[prop] = type(block.properties[prop])(value)
-        except ValueError:
-            block.properties[prop] = value
+            value = parse_property(prop, field.text(), self.blocks[0].properties.get(prop))
+        except ValueError as e:
+            print(f"Invalid value for {prop}: {e}")
+            form.bind(self.blocks)  # Show the unchanged values again
+            return
 
-    def update_properties(self, block):
-        """Update properties based on the selected block."""
-        self.clear()  # Remove existing property fields
-        self.block = block
+        self.apply_property(self.blocks, prop, value)
 
-        if not self.block:
-            return
+    def apply_property(self, blocks, prop, value):
+        """Set a property on several blocks as one batch."""
+        for block in blocks:
+            # Each block gets its own copy of list values
+            block.properties[prop] = list(value) if isinstance(value, list) else value
+        self.property_changed.emit(blocks, prop, value)
 
-        self.add_item(QLabel(f"Properties for {block.name}"))
-        for prop_name, prop_value in block.properties.items():
-            label = QLabel(prop_name)
-            input_field = QLineEdit(str(prop_value))
-            input_field.editingFinished.connect(
-                lambda name=prop_name, field=input_field: self.update_block_property(name, field)
-            )
-            self.add_item(label)
-            self.add_item(input_field)
-
-    def clear(self):
-        """Clear all property fields."""
-        for i in reversed(range(self.scroll_layout.count())):
-            widget = self.scroll_layout.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-
-    def add_item(self, item):
-        """Add a widget to the properties editor."""
-        self.scroll_layout.addRow(item)
-
-    def update_block_property(self, name, field):
-        """Update the value of a specific property."""
+    def update_property(self, block, prop, value):
+        """Update the property of the block from text."""
         try:
-            value = field.text()
-            # Convert to the appropriate type if possible
-            self.block.properties[name] = type(self.block.properties[name])(value)
-        except ValueError:
-            self.block.properties[name] = value
+            parsed = parse_property(prop, value, block.properties.get(prop))
+        except ValueError as e:
+            print(f"Invalid value for {prop}: {e}")
+            return
+        self.apply_property([block], prop, parsed)
@@ -0,0 +1,252 @@
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QListWidget, QListWidgetItem, QSplitter
+from PyQt5.QtGui import QPainter, QPen, QColor, QPolygonF
+from PyQt5.QtCore import Qt, QPointF, QRectF
+
+TRACE_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#17becf"]
+
+
+class MinMaxPyramid:
+    """
+    Min/max summaries of a trajectory at successively coarser resolutions.
+
+    Level 0 is the trajectory itself; each further level holds the minimum and
+    maximum of FACTOR consecutive buckets of the level below. A view of any
+    span is drawn from the coarsest level that still has at least one bucket
+    per pixel column, so the work per redraw depends on the plot width rather
+    than the number of samples.
+    """
+    FACTOR = 8
+    MIN_LEVEL_SIZE = 1024  # Stop adding levels once a level is this small
+
+    def __init__(self, t, y):
+        # Views of the simulation result buffers, not copies
+        self.t = np.asarray(t)
+        self.y = np.asarray(y)
+
+        self.levels = [(1, self.y, self.y)]  # (samples per bucket, mins, maxs)
+        bucket, mins, maxs = self.levels[0]
+        while len(mins) > self.MIN_LEVEL_SIZE:
+            starts = np.arange(0, len(mins), self.FACTOR)
+            mins = np.minimum.reduceat(mins, starts)
+            maxs = np.maximum.reduceat(maxs, starts)
+            bucket *= self.FACTOR
+            self.levels.append((bucket, mins, maxs))
+
+    def __len__(self):
+        return len(self.t)
+
+    def query(self, t0, t1, columns):
+        """
+        Return (x, mins, maxs) covering times t0..t1 with about one point per column.
+
+        When the span holds few enough samples they are returned as they are,
+        with mins and maxs both equal to the samples.
+        """
+        n = len(self.t)
+        if n == 0:
+            empty = self.y[:0]
+            return self.t[:0], empty, empty
+        i0 = max(int(np.searchsorted(self.t, t0, "right")) - 1, 0)
+        i1 = min(int(np.searchsorted(self.t, t1, "left")) + 1, n)
+        count = i1 - i0
+        columns = max(int(columns), 1)
+
+        if count <= 2 * columns:
+            samples = self.y[i0:i1]
+            return self.t[i0:i1], samples, samples
+
+        # Coarsest level that still gives every column at least one bucket
+        for bucket, mins, maxs in reversed(self.levels):
+            if count // bucket >= columns:
+                break
+        b0 = i0 // bucket
+        b1 = -(-i1 // bucket)
+        mins = mins[b0:b1]
+        maxs = maxs[b0:b1]
+
+        # Merge the buckets of that level down to one per column
+        edges = np.unique(np.linspace(0, len(mins), columns + 1, dtype=np.int64)[:-1])
+        x = self.t[(b0 + edges) * bucket]
+        return x, np.minimum.reduceat(mins, edges), np.maximum.reduceat(maxs, edges)
+
+
+class ResultsPlot(QWidget):
+    """Plot of scope traces that can be zoomed with the wheel and panned by dragging."""
+
+    MARGIN = 40
+
+    def __init__(self):
+        super().__init__()
+        self.setMinimumHeight(150)
+        self.traces = []  # (name, pyramid, color) of the traces being shown
+        self.t_range = (0.0, 1.0)  # Full span of the results
+        self.view = (0.0, 1.0)  # Visible span
+        self.drag_x = None
+
+    def set_traces(self, traces, t_range, keep_view=False):
+        """Show new traces, resetting the view unless it still lies inside the new span."""
+        self.traces = traces
+        self.t_range = t_range
+        if not (keep_view and t_range[0] <= self.view[0] < self.view[1] <= t_range[1]):
+            self.view = t_range
+        self.update()
+
+    def plot_rect(self):
+        """Area inside the axes."""
+        return QRectF(self.rect()).adjusted(self.MARGIN, 10, -10, -20)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        area = self.plot_rect()
+        painter.setPen(QPen(Qt.gray))
+        painter.drawRect(area)
+        if not self.traces or area.width() < 2 or area.height() < 2:
+            return
+
+        t0, t1 = self.view
+        columns = int(area.width())
+        envelopes = [(color, pyramid.query(t0, t1, columns)) for _, pyramid, color in self.traces]
+
+        # Fit the vertical axis to what is visible
+        lows = [np.nanmin(mins) for _, (_, mins, _) in envelopes if len(mins)]
+        highs = [np.nanmax(maxs) for _, (_, _, maxs) in envelopes if len(maxs)]
+        if not lows:
+            return
+        y0, y1 = float(min(lows)), float(max(highs))
+        if not np.isfinite(y0) or not np.isfinite(y1):
+            return
+        if y1 - y0 < 1e-12:
+            y0, y1 = y0 - 1, y1 + 1
+        pad = (y1 - y0) * 0.05
+        y0, y1 = y0 - pad, y1 + pad
+
+        x_scale = area.width() / (t1 - t0)
+        y_scale = area.height() / (y1 - y0)
+        painter.setClipRect(area)
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        for color, (x, mins, maxs) in envelopes:
+            px = area.left() + (np.asarray(x, dtype=float) - t0) * x_scale
+            low = area.bottom() - (np.asarray(mins, dtype=float) - y0) * y_scale
+            high = area.bottom() - (np.asarray(maxs, dtype=float) - y0) * y_scale
+            # Zigzag between each column's min and max so the envelope is filled in
+            xs = np.repeat(px, 2)
+            ys = np.empty(len(xs))
+            ys[0::2] = low
+            ys[1::2] = high
+            painter.setPen(QPen(QColor(color), 1))
+            painter.drawPolyline(QPolygonF([QPointF(a, b) for a, b in zip(xs.tolist(), ys.tolist())]))
+        painter.setClipping(False)
+
+        # Axis limits
+        painter.setPen(QPen(Qt.black))
+        painter.drawText(QRectF(area.left(), area.bottom() + 2, 100, 16), Qt.AlignLeft, f"{t0:.4g}")
+        painter.drawText(QRectF(area.right() - 100, area.bottom() + 2, 100, 16), Qt.AlignRight, f"{t1:.4g}")
+        painter.drawText(QRectF(0, area.top(), self.MARGIN - 4, 16), Qt.AlignRight, f"{y1:.3g}")
+        painter.drawText(QRectF(0, area.bottom() - 16, self.MARGIN - 4, 16), Qt.AlignRight, f"{y0:.3g}")
+
+    def time_at(self, x):
+        """Time under a widget x coordinate."""
+        area = self.plot_rect()
+        t0, t1 = self.view
+        return t0 + (x - area.left()) / max(area.width(), 1) * (t1 - t0)
+
+    def set_view(self, t0, t1):
+        """Show the span t0..t1, clamped to the results."""
+        lo, hi = self.t_range
+        span = min(t1 - t0, hi - lo)
+        if span <= 0:
+            return
+        t0 = min(max(t0, lo), hi - span)
+        self.view = (t0, t0 + span)
+        self.update()
+
+    def wheelEvent(self, event):
+        """Zoom around the cursor."""
+        factor = 0.8 if event.angleDelta().y() > 0 else 1.25
+        anchor = self.time_at(event.pos().x())
+        t0, t1 = self.view
+        self.set_view(anchor - (anchor - t0) * factor, anchor + (t1 - anchor) * factor)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.drag_x = event.pos().x()
+
+    def mouseMoveEvent(self, event):
+        """Pan while dragging."""
+        if self.drag_x is None:
+            return
+        shift = self.time_at(self.drag_x) - self.time_at(event.pos().x())
+        self.drag_x = event.pos().x()
+        self.set_view(self.view[0] + shift, self.view[1] + shift)
+
+    def mouseReleaseEvent(self, event):
+        self.drag_x = None
+
+    def mouseDoubleClickEvent(self, event):
+        """Zoom out to the whole run."""
+        self.set_view(*self.t_range)
+
+
+class ResultsViewer(QWidget):
+    """Panel listing the SCOPE signals of the latest simulation and plotting the checked ones."""
+
+    def __init__(self):
+        super().__init__()
+        self.layout = QVBoxLayout()
+        self.setLayout(self.layout)
+
+        self.splitter = QSplitter(Qt.Horizontal)
+        self.signal_list = QListWidget()
+        self.signal_list.setMaximumWidth(200)
+        self.signal_list.itemChanged.connect(self.show_checked)
+        self.plot = ResultsPlot()
+        self.splitter.addWidget(self.signal_list)
+        self.splitter.addWidget(self.plot)
+        self.layout.addWidget(self.splitter)
+
+        self.pyramids = {}  # Signal name -> MinMaxPyramid
+        self.t_range = (0.0, 1.0)
+
+    def set_results(self, results):
+        """Show the scope signals from a run_bdsim_simulation results dict."""
+        t = np.asarray(results["t"])
+        previous = {
+            self.signal_list.item(i).text(): self.signal_list.item(i).checkState()
+            for i in range(self.signal_list.count())
+        }
+
+        self.pyramids = {}
+        for name, y in results["scopes"].items():
+            y = np.asarray(y)
+            if y.ndim == 1:
+                self.pyramids[name] = MinMaxPyramid(t, y)
+            else:
+                # One trace per channel of a vector signal, as column views
+                y = y.reshape(len(t), -1)
+                for channel in range(y.shape[1]):
+                    self.pyramids[f"{name}[{channel}]"] = MinMaxPyramid(t, y[:, channel])
+
+        self.signal_list.blockSignals(True)
+        self.signal_list.clear()
+        for name in self.pyramids:
+            item = QListWidgetItem(name)
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(previous.get(name, Qt.Checked))
+            self.signal_list.addItem(item)
+        self.signal_list.blockSignals(False)
+
+        self.t_range = (float(t[0]), float(t[-1])) if len(t) > 1 else (0.0, 1.0)
+        # Re-runs of the same diagram keep the current zoom
+        self.show_checked(keep_view=bool(previous))
+
+    def show_checked(self, *args, keep_view=True):
+        """Plot the checked signals."""
+        traces = []
+        for i in range(self.signal_list.count()):
+            item = self.signal_list.item(i)
+            if item.checkState() == Qt.Checked:
+                color = TRACE_COLORS[i % len(TRACE_COLORS)]
+                traces.append((item.text(), self.pyramids[item.text()], color))
+        self.plot.set_traces(traces, self.t_range, keep_view=keep_view)
@@ -0,0 +1,68 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from backend.simulate import run_bdsim_simulation, SimulationRun
+from backend.fitting import fit_parameters, FitCancelled
+
+
+class SimulationWorker(QThread):
+    """Runs a simulation of a diagram snapshot on a background thread."""
+    succeeded = pyqtSignal(object)  # Results dict from run_bdsim_simulation
+    failed = pyqtSignal(str)
+
+    def __init__(self, blocks, wires, T, version=None, parent=None, **options):
+        super().__init__(parent)
+        self.blocks = blocks
+        self.wires = wires
+        self.T = T
+        self.options = options  # Further run_bdsim_simulation arguments, such as pace
+        self.version = version  # Diagram version the snapshot was taken from
+        self.handle = SimulationRun()
+
+    def cancel(self):
+        """Stop the simulation early; its results will not be reported."""
+        self.handle.cancel()
+
+    def run(self):
+        """Run the simulation without graphics, reporting the results through signals."""
+        try:
+            results = run_bdsim_simulation(
+                self.blocks, self.wires, T=self.T, graphics=False, run=self.handle, **self.options
+            )
+            if self.handle.cancelled:
+                return
+            if results is None:
+                self.failed.emit("Simulation failed.")
+            else:
+                self.succeeded.emit(results)
+        except Exception as e:
+            if not self.handle.cancelled:
+                self.failed.emit(str(e))
+
+
+class FitWorker(QThread):
+    """Fits block parameters to measured data on a background thread."""
+    succeeded = pyqtSignal(object)  # Result dict from fit_parameters
+    failed = pyqtSignal(str)
+    progressed = pyqtSignal(int, float)  # Simulations run so far, best RMS error of the latest batch
+
+    def __init__(self, blocks, wires, parent=None, **options):
+        super().__init__(parent)
+        self.blocks = blocks
+        self.wires = wires
+        self.options = options  # fit_parameters arguments
+        self.handle = SimulationRun()
+
+    def cancel(self):
+        """Stop the fit after the current batch of simulations."""
+        self.handle.cancel()
+
+    def run(self):
+        try:
+            result = fit_parameters(
+                self.blocks, self.wires, run=self.handle, progress=self.progressed.emit, **self.options
+            )
+            self.succeeded.emit(result)
+        except FitCancelled:
+            pass
+        except Exception as e:
+            self.failed.emit(str(e))
@@ -1,7 +1,9 @@
 from PyQt5.QtWidgets import QGraphicsLineItem
-from PyQt5.QtCore import QLineF, QPointF
+from PyQt5.QtCore import QLineF, QPointF, QRectF
 from PyQt5.QtGui import QPen, QColor
 
+WIDTH_LABEL_MARGIN = 24  # Room around the line for the channel count of a vector signal
+
 
 class Wire(QGraphicsLineItem):
     """Represents a wire connecting two ports."""
@@ -9,6 +11,7 @@ class Wire(QGraphicsLineItem):
         super().__init__()
         self.start_port = start_port
         self.end_port = None  # Set end_port to None by default
+        self.width = 1  # Channels carried, once inferred by validation
         self.setPen(QPen(QColor("white"), 2))
         self.setZValue(-1)  # Ensure wires are drawn behind blocks
 
@@ -54,6 +57,28 @@ class Wire(QGraphicsLineItem):
             start = self.start_port.scenePos()
             self.setLine(QLineF(start, cursor_pos))
 
+    def set_width(self, width):
+        """Set the number of channels the wire carries; more than one is labelled on the wire."""
+        if width != self.width:
+            self.prepareGeometryChange()
+            self.width = width
+            self.update()
+
+    def boundingRect(self):
+        rect = super().boundingRect()
+        if self.width > 1:
+            rect = rect.adjusted(-WIDTH_LABEL_MARGIN, -WIDTH_LABEL_MARGIN, WIDTH_LABEL_MARGIN, WIDTH_LABEL_MARGIN)
+        return rect
+
+    def paint(self, painter, option, widget=None):
+        super().paint(painter, option, widget)
+        if self.width > 1:
+            # A slash across the middle of the wire with the channel count next to it
+            line = self.line()
+            middle = line.center()
+            painter.drawLine(middle + QPointF(-4, 6), middle + QPointF(4, -6))
+            painter.drawText(QRectF(middle.x() + 2, middle.y() - 22, 40, 16), str(self.width))
+
     def mousePressEvent(self, event):
         """Highlight wire when selected."""
         self.setPen(QPen(self.selected_color, 2))
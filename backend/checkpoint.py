@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+CHECKPOINT_FILE = "checkpoint.npz"
+RESULTS_FILE = "results.npz"
+RUNS_DIR = os.path.join(os.path.expanduser("~"), ".bdsimgui", "runs")
+
+
+def diagram_fingerprint(blocks, wires):
+    """
+    Hash identifying a flattened diagram, to check a checkpoint belongs to it.
+
+    Block positions and other layout do not count; only what is simulated.
+    """
+    content = {
+        "blocks": sorted(
+            ([block["name"], block["type"], block["properties"]] for block in blocks), key=lambda b: b[0]
+        ),
+        "wires": [
+            [wire["start"], wire.get("start_port_index", 0), wire["end"], wire.get("end_port_index", 0)]
+            for wire in wires
+        ],
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def make_checkpoint(t, x, fingerprint, method=None, step_size=None):
+    """
+    Everything needed to carry on a run from time t.
+
+    The blocks in this repository keep no state outside the continuous state
+    vector x, so x, the method in use and its last step size are the whole
+    integrator and block state. scipy solvers cannot be saved as they are;
+    resuming restarts the method at t with that step, as bdsim does at every
+    event anyway.
+    """
+    return {
+        "t": float(t),
+        "x": np.array(x, dtype=float),
+        "fingerprint": fingerprint,
+        "method": method,
+        "step_size": None if step_size is None else float(step_size),
+    }
+
+
+def save_checkpoint(path, checkpoint):
+    """Write a checkpoint atomically, so a crash mid-write leaves the previous one intact."""
+    temporary = path + ".tmp"
+    info = {key: value for key, value in checkpoint.items() if key != "x"}
+    with open(temporary, "wb") as file:
+        np.savez(file, x=checkpoint["x"], info=np.array(json.dumps(info)))
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path):
+    with np.load(path) as data:
+        checkpoint = json.loads(str(data["info"]))
+        checkpoint["x"] = data["x"]
+    return checkpoint
+
+
+def save_run(directory, results, checkpoint):
+    """Store a run's time vector, SCOPE signals and final checkpoint together in a directory."""
+    os.makedirs(directory, exist_ok=True)
+    names = list(results["scopes"])
+    arrays = {"t": np.asarray(results["t"]), "names": np.array(json.dumps(names))}
+    for i, name in enumerate(names):
+        arrays[f"scope{i}"] = np.asarray(results["scopes"][name])
+    temporary = os.path.join(directory, RESULTS_FILE + ".tmp")
+    with open(temporary, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(temporary, os.path.join(directory, RESULTS_FILE))
+    save_checkpoint(os.path.join(directory, CHECKPOINT_FILE), checkpoint)
+
+
+def load_run(directory):
+    """Inverse of save_run: returns (results, checkpoint)."""
+    with np.load(os.path.join(directory, RESULTS_FILE)) as data:
+        names = json.loads(str(data["names"]))
+        results = {"t": data["t"], "scopes": {name: data[f"scope{i}"] for i, name in enumerate(names)}}
+    return results, load_checkpoint(os.path.join(directory, CHECKPOINT_FILE))
+
+
+def run_directory(fingerprint, root=RUNS_DIR):
+    """Where the GUI keeps the latest run of a diagram."""
+    return os.path.join(root, fingerprint[:16])
+
+
+def append_results(previous, extension):
+    """
+    Results of a run followed by those of its resumed extension.
+
+    Signals streamed to disk were appended to their files by the resumed
+    run, so they already cover the whole horizon and are taken as they are.
+    Samples of the extension at or before the end of the previous results
+    are dropped, so the time vector stays increasing.
+    """
+    t = np.asarray(previous["t"])
+    new_t = np.asarray(extension["t"])
+    combined = dict(extension)
+    if len(t) and len(new_t) and new_t[0] <= t[0]:
+        # Streamed time vector: the extension holds the whole horizon
+        combined["scopes"] = {
+            name: values if len(values) == len(new_t)
+            else np.concatenate([np.asarray(previous["scopes"][name]), np.asarray(values)])
+            for name, values in extension["scopes"].items()
+        }
+        return combined
+    keep = new_t > t[-1] if len(t) else np.ones(len(new_t), dtype=bool)
+    combined["t"] = np.concatenate([t, new_t[keep]])
+    combined["scopes"] = {
+        name: np.concatenate([np.asarray(previous["scopes"][name]), np.asarray(values)[keep]])
+        for name, values in extension["scopes"].items()
+    }
+    return combined
@@ -0,0 +1,444 @@
+import io
+import itertools
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from backend.subsystem import flatten_diagram
+from backend.fitting import set_parameter, parameter_label
+
+PROTOCOL_VERSION = 1
+DEFAULT_WORKER_ADDRESS = "127.0.0.1:9900"
+FRAME_HEADER = struct.Struct("!II")  # JSON header length, binary payload length
+MAX_HEADER_SIZE = 64 * 1024 * 1024  # Diagrams are sent in the header
+MAX_PAYLOAD_SIZE = 1 << 30  # Compressed results of one run
+SEND_CHUNK_SIZE = 1 << 20  # Payload bytes written to the socket at a time
+MAX_RETRIES = 2  # Further attempts at a job after a failure
+CONNECT_TIMEOUT = 10.0  # Seconds to wait for a worker to accept a connection
+REMOTE_OPTIONS = ("step", "solver", "optimize")  # run_bdsim_simulation arguments a worker accepts
+LOCAL_IO_TYPES = ("FROM_FILE", "EXT_SOURCE", "EXT_SINK")  # Read files or open sockets where they run
+
+
+def parse_address(address):
+    """Split "host:port" into a (host, port) tuple."""
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Expected a worker address like {DEFAULT_WORKER_ADDRESS}, got {address!r}.")
+    return host, int(port)
+
+
+def _receive_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed mid-message.")
+        received += count
+    return bytes(buffer)
+
+
+def send_message(sock, header, payload=b""):
+    """
+    Send one frame: the lengths, a JSON header and an optional binary payload.
+
+    Only JSON and .npz data cross the wire, never pickles. That keeps what is
+    sent from being unpickled into code, but the diagram still runs on the
+    worker; see check_request for what a worker refuses to run.
+    """
+    encoded = json.dumps(header, default=float).encode()
+    sock.sendall(FRAME_HEADER.pack(len(encoded), len(payload)) + encoded)
+    view = memoryview(payload)
+    for start in range(0, len(payload), SEND_CHUNK_SIZE):
+        sock.sendall(view[start:start + SEND_CHUNK_SIZE])
+
+
+def receive_message(sock, max_payload_size=MAX_PAYLOAD_SIZE):
+    """
+    Receive one frame; returns (header dict, payload bytes), or (None, b"") once the peer has closed.
+
+    Frames announcing a header over MAX_HEADER_SIZE or a payload over
+    max_payload_size raise ConnectionError before anything is allocated.
+    """
+    first = sock.recv(FRAME_HEADER.size)
+    if not first:
+        return None, b""
+    if len(first) < FRAME_HEADER.size:
+        first += _receive_exactly(sock, FRAME_HEADER.size - len(first))
+    header_size, payload_size = FRAME_HEADER.unpack(first)
+    if header_size > MAX_HEADER_SIZE:
+        raise ConnectionError(f"Message header of {header_size} bytes is too large.")
+    if payload_size > max_payload_size:
+        raise ConnectionError(f"Message payload of {payload_size} bytes is too large.")
+    header = json.loads(_receive_exactly(sock, header_size))
+    return header, _receive_exactly(sock, payload_size) if payload_size else b""
+
+
+def encode_results(results):
+    """Compress the time vector and SCOPE signals of a run into .npz bytes."""
+    buffer = io.BytesIO()
+    arrays = {"t": np.asarray(results["t"])}
+    names = list(results["scopes"])
+    for i, name in enumerate(names):
+        arrays[f"scope{i}"] = np.asarray(results["scopes"][name])
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue(), names
+
+
+def decode_results(payload, names):
+    """Inverse of encode_results: a dict with "t" and "scopes" arrays."""
+    with np.load(io.BytesIO(payload)) as arrays:
+        return {"t": arrays["t"], "scopes": {name: arrays[f"scope{i}"] for i, name in enumerate(names)}}
+
+
+def apply_overrides(blocks, overrides):
+    """
+    Copy of flattened blocks with parameter overrides applied.
+
+    overrides is a list of (block name, property, index, value), where
+    index picks a coefficient of a list property and is None otherwise.
+    """
+    blocks = [{**block, "properties": dict(block["properties"])} for block in blocks]
+    by_name = {block["name"]: block for block in blocks}
+    for name, prop, index, value in overrides:
+        if name not in by_name:
+            raise ValueError(f"No block named {name}.")
+        set_parameter(by_name[name]["properties"], (name, prop, index), value)
+    return blocks
+
+
+def check_request(request):
+    """
+    Blocks and options of a run request, once they are known to be safe to run here.
+
+    Only the REMOTE_OPTIONS are accepted, so a coordinator cannot have the
+    worker stream, checkpoint or resume into its own file system. For the
+    same reason, blocks of the LOCAL_IO_TYPES and SCOPEs with a "Stream To"
+    directory are refused, after the overrides are applied. Raises
+    ValueError naming the first thing refused.
+    """
+    options = request.get("options") or {}
+    refused = sorted(set(options) - set(REMOTE_OPTIONS))
+    if refused:
+        raise ValueError(f"Workers do not accept the option {refused[0]!r}.")
+    blocks = apply_overrides(request["blocks"], request.get("overrides", []))
+    for block in flatten_diagram(blocks, request["wires"])[0]:
+        if block["type"] in LOCAL_IO_TYPES:
+            raise ValueError(f"Workers do not run {block['type']} blocks such as {block['name']}.")
+        if block["type"] == "SCOPE" and block["properties"].get("Stream To"):
+            raise ValueError(f"Workers do not stream to disk; clear Stream To on {block['name']}.")
+    return blocks, options
+
+
+def sweep_grid(parameters):
+    """
+    Every combination of the values given for each parameter.
+
+    parameters maps (block name, property, index) tuples to lists of values.
+    Returns a list of override lists for run_sweep.
+    """
+    keys = list(parameters)
+    return [
+        [(*key, value) for key, value in zip(keys, values)]
+        for values in itertools.product(*(parameters[key] for key in keys))
+    ]
+
+
+class _WorkerHandler(socketserver.BaseRequestHandler):
+    """Runs the jobs sent over one coordinator connection, one at a time."""
+
+    def handle(self):
+        from backend.simulate import run_bdsim_simulation
+
+        send_message(self.request, {"type": "hello", "protocol": PROTOCOL_VERSION, "host": socket.gethostname()})
+        while True:
+            try:
+                request, _ = receive_message(self.request, max_payload_size=0)  # Requests carry no payload
+            except (ConnectionError, OSError, ValueError):
+                return
+            if request is None:
+                return
+            if request.get("type") != "run":
+                send_message(self.request, {"type": "error", "error": f"Unknown request {request.get('type')!r}."})
+                continue
+            started = time.perf_counter()
+            reply = {"type": "result", "job": request["job"]}
+            payload = b""
+            try:
+                blocks, options = check_request(request)
+                results = run_bdsim_simulation(blocks, request["wires"], T=request["T"], graphics=False, **options)
+                if results is None:
+                    raise RuntimeError("Simulation failed.")
+                payload, reply["scopes"] = encode_results(results)
+                reply["status"] = "done"
+            except Exception as e:
+                reply.update({"status": "failed", "error": str(e)})
+            reply["elapsed"] = time.perf_counter() - started
+            send_message(self.request, reply, payload)
+
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    """
+    Worker daemon that runs simulations for sweep coordinators over TCP.
+
+    Each connection is served on its own thread, but runs its jobs one at
+    a time. Start one daemon per core to use several cores, on localhost
+    or on each compute node.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=DEFAULT_WORKER_ADDRESS):
+        super().__init__(parse_address(address), _WorkerHandler)
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+
+class SweepJob:
+    """One point of a sweep and what became of it."""
+
+    def __init__(self, index, overrides):
+        self.index = index
+        self.overrides = overrides
+        self.attempts = 0
+        self.results = None
+        self.error = None
+        self.worker = None  # Address of the worker that finished it
+        self.elapsed = None
+
+
+class SweepCoordinator:
+    """
+    Hands the jobs of a sweep to TCP workers, with work stealing and retries.
+
+    Jobs are dealt out to one queue per worker up front. Each worker takes
+    jobs from the front of its own queue and, once that is empty, steals
+    from the back of the longest other queue, so fast workers end up doing
+    more of the sweep and jobs left behind by a lost worker still run. A
+    job that fails, or whose worker disconnects, is queued again on another
+    worker until it has been tried max_retries more times.
+    """
+
+    def __init__(self, blocks, wires, T, jobs, workers, options=None, max_retries=MAX_RETRIES,
+                 job_timeout=None, progress=None):
+        self.blocks, self.wires = flatten_diagram(blocks, wires)
+        self.T = T
+        self.jobs = jobs
+        self.workers = list(workers)
+        self.options = options or {}  # Further run_bdsim_simulation arguments
+        self.max_retries = max_retries
+        self.job_timeout = job_timeout
+        self.progress = progress  # Optional callback(finished job, jobs finished, total jobs)
+        self.queues = {address: deque() for address in self.workers}
+        for i, job in enumerate(jobs):
+            self.queues[self.workers[i % len(self.workers)]].append(job)
+        self.lock = threading.Lock()
+        self.finished = 0
+        self.steals = 0
+        self.lost_workers = {}  # Address -> why it was dropped
+
+    def next_job(self, address):
+        """Next job for a worker: its own, or one stolen from the busiest other worker."""
+        with self.lock:
+            own = self.queues[address]
+            if own:
+                return own.popleft()
+            victims = [queue for worker, queue in self.queues.items() if worker != address and queue]
+            if not victims:
+                return None
+            self.steals += 1
+            return max(victims, key=len).pop()
+
+    def requeue(self, job, failed_address):
+        """Queue a failed job again, on the least busy other worker if there is one."""
+        with self.lock:
+            others = [worker for worker in self.queues if worker != failed_address and worker not in self.lost_workers]
+            target = min(others, key=lambda worker: len(self.queues[worker])) if others else failed_address
+            self.queues[target].append(job)
+
+    def complete(self, job):
+        with self.lock:
+            self.finished += 1
+            finished = self.finished
+        if self.progress is not None:
+            self.progress(job, finished, len(self.jobs))
+
+    def fail(self, job, address, error):
+        """Record a failed attempt, queueing the job again if it has attempts left."""
+        job.error = error
+        if job.attempts <= self.max_retries:
+            self.requeue(job, address)
+        else:
+            self.complete(job)
+
+    def serve(self, address):
+        """Feed one worker until there is no work left or the worker is lost."""
+        job = None
+        try:
+            with socket.create_connection(parse_address(address), timeout=CONNECT_TIMEOUT) as sock:
+                sock.settimeout(self.job_timeout)
+                hello, _ = receive_message(sock)
+                if hello is None or hello.get("protocol") != PROTOCOL_VERSION:
+                    raise ConnectionError(f"{address} does not speak sweep protocol {PROTOCOL_VERSION}.")
+                while True:
+                    job = self.next_job(address)
+                    if job is None:
+                        return
+                    job.attempts += 1
+                    send_message(sock, {
+                        "type": "run", "job": job.index, "blocks": self.blocks, "wires": self.wires,
+                        "T": self.T, "overrides": job.overrides, "options": self.options,
+                    })
+                    reply, payload = receive_message(sock)
+                    if reply is None:
+                        raise ConnectionError(f"{address} closed the connection.")
+                    if reply.get("status") == "done":
+                        job.results = decode_results(payload, reply["scopes"])
+                        job.error = None
+                        job.worker = address
+                        job.elapsed = reply.get("elapsed")
+                        self.complete(job)
+                    else:
+                        self.fail(job, address, reply.get("error", "Unknown error."))
+                    job = None
+        except (OSError, ConnectionError, ValueError) as e:
+            # The worker is gone: retry its job in flight; the jobs still queued for it get stolen
+            with self.lock:
+                self.lost_workers[address] = str(e)
+            if job is not None:
+                self.fail(job, address, f"Lost worker {address}: {e}")
+
+    def run(self):
+        """Run every job; returns them once each has finished or run out of attempts."""
+        while True:
+            threads = [
+                threading.Thread(target=self.serve, args=(address,), name=f"sweep {address}", daemon=True)
+                for address in self.workers if address not in self.lost_workers
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            remaining = sum(len(queue) for queue in self.queues.values())
+            if not remaining or len(self.lost_workers) == len(self.workers):
+                break
+            # Jobs were requeued on a worker after its thread had stopped; go round again
+        lost = "; ".join(f"{address}: {error}" for address, error in self.lost_workers.items())
+        for job in itertools.chain.from_iterable(self.queues.values()):
+            job.error = job.error or f"No worker left to run it ({lost})."
+        return self.jobs
+
+
+def run_sweep(blocks, wires, T, points, workers, options=None, max_retries=MAX_RETRIES, job_timeout=None,
+              progress=None):
+    """
+    Simulate a diagram once per set of parameter overrides on TCP workers.
+
+    blocks, wires: Diagram as returned by get_blocks_and_wires.
+     points: One list of (block name, property, index, value) overrides per
+      run, e.g. from sweep_grid. Names of blocks inside subsystems carry
+      their "<subsystem>/" prefix.
+     workers: "host:port" addresses of running WorkerServers.
+     options: Further run_bdsim_simulation arguments, among REMOTE_OPTIONS.
+     max_retries: Further attempts at a run after it fails or its worker is lost.
+     job_timeout: Seconds to wait for one run before giving up on its worker.
+     progress: Optional callback(job, finished, total) as each run finishes.
+
+    Returns the SweepJobs in the order of points, each with "results" (the
+    "t" and "scopes" arrays) or an "error".
+    """
+    if not workers:
+        raise ValueError("Give at least one worker address.")
+    check_request({"blocks": blocks, "wires": wires, "options": options})  # Fail here, not once per run
+    jobs = [SweepJob(i, [list(override) for override in overrides]) for i, overrides in enumerate(points)]
+    coordinator = SweepCoordinator(blocks, wires, T, jobs, workers, options, max_retries, job_timeout, progress)
+    return coordinator.run()
+
+
+def format_sweep_report(jobs):
+    """Summarize a finished sweep as text."""
+    done = [job for job in jobs if job.results is not None]
+    lines = [f"{len(done)} of {len(jobs)} runs succeeded"]
+    by_worker = {}
+    for job in done:
+        by_worker[job.worker] = by_worker.get(job.worker, 0) + 1
+    for worker, count in sorted(by_worker.items()):
+        lines.append(f"  {worker}: {count} runs")
+    for job in jobs:
+        if job.results is None:
+            lines.append(f"  run {job.index} failed after {job.attempts} attempts: {job.error}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Start workers, one per core, then sweep from any machine that can reach them:
+    #   python -m backend.distributed worker --bind 0.0.0.0:9900
+    #   python -m backend.distributed sweep plant.json -w node1:9900 -w node2:9900 \
+    #       -p GAIN1.Gain 0.5 1 2 -p LTI1.Denominator[0] 0.1 1 -o results
+    import argparse
+    import os
+    import re
+
+    parser = argparse.ArgumentParser(description="Distributed parameter sweeps over TCP workers.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker_parser = commands.add_parser("worker", help="Run a worker daemon")
+    worker_parser.add_argument("--bind", default=DEFAULT_WORKER_ADDRESS, help="host:port to listen on")
+    sweep_parser = commands.add_parser("sweep", help="Sweep parameters of a saved diagram")
+    sweep_parser.add_argument("diagram", help="Diagram file (.json or compact .bdz)")
+    sweep_parser.add_argument("-w", "--worker", action="append", required=True, help="Worker host:port")
+    sweep_parser.add_argument("-p", "--parameter", nargs="+", action="append", default=[],
+                              metavar=("PARAMETER", "VALUE"),
+                              help="Parameter such as GAIN1.Gain or LTI1.Denominator[0], then its values")
+    sweep_parser.add_argument("-T", type=float, default=5, help="Simulation time")
+    sweep_parser.add_argument("--step", type=float, help="Fixed integration step")
+    sweep_parser.add_argument("--retries", type=int, default=MAX_RETRIES)
+    sweep_parser.add_argument("--timeout", type=float, help="Seconds allowed per run")
+    sweep_parser.add_argument("-o", "--output", help="Write run_<n>.npz files and a sweep.csv index here")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        server = WorkerServer(args.bind)
+        print(f"Worker listening on {server.address}")
+        server.serve_forever()
+    else:
+        from GUI.diagram_file import load_diagram
+
+        grid = {}
+        for name, *values in args.parameter:
+            match = re.fullmatch(r"(.+)\.([^.\[]+)(?:\[(\d+)\])?", name)
+            if not match or not values:
+                sweep_parser.error(f"expected PARAMETER VALUE..., got {name!r}")
+            index = int(match.group(3)) if match.group(3) else None
+            grid[(match.group(1), match.group(2), index)] = [float(value) for value in values]
+
+        diagram = load_diagram(args.diagram)
+        jobs = run_sweep(
+            diagram["blocks"], diagram["wires"], args.T, sweep_grid(grid), args.worker,
+            options={"step": args.step} if args.step else None, max_retries=args.retries,
+            job_timeout=args.timeout,
+            progress=lambda job, finished, total: print(f"{finished}/{total} runs finished"),
+        )
+        print(format_sweep_report(jobs))
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+            labels = [parameter_label(key) for key in grid]
+            with open(os.path.join(args.output, "sweep.csv"), "w") as index_file:
+                index_file.write(",".join(["run"] + labels + ["file", "error"]) + "\n")
+                for job in jobs:
+                    file_name = f"run_{job.index:04d}.npz" if job.results is not None else ""
+                    if file_name:
+                        arrays = {"t": job.results["t"], **job.results["scopes"]}
+                        np.savez_compressed(os.path.join(args.output, file_name), **arrays)
+                    values = [f"{override[3]:g}" for override in job.overrides]
+                    error = (job.error or "").replace(",", ";") if job.results is None else ""
+                    index_file.write(",".join([str(job.index)] + values + [file_name, error]) + "\n")
@@ -0,0 +1,214 @@
+import socket
+import struct
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+from bdsim.components import SourceBlock
+
+TRANSPORTS = ("udp", "shm")
+DEFAULT_UDP_ADDRESS = "127.0.0.1:9870"
+RING_HEADER = struct.Struct("<QQQ")  # Write count, samples per slot, number of slots
+RING_HEADER_SIZE = 64  # Header space reserved at the start of a ring, so slots stay aligned
+_created_rings = set()  # Names of rings created by this process, which its resource tracker unlinks
+
+
+def parse_udp_address(address):
+    """Split "host:port" into a (host, port) tuple for a socket."""
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Expected a UDP address like {DEFAULT_UDP_ADDRESS}, got {address!r}.")
+    return host, int(port)
+
+
+class UdpChannel:
+    """
+    Non-blocking UDP endpoint exchanging fixed-width float64 samples.
+
+    Each datagram carries one sample of `width` little-endian doubles. Both
+    directions go through buffers allocated once, so no memory is allocated
+    per sample. Datagrams are received into a scratch buffer one byte longer
+    than a sample, so ones of the wrong size can be told apart and dropped
+    without touching the last good sample.
+    """
+
+    def __init__(self, address, width, receive=False):
+        self.address = parse_udp_address(address)
+        self.buffer = np.zeros(width, dtype="<f8")
+        self.view = memoryview(self.buffer).cast("B")
+        self.scratch = bytearray(len(self.view) + 1)
+        self.sample = memoryview(self.scratch)[:len(self.view)]
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        if receive:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(self.address)
+
+    def receive_latest(self):
+        """Drain waiting datagrams, keeping the newest whole sample; return True if one arrived."""
+        received = False
+        while True:
+            try:
+                size = self.socket.recv_into(self.scratch)
+            except (BlockingIOError, InterruptedError):
+                break
+            if size == len(self.view):
+                self.view[:] = self.sample
+                received = True
+        return received
+
+    def send(self, value):
+        """Send one sample to the peer, dropping it if the socket would block."""
+        np.copyto(self.buffer, value, casting="unsafe")
+        try:
+            self.socket.sendto(self.view, self.address)
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def close(self):
+        self.socket.close()
+
+
+class SharedMemoryRing:
+    """
+    Single-writer ring buffer of float64 samples in named shared memory.
+
+    The header holds the number of samples written so far, followed by the
+    slot width and count so either side can attach first. The writer fills
+    slot count % slots and then bumps the count. A reader takes the newest
+    slot and checks the count again, so it can tell if the writer wrapped
+    round and overwrote the slot while it was being read.
+    """
+
+    def __init__(self, name, width, slots=1024):
+        try:
+            self.memory = shared_memory.SharedMemory(
+                name=name, create=True, size=RING_HEADER_SIZE + width * slots * 8
+            )
+            self.owner = True
+            _created_rings.add(self.memory._name)
+            RING_HEADER.pack_into(self.memory.buf, 0, 0, width, slots)
+        except FileExistsError:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+            # Only the creator should unlink it; stop Python's tracker doing so at exit,
+            # unless the creator is in this process and shares the tracker's entry
+            if self.memory._name not in _created_rings:
+                resource_tracker.unregister(self.memory._name, "shared_memory")
+            _, ring_width, slots = RING_HEADER.unpack_from(self.memory.buf, 0)
+            if ring_width != width:
+                self.memory.close()
+                raise ValueError(f"Shared memory {name} holds {ring_width}-wide samples, not {width}.")
+
+        self.slots = slots
+        self.count = np.ndarray((1,), dtype="<u8", buffer=self.memory.buf)
+        self.ring = np.ndarray((slots, width), dtype="<f8", buffer=self.memory.buf, offset=RING_HEADER_SIZE)
+        self.buffer = np.zeros(width, dtype="<f8")
+        self.read = 0  # Count at the last successful read
+
+    def receive_latest(self):
+        """Copy the newest sample into the buffer; return True if it is new."""
+        count = int(self.count[0])
+        if count == self.read:
+            return False
+        np.copyto(self.buffer, self.ring[(count - 1) % self.slots])
+        if int(self.count[0]) - count >= self.slots - 1:
+            return False  # Overwritten while copying; try again next time
+        self.read = count
+        return True
+
+    def send(self, value):
+        """Append one sample to the ring."""
+        count = int(self.count[0])
+        np.copyto(self.ring[count % self.slots], value, casting="unsafe")
+        self.count[0] = count + 1
+
+    def close(self):
+        # Views into the buffer must go before the memory can be closed
+        del self.count, self.ring
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+            _created_rings.discard(self.memory._name)
+
+
+def open_channel(transport, address, width, slots=1024, receive=False):
+    """Open a UDP or shared-memory channel for one external signal."""
+    if transport == "udp":
+        return UdpChannel(address, width, receive=receive)
+    if transport == "shm":
+        return SharedMemoryRing(address, width, slots)
+    raise ValueError(f"Unknown transport {transport!r}, expected one of {', '.join(TRANSPORTS)}.")
+
+
+class ExternalSource(SourceBlock):
+    """
+    Source whose output is the latest sample received from a UDP socket or
+    shared-memory ring, held until a newer one arrives.
+
+    The channel is opened when the simulation starts and polled without
+    blocking every time the block is evaluated. A new output array is only
+    made when a sample arrives, because downstream blocks may keep it.
+    """
+    nin = 0
+    nout = 1
+
+    def __init__(self, transport="udp", address=DEFAULT_UDP_ADDRESS, width=1, initial=0, slots=1024, **blockargs):
+        super().__init__(**blockargs)
+        self.transport = transport
+        self.address = address
+        self.width = int(width)
+        self.slots = int(slots)
+        self.channel = None
+        self.value = self._output_value(np.full(self.width, initial, dtype=float))
+
+    def _output_value(self, samples):
+        return float(samples[0]) if self.width == 1 else samples.copy()
+
+    def start(self, simstate=None):
+        self.channel = open_channel(self.transport, self.address, self.width, self.slots, receive=True)
+
+    def output(self, t, inports, x):
+        if self.channel is not None and self.channel.receive_latest():
+            self.value = self._output_value(self.channel.buffer)
+        return [self.value]
+
+    def done(self, **kwargs):
+        self.close()
+
+    def close(self):
+        """Release the channel; safe to call more than once."""
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+
+class Publisher:
+    """
+    Sends every recorded sample of a watched signal to an external channel.
+
+    Used in place of one of bdsim's watch lists, which are appended to after
+    every integration step, so the peer sees each step as it is computed.
+    The channel is opened on the first sample.
+    """
+
+    def __init__(self, transport, address, width=1, slots=1024):
+        self.settings = (transport, address, int(width), int(slots))
+        self.channel = None
+        self.sent = 0
+
+    def __len__(self):
+        return self.sent
+
+    def __array__(self, dtype=None, copy=None):
+        return np.empty(0, dtype=dtype or np.float64)
+
+    def append(self, value):
+        if self.channel is None:
+            self.channel = open_channel(*self.settings)
+        self.channel.send(value)
+        self.sent += 1
+
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
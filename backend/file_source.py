@@ -0,0 +1,172 @@
+import os
+import zipfile
+
+import numpy as np
+from bdsim.components import SourceBlock
+
+from backend.streaming import StreamRecorder
+
+INTERPOLATIONS = ("linear", "hold")
+CSV_CHUNK_ROWS = 65536  # Rows parsed at a time when converting a CSV
+CSV_CACHE_SUFFIX = ".cache.npy"
+MAX_INDEX_BUCKETS = 1 << 20  # Size cap of the time lookup table for irregular sampling
+
+
+def _memmap_npz_member(path, member):
+    """Memory-map an array stored uncompressed in an .npz, or return None if it is compressed."""
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(member)
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+    with open(path, "rb") as file:
+        # The local file header is 30 bytes plus the name and extra fields
+        file.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(file.read(4), dtype="<u2")
+        file.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+        if np.lib.format.read_magic(file) == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+        offset = file.tell()
+    order = "F" if fortran_order else "C"
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape, order=order, offset=offset)
+
+
+def _csv_to_npy(path, cache_path):
+    """Convert a numeric CSV to .npy a chunk at a time, skipping any header lines."""
+    recorder = StreamRecorder(cache_path, CSV_CHUNK_ROWS)
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            fields = line.replace(";", ",").split(",")
+            try:
+                recorder.append([float(field) for field in fields])
+            except ValueError:
+                if len(recorder):
+                    raise ValueError(f"Non-numeric row in {path}: {line.strip()!r}")
+                # Header lines before the data are skipped
+    recorder.close()
+    if not len(recorder):
+        raise ValueError(f"No numeric rows in {path}.")
+
+
+def load_recording(path):
+    """
+    Open a recorded time series as memory-mapped (t, y) arrays.
+
+    .npy files hold a 2-D array with time in column 0 and one signal per
+    further column. .npz files hold arrays named "t" and "y". CSV files use
+    the .npy column layout and are converted once to a cached .npy next to
+    them, which is reused until the CSV changes. So are compressed .npz files,
+    whose members cannot be memory-mapped.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npz":
+        t = _memmap_npz_member(path, "t.npy")
+        y = _memmap_npz_member(path, "y.npy")
+        if t is None or y is None:
+            cache_path = path + CSV_CACHE_SUFFIX
+            if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+                with np.load(path) as data:
+                    np.save(cache_path, np.column_stack([data["t"], data["y"]]))
+            path, extension = cache_path, ".npy"
+        else:
+            return np.asarray(t), np.asarray(y)
+
+    if extension == ".csv":
+        cache_path = path + CSV_CACHE_SUFFIX
+        if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+            _csv_to_npy(path, cache_path)
+        path = cache_path
+
+    data = np.load(path, mmap_mode="r")
+    if data.ndim != 2 or data.shape[1] < 2:
+        raise ValueError(f"{path} must hold a 2-D array with time in column 0 and signals after it.")
+    y = data[:, 1] if data.shape[1] == 2 else data[:, 1:]
+    return data[:, 0], y
+
+
+class RecordingIndex:
+    """
+    Finds the sample interval containing a time in O(1).
+
+    Uniformly sampled recordings are indexed arithmetically. Otherwise the
+    search starts from the previous answer, since solvers mostly move forward
+    in small steps, or else from a table of the last sample at or before each
+    of a fixed number of evenly spaced times.
+    """
+
+    def __init__(self, t):
+        self.t = t
+        self.n = len(t)
+        if self.n < 2:
+            raise ValueError("A recording needs at least two samples.")
+        self.t0 = float(t[0])
+        self.t_end = float(t[-1])
+        self.last = 0
+
+        # Check for uniform sampling a chunk at a time, so a large recording is never fully loaded
+        self.dt = (self.t_end - self.t0) / (self.n - 1)
+        self.uniform = self.dt > 0
+        for start in range(0, self.n - 1, CSV_CHUNK_ROWS):
+            diffs = np.diff(np.asarray(t[start:start + CSV_CHUNK_ROWS + 1]))
+            if (diffs < 0).any():
+                raise ValueError("Recording times must be increasing.")
+            if self.uniform and np.abs(diffs - self.dt).max() > 1e-9 * max(abs(self.dt), 1.0):
+                self.uniform = False
+
+        if not self.uniform:
+            buckets = min(self.n, MAX_INDEX_BUCKETS)
+            self.bucket_width = (self.t_end - self.t0) / buckets
+            grid = self.t0 + self.bucket_width * np.arange(buckets)
+            self.table = np.searchsorted(t, grid, side="right") - 1
+
+    def locate(self, time):
+        """Return i with t[i] <= time < t[i + 1], clamped to 0..n-2."""
+        if time <= self.t0:
+            return 0
+        if time >= self.t_end:
+            return self.n - 2
+        if self.uniform:
+            return min(int((time - self.t0) / self.dt), self.n - 2)
+
+        t = self.t
+        i = self.last
+        if t[i] <= time < t[i + 1]:
+            return i
+        if t[i + 1] <= time < t[i + 2]:
+            self.last = i + 1
+            return i + 1
+
+        # Start from the last sample at or before the bucket's start time, and walk forward
+        bucket = min(int((time - self.t0) / self.bucket_width), len(self.table) - 1)
+        i = max(int(self.table[bucket]), 0)
+        while t[i + 1] <= time:
+            i += 1
+        self.last = i
+        return i
+
+
+class FromFile(SourceBlock):
+    """Source that plays back a recorded time series, interpolating between samples."""
+    nin = 0
+    nout = 1
+
+    def __init__(self, file, interpolation="linear", **blockargs):
+        super().__init__(**blockargs)
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation {interpolation!r}, expected one of {', '.join(INTERPOLATIONS)}.")
+        self.t, self.y = load_recording(file)
+        self.index = RecordingIndex(self.t)
+        self.interpolation = interpolation
+
+    def output(self, t, inports, x):
+        i = self.index.locate(t)
+        if self.interpolation == "hold" or t <= self.index.t0:
+            value = self.y[i if t < self.t[i + 1] else i + 1]
+        else:
+            t0 = self.t[i]
+            fraction = min((t - t0) / (self.t[i + 1] - t0), 1.0)
+            value = self.y[i] + (self.y[i + 1] - self.y[i]) * fraction
+        return [float(value) if np.ndim(value) == 0 else np.array(value)]
@@ -0,0 +1,402 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.optimize
+import scipy.signal
+import bdsim
+
+from backend.subsystem import flatten_diagram
+from backend.simulate import build_diagram
+from backend.file_source import load_recording
+from backend.realtime import fixed_step_options
+from backend.vectors import VectorStep, VectorRamp, VectorLTI, channel_values
+
+FIT_METHODS = ("least_squares", "differential_evolution")
+FIT_MAX_SAMPLES = 2000  # Measured samples the error is computed at; longer traces are thinned evenly
+FIT_STEPS = 1000  # Fixed integration steps per run unless a step is given
+FD_STEP = 1e-6  # Relative finite-difference step for the Jacobian
+FAILED_RESIDUAL = 1e6  # Error of each sample when a run fails, so the optimizer steers away
+
+# Numeric properties that can be fitted, by block type; lists are fitted per coefficient
+FITTABLE_PROPERTIES = {
+    "STEP": ("Amplitude", "Start Time"),
+    "GAIN": ("Gain",),
+    "CONSTANT": ("Value",),
+    "RAMP": ("Slope", "Start Time"),
+    "LTI": ("Numerator", "Denominator"),
+}
+
+
+class FitCancelled(Exception):
+    """Raised inside the optimizer to stop a fit that has been cancelled."""
+
+
+def fittable_parameters(blocks):
+    """
+    List every parameter of the diagram that can be fitted.
+
+    A parameter is a (block name, property, index) tuple, where index picks
+    a coefficient out of a list property and is None otherwise.
+    """
+    parameters = []
+    for block in blocks:
+        for prop in FITTABLE_PROPERTIES.get(block["type"], ()):
+            value = block["properties"].get(prop)
+            if isinstance(value, list):
+                parameters.extend((block["name"], prop, i) for i in range(len(value)))
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                parameters.append((block["name"], prop, None))
+    return parameters
+
+
+def parameter_label(parameter):
+    """Readable name of a parameter, e.g. "LTI1.Denominator[0]"."""
+    name, prop, index = parameter
+    return f"{name}.{prop}" if index is None else f"{name}.{prop}[{index}]"
+
+
+def get_parameter(properties, parameter):
+    """Current value of a parameter in a block's properties."""
+    _, prop, index = parameter
+    value = properties[prop]
+    return float(value if index is None else value[index])
+
+
+def set_parameter(properties, parameter, value):
+    """Set a parameter in a block's properties, copying list properties rather than editing them in place."""
+    _, prop, index = parameter
+    if index is None:
+        properties[prop] = value
+    else:
+        coefficients = list(properties[prop])
+        coefficients[index] = value
+        properties[prop] = coefficients
+
+
+def update_block(instance, block_type, properties):
+    """
+    Push a block's fittable properties into its compiled bdsim block.
+
+    Blocks build_diagram made for vector signals, see backend.vectors, are
+    given their properties in the same per-channel form.
+    """
+    if isinstance(instance, (VectorStep, VectorRamp)):
+        def value(prop, default):
+            return channel_values(properties.get(prop, default), len(instance.T))
+    else:
+        def value(prop, default):
+            return properties.get(prop, default)
+
+    if block_type == "STEP":
+        instance.T = value("Start Time", 0)
+        instance.on = value("Amplitude", 1)
+    elif block_type == "GAIN":
+        instance.K = properties.get("Gain", 1)
+    elif block_type == "CONSTANT":
+        instance.value = properties.get("Value", 0)
+    elif block_type == "RAMP":
+        instance.T = value("Start Time", 0)
+        instance.slope = value("Slope", 1)
+    elif block_type == "LTI":
+        # The number of states is fixed once compiled, so only the coefficients may change
+        A, B, C, D = scipy.signal.tf2ss(properties["Numerator"], properties["Denominator"])
+        if A.shape != instance.A.shape:
+            raise ValueError(f"Changing the order of {instance.name} needs the diagram to be rebuilt.")
+        if isinstance(instance, VectorLTI):
+            instance.A, instance.B, instance.C = A, B[:, 0], C[0]  # As VectorLTI.__init__ stores them
+        else:
+            instance.A, instance.B, instance.C, instance.D = A, B, C, D
+    else:
+        raise ValueError(f"{block_type} blocks have no fittable parameters.")
+
+
+def load_measured(measured, max_samples=FIT_MAX_SAMPLES):
+    """
+    Return measured (t, y) as in-memory arrays of at most max_samples samples.
+
+    measured is a recording file accepted by load_recording or a (t, y) pair.
+    Only the samples kept are read from a memory-mapped recording.
+    """
+    t, y = load_recording(measured) if isinstance(measured, str) else measured
+    if len(t) > max_samples:
+        keep = np.linspace(0, len(t) - 1, max_samples).round().astype(int)
+        t, y = t[keep], y[keep]
+    return np.array(t, dtype=float), np.array(y, dtype=float)
+
+
+class FitModel:
+    """
+    A diagram compiled once and re-simulated for each set of parameter values.
+
+    Only the blocks owning the fitted parameters are updated between runs,
+    so each evaluation costs one integration and no diagram building.
+    """
+
+    def __init__(self, blocks, wires, parameters, scope, t, T=None, step=None):
+        blocks, wires = flatten_diagram(blocks, wires)
+        # Private copies, as parameter values are written into them
+        self.blocks = {
+            block["name"]: {**block, "properties": dict(block["properties"])} for block in blocks
+        }
+        self.parameters = parameters
+        self.t = t
+        self.T = T or float(t[-1])
+        self.step = step or self.T / FIT_STEPS  # A fixed step keeps the error smooth in the parameters
+
+        self.sim = bdsim.BDSim(graphics=False, progress=False, hold=False, quiet=True, banner=False)
+        self.bd = self.sim.blockdiagram()
+        self.instances = build_diagram(self.bd, blocks, wires)
+        sources = [wire for wire in wires if wire["end"] == scope]
+        if not sources:
+            raise ValueError(f"No signal is wired to {scope}.")
+        self.watch = [self.instances[sources[0]["start"]][sources[0].get("start_port_index", 0)]]
+        self.bd.compile()
+
+    def initial_values(self):
+        return np.array([get_parameter(self.blocks[p[0]]["properties"], p) for p in self.parameters])
+
+    def simulate(self, values):
+        """Run the diagram with the given parameter values and return the scope signal at the measured times."""
+        changed = set()
+        for parameter, value in zip(self.parameters, values):
+            set_parameter(self.blocks[parameter[0]]["properties"], parameter, float(value))
+            changed.add(parameter[0])
+        for name in changed:
+            block = self.blocks[name]
+            update_block(self.instances[name], block["type"], block["properties"])
+
+        results = self.sim.run(
+            self.bd, T=self.T, block=False, watch=self.watch,
+            **fixed_step_options(self.step),
+        )
+        t = np.asarray(results.t)
+        y = np.asarray(results.y0, dtype=float).reshape(len(t), -1)
+        return np.column_stack([np.interp(self.t, t, column) for column in y.T])
+
+
+# Set up in each worker process by _init_worker
+_model = None
+_measured = None
+
+
+def _init_worker(problem, measured):
+    global _model, _measured
+    _model = FitModel(**problem)
+    _measured = measured.reshape(len(measured), -1)
+
+
+def _residuals(values):
+    """
+    Simulated minus measured signal, and None or a description of why the run failed.
+
+    Every sample of a failed run is set to FAILED_RESIDUAL; failures are
+    counted by fit_parameters rather than reported from the worker.
+    """
+    point = [float(value) for value in values]
+    try:
+        residuals = (_model.simulate(values) - _measured).ravel()
+    except Exception as e:
+        return np.full(_measured.size, FAILED_RESIDUAL), f"Simulation failed at {point}: {e}"
+    if not np.all(np.isfinite(residuals)):
+        return np.full(_measured.size, FAILED_RESIDUAL), f"Simulation diverged at {point}."
+    return residuals, None
+
+
+def _cost(values):
+    residuals, failure = _residuals(values)
+    return float(np.sum(residuals ** 2)), failure
+
+
+def fit_parameters(blocks, wires, parameters, scope, measured, T=None, step=None, bounds=None,
+                   method="least_squares", workers=None, max_evaluations=2000, run=None, progress=None):
+    """
+    Fit block parameters so a SCOPE's input signal matches a measured trace.
+
+    blocks, wires: Diagram as returned by get_blocks_and_wires.
+     parameters: (block name, property, index) tuples from fittable_parameters.
+     scope: Name of the SCOPE whose input signal is compared.
+     measured: Recording file or (t, y) arrays; see load_measured.
+     T: Simulation time, the end of the measured trace by default.
+     step: Fixed integration step, T / FIT_STEPS by default.
+     bounds: Optional (lower, upper) pair per parameter; None for either means unbounded.
+      differential_evolution needs finite bounds on every parameter.
+     method: "least_squares" refines the current values; "differential_evolution"
+      searches the whole bounded region.
+     workers: Number of worker processes, one per CPU by default.
+     max_evaluations: Rough limit on the number of simulations.
+     run: Optional SimulationRun; cancelling it stops the fit with FitCancelled.
+     progress: Optional callback(evaluations, rms_error) after each batch of runs.
+
+    Each worker process compiles the diagram once and is then only sent
+    parameter values. least_squares evaluates the finite-difference
+    Jacobian's columns in parallel; differential_evolution evaluates each
+    generation in parallel.
+
+    Returns a dict with the fitted "values", the "initial" values, the RMS
+    error before and after ("initial_error", "error"), the number of
+    "evaluations", how many of them failed ("failures") with the reason for
+    the first one ("first_failure", None if none did), and the optimizer's
+    "success" and "message".
+    """
+    if method not in FIT_METHODS:
+        raise ValueError(f"Unknown fit method {method!r}, expected one of {', '.join(FIT_METHODS)}.")
+    if not parameters:
+        raise ValueError("Choose at least one parameter to fit.")
+
+    t, y = load_measured(measured)
+    problem = {
+        "blocks": blocks, "wires": wires, "parameters": parameters, "scope": scope,
+        "t": t, "T": T, "step": step,
+    }
+    # Built here too, so a diagram that cannot be simulated fails before any processes start
+    x0 = FitModel(**problem).initial_values()
+
+    lower = np.array([-np.inf if b is None or b[0] is None else b[0] for b in bounds or [None] * len(x0)], dtype=float)
+    upper = np.array([np.inf if b is None or b[1] is None else b[1] for b in bounds or [None] * len(x0)], dtype=float)
+    x0 = np.clip(x0, lower, upper)
+
+    evaluations = 0
+    failures = 0
+    first_failure = None
+
+    def collect(results):
+        """Split worker results into values and failures, counting the failures."""
+        nonlocal evaluations, failures, first_failure
+        values = []
+        for value, failure in results:
+            values.append(value)
+            if failure is not None:
+                failures += 1
+                first_failure = first_failure or failure
+        evaluations += len(values)
+        return values
+
+    def evaluate(points):
+        """Residuals at several points, computed in parallel."""
+        if run is not None and run.cancelled:
+            raise FitCancelled()
+        residuals = collect(executor.map(_residuals, points))
+        if progress is not None:
+            progress(evaluations, min(np.sqrt(np.mean(r ** 2)) for r in residuals))
+        return residuals
+
+    # Spawned rather than forked, as the GUI process has threads running
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=(problem, y)) as executor:
+        initial = evaluate([x0])[0]
+
+        if method == "least_squares":
+            last = {"x": x0, "f": initial}  # least_squares asks for the residuals, then the Jacobian, at each point
+
+            def residuals(x):
+                if not np.array_equal(x, last["x"]):
+                    last["x"], last["f"] = x.copy(), evaluate([x])[0]
+                return last["f"]
+
+            def jacobian(x):
+                f0 = residuals(x)
+                steps = FD_STEP * np.maximum(np.abs(x), 1.0)
+                steps[x + steps > upper] *= -1  # Step backwards at an upper bound
+                points = [x + np.eye(len(x))[i] * steps[i] for i in range(len(x))]
+                columns = [(f - f0) / h for f, h in zip(evaluate(points), steps)]
+                return np.column_stack(columns)
+
+            result = scipy.optimize.least_squares(
+                residuals, x0, jac=jacobian, bounds=(lower, upper),
+                max_nfev=max(1, max_evaluations // (len(x0) + 1)),
+            )
+        else:
+            if not (np.all(np.isfinite(lower)) and np.all(np.isfinite(upper))):
+                raise ValueError("differential_evolution needs lower and upper bounds on every parameter.")
+
+            def generation(function, points):
+                if run is not None and run.cancelled:
+                    raise FitCancelled()
+                costs = collect(executor.map(function, points))
+                if progress is not None:
+                    progress(evaluations, np.sqrt(min(costs) / y.size))
+                return costs
+
+            population = 15 * len(x0)
+            result = scipy.optimize.differential_evolution(
+                _cost, list(zip(lower, upper)), x0=x0, workers=generation, updating="deferred",
+                maxiter=max(1, max_evaluations // population - 1), polish=False,
+            )
+
+        final = evaluate([result.x])[0]
+
+    return {
+        "parameters": parameters,
+        "values": [float(value) for value in result.x],
+        "initial": [float(value) for value in x0],
+        "initial_error": float(np.sqrt(np.mean(initial ** 2))),
+        "error": float(np.sqrt(np.mean(final ** 2))),
+        "evaluations": evaluations,
+        "failures": failures,
+        "first_failure": first_failure,
+        "success": bool(result.success),
+        "message": str(result.message),
+    }
+
+
+def apply_fit(blocks, parameters, values):
+    """Write fitted values into the properties of the named blocks."""
+    by_name = {block["name"]: block for block in blocks}
+    for parameter, value in zip(parameters, values):
+        set_parameter(by_name[parameter[0]]["properties"], parameter, value)
+
+
+def format_fit_report(result):
+    """Describe a fit result as text."""
+    lines = [
+        f"RMS error {result['initial_error']:.6g} -> {result['error']:.6g} "
+        f"after {result['evaluations']} simulations",
+        result["message"],
+    ]
+    if result["failures"]:
+        lines.append(f"{result['failures']} simulations failed, first: {result['first_failure']}")
+    for parameter, before, after in zip(result["parameters"], result["initial"], result["values"]):
+        lines.append(f"  {parameter_label(parameter)}: {before:.6g} -> {after:.6g}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Fit parameters of a saved diagram to a recording and save the fitted diagram:
+    #   python -m backend.fitting plant.json measured.csv --scope SCOPE1 -p GAIN1.Gain -p LTI1.Denominator[0]
+    import argparse
+    from GUI.diagram_file import load_diagram, save_diagram
+
+    parser = argparse.ArgumentParser(description="Fit block parameters of a saved diagram to a recording.")
+    parser.add_argument("diagram", help="Diagram file (.json or compact .bdz)")
+    parser.add_argument("measured", help="Recording (.npy, .npz or .csv) with time in the first column")
+    parser.add_argument("--scope", required=True, help="SCOPE whose input should match the recording")
+    parser.add_argument("-p", "--parameter", action="append", default=[],
+                        help="Parameter to fit, e.g. GAIN1.Gain or LTI1.Denominator[0]; all if omitted")
+    parser.add_argument("--method", choices=FIT_METHODS, default="least_squares")
+    parser.add_argument("--bounds", type=float, nargs=2, metavar=("LOW", "HIGH"),
+                        help="Bounds applied to every parameter")
+    parser.add_argument("--workers", type=int, help="Worker processes")
+    parser.add_argument("--step", type=float, help="Fixed integration step")
+    parser.add_argument("-o", "--output", help="Save the fitted diagram here")
+    args = parser.parse_args()
+
+    diagram = load_diagram(args.diagram)
+    # Fitted values are written back, so only top-level blocks are offered
+    available = {parameter_label(p): p for p in fittable_parameters(diagram["blocks"])}
+    chosen = []
+    for label in args.parameter or available:
+        if label not in available:
+            parser.error(f"unknown parameter {label!r}; choose from {', '.join(available)}")
+        chosen.append(available[label])
+
+    result = fit_parameters(
+        diagram["blocks"], diagram["wires"], chosen, args.scope, args.measured, step=args.step,
+        bounds=[tuple(args.bounds)] * len(chosen) if args.bounds else None,
+        method=args.method, workers=args.workers,
+        progress=lambda count, error: print(f"{count} simulations, RMS error {error:.6g}"),
+    )
+    print(format_fit_report(result))
+    if args.output:
+        apply_fit(diagram["blocks"], chosen, result["values"])
+        save_diagram(args.output, diagram)
@@ -0,0 +1,219 @@
+import warnings
+
+import numpy as np
+import scipy.signal
+
+from backend.subsystem import flatten_diagram, SINK_TYPES
+
+SOURCE_TYPES = ("STEP", "RAMP", "WAVEFORM", "CONSTANT", "FROM_FILE", "EXT_SOURCE")
+FREQUENCY_POINTS = 1000
+DEFAULT_BAND = (1e-2, 1e2)  # rad/s, used when the system has no nonzero poles or zeros
+
+
+def signal_model(blocks, wires):
+    """
+    Linear model of every signal in a diagram, without choosing an input or output.
+
+    Every block output is a signal y, related by y = W y + Cx x + E r, where
+    W holds the gains and sums and the direct feedthrough of LTI blocks, x
+    stacks the states of all LTI blocks and r is an input added to one of
+    the signals. Solving that for y closes every loop in the diagram at once,
+    giving y = S (Cx x + E r) with S = (I - W)^-1, and x' = A x + Bu y.
+
+    blocks and wires must already be flattened. Only GAIN, SUM and LTI
+    blocks may lie between sources and sinks; sources contribute nothing.
+    Returns a dict with the signal "index" by block name and the matrices
+    "A" (open loop), "Bu", "Cx" and "S".
+    """
+    by_name = {block["name"]: block for block in blocks}
+    signals = [block["name"] for block in blocks if block["type"] not in SINK_TYPES]
+    index = {name: i for i, name in enumerate(signals)}
+    inputs = {name: [] for name in signals}  # Wires into each block, as (source signal, port)
+    for wire in wires:
+        if wire["end"] in inputs:
+            inputs[wire["end"]].append((index[wire["start"]], wire.get("end_port_index", 0)))
+
+    # State-space form of each LTI block
+    realizations = {}
+    n_states = 0
+    for name in signals:
+        block = by_name[name]
+        if block["type"] == "LTI":
+            numerator = block["properties"].get("Numerator", [1])
+            denominator = block["properties"].get("Denominator", [1, 1])
+            if len(np.trim_zeros(numerator, "f")) > len(np.trim_zeros(denominator, "f")):
+                raise ValueError(f"{name} is improper: its numerator has a higher order than its denominator.")
+            A, B, C, D = scipy.signal.tf2ss(numerator, denominator)
+            realizations[name] = (n_states, A, B, C, D)
+            n_states += A.shape[0]
+
+    n = len(signals)
+    W = np.zeros((n, n))
+    Cx = np.zeros((n, n_states))
+    A_all = np.zeros((n_states, n_states))
+    Bu = np.zeros((n_states, n))  # States driven by signals
+
+    for name in signals:
+        block = by_name[name]
+        block_type = block["type"]
+        properties = block["properties"]
+        k = index[name]
+        if block_type == "GAIN":
+            for j, _ in inputs[name]:
+                W[k, j] += properties.get("Gain", 1)
+        elif block_type == "SUM":
+            signs = properties.get("Inputs", "+-")
+            for j, port in inputs[name]:
+                if port >= len(signs):
+                    raise ValueError(f"{name} has no input port {port} for signs {signs!r}.")
+                W[k, j] += 1 if signs[port] == "+" else -1
+        elif block_type == "LTI":
+            first, A, B, C, D = realizations[name]
+            states = slice(first, first + A.shape[0])
+            A_all[states, states] = A
+            Cx[k, states] = C[0]
+            for j, _ in inputs[name]:
+                Bu[states, j] += B[:, 0]
+                W[k, j] += D[0, 0]
+        elif block_type not in SOURCE_TYPES:
+            raise ValueError(f"{block_type} blocks are not supported in frequency-response analysis.")
+
+    loop = np.eye(n) - W
+    if np.linalg.cond(loop) > 1e12:
+        raise ValueError("The diagram has an algebraic loop with unit loop gain and no solution.")
+    return {"index": index, "A": A_all, "Bu": Bu, "Cx": Cx, "S": np.linalg.inv(loop)}
+
+
+def closed_loop_matrix(model):
+    """State matrix of the whole diagram with every loop closed."""
+    return model["A"] + model["Bu"] @ model["S"] @ model["Cx"]
+
+
+def linearize(blocks, wires, input_name, output_name):
+    """
+    State-space model (A, B, C, D) from one block's output to another's.
+
+    The input is a signal added to the output of input_name, usually a
+    source. The output is the output of output_name, or the signal feeding
+    it if it is a SCOPE or EXT_SINK. See signal_model.
+    """
+    blocks, wires = flatten_diagram(blocks, wires)
+    by_name = {block["name"]: block for block in blocks}
+    for name in (input_name, output_name):
+        if name not in by_name:
+            raise ValueError(f"No block named {name}.")
+
+    if by_name[output_name]["type"] in SINK_TYPES:
+        feeding = [wire for wire in wires if wire["end"] == output_name]
+        if not feeding:
+            raise ValueError(f"No signal is wired to {output_name}.")
+        output_name = feeding[0]["start"]
+    if by_name[input_name]["type"] in SINK_TYPES:
+        raise ValueError(f"{input_name} has no output to inject a signal into.")
+
+    model = signal_model(blocks, wires)
+    index, S, Cx, Bu = model["index"], model["S"], model["Cx"], model["Bu"]
+    E = np.zeros(len(index))
+    E[index[input_name]] = 1
+    out = index[output_name]
+    A = closed_loop_matrix(model)
+    B = (Bu @ S @ E).reshape(-1, 1)
+    C = (S[out] @ Cx).reshape(1, -1)
+    D = np.array([[S[out] @ E]])
+    return A, B, C, D
+
+
+def frequency_response(system, omega):
+    """
+    Complex response C (jw I - A)^-1 B + D at every angular frequency in omega.
+
+    The resolvent is solved for the whole grid in one batched call.
+    """
+    A, B, C, D = system
+    omega = np.asarray(omega, dtype=float)
+    if A.shape[0] == 0:
+        return np.full(omega.shape, complex(D[0, 0]))
+    resolvent = 1j * omega[:, None, None] * np.eye(A.shape[0]) - A
+    X = np.linalg.solve(resolvent, np.broadcast_to(B, (len(omega),) + B.shape))
+    return (C @ X)[:, 0, 0] + D[0, 0]
+
+
+def pole_zero(system):
+    """Return the zeros, poles and gain of the transfer function."""
+    A, B, C, D = system
+    if A.shape[0] == 0:
+        return np.empty(0, complex), np.empty(0, complex), float(D[0, 0])
+    with warnings.catch_warnings():
+        # Round-off leaves tiny leading numerator coefficients, which scipy warns about and trims
+        warnings.simplefilter("ignore", scipy.signal.BadCoefficients)
+        zeros, poles, gain = scipy.signal.ss2zpk(A, B, C, D)
+    return zeros, poles, float(np.real(gain))
+
+
+def frequency_grid(poles, zeros, points=FREQUENCY_POINTS):
+    """Logarithmic grid spanning a decade either side of the pole and zero frequencies."""
+    corners = np.abs(np.concatenate([poles, zeros]))
+    corners = corners[(corners > 1e-12) & np.isfinite(corners)]
+    if len(corners):
+        low = 10.0 ** (np.floor(np.log10(corners.min())) - 1)
+        high = 10.0 ** (np.ceil(np.log10(corners.max())) + 1)
+    else:
+        low, high = DEFAULT_BAND
+    return np.logspace(np.log10(low), np.log10(high), points)
+
+
+def analyze_frequency_response(blocks, wires, input_name, output_name, omega=None):
+    """
+    Bode, Nyquist and pole-zero data from input_name to output_name.
+
+    Returns a dict with the angular frequencies "omega" in rad/s, the complex
+    "response", "magnitude_db", unwrapped "phase_deg", and the "poles",
+    "zeros" and "gain" of the transfer function.
+    """
+    system = linearize(blocks, wires, input_name, output_name)
+    zeros, poles, gain = pole_zero(system)
+    if omega is None:
+        omega = frequency_grid(poles, zeros)
+    response = frequency_response(system, omega)
+    with np.errstate(divide="ignore"):
+        magnitude_db = 20 * np.log10(np.abs(response))
+    return {
+        "omega": np.asarray(omega, dtype=float),
+        "response": response,
+        "magnitude_db": magnitude_db,
+        "phase_deg": np.degrees(np.unwrap(np.angle(response))),
+        "poles": poles,
+        "zeros": zeros,
+        "gain": gain,
+    }
+
+
+if __name__ == "__main__":
+    # Frequency response of a saved diagram without the GUI:
+    #   python -m backend.frequency diagram.json --input STEP1 --output SCOPE1 --save bode.csv
+    import argparse
+    from GUI.diagram_file import load_diagram
+
+    parser = argparse.ArgumentParser(description="Frequency response between two blocks of a saved diagram.")
+    parser.add_argument("diagram", help="Diagram file (.json or compact .bdz)")
+    parser.add_argument("--input", required=True, help="Block whose output the input signal is added to")
+    parser.add_argument("--output", required=True, help="Block whose output is measured, or a SCOPE")
+    parser.add_argument("--range", type=float, nargs=2, metavar=("LOW", "HIGH"), help="Frequencies in rad/s")
+    parser.add_argument("--points", type=int, default=FREQUENCY_POINTS)
+    parser.add_argument("--save", help="Write omega, magnitude, phase, real and imaginary columns to CSV")
+    args = parser.parse_args()
+
+    diagram = load_diagram(args.diagram)
+    omega = np.logspace(*np.log10(args.range), args.points) if args.range else None
+    analysis = analyze_frequency_response(diagram["blocks"], diagram["wires"], args.input, args.output, omega)
+    print(f"Poles: {np.array2string(analysis['poles'], precision=4)}")
+    print(f"Zeros: {np.array2string(analysis['zeros'], precision=4)}")
+    print(f"Gain: {analysis['gain']:.6g}")
+    if args.save:
+        response = analysis["response"]
+        np.savetxt(
+            args.save,
+            np.column_stack([analysis["omega"], analysis["magnitude_db"], analysis["phase_deg"],
+                             response.real, response.imag]),
+            delimiter=",", header="omega,magnitude_db,phase_deg,real,imag", comments="",
+        )
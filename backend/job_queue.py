@@ -0,0 +1,275 @@
+import itertools
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from backend.subsystem import flatten_diagram
+from backend.discontinuities import break_times
+from backend.stiffness import estimate_stiffness
+from backend.streaming import STREAM_CHUNK_SIZE
+from backend.vectors import signal_widths
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+MEMORY_FRACTION = 0.5  # Share of the memory available when the queue starts that jobs may use
+PROCESS_BYTES = 150e6  # A worker process with bdsim, scipy and matplotlib imported
+STEP_BYTES = 240  # History kept per integration step for the time and the step itself...
+STATE_BYTES = 16  # ...plus this per continuous state...
+SIGNAL_BYTES = 48  # ...and this per watched signal kept in memory
+ADAPTIVE_MIN_STEPS = 100  # bdsim limits adaptive steps to T / 100
+STEPS_PER_BREAK = 5  # Steps an adaptive solver takes between two source edges
+
+
+def available_memory():
+    """Bytes of memory the system can still hand out, or None if unknown."""
+    try:
+        with open("/proc/meminfo") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def estimate_steps(blocks, wires, T, step=None, pace=None):
+    """Rough number of integration steps a run will record."""
+    if pace:
+        step = step or T / 1000
+    if step:
+        return int(np.ceil(T / step))
+    steps = ADAPTIVE_MIN_STEPS
+    estimate = estimate_stiffness(blocks, wires, T)
+    if not estimate["stiff"]:
+        steps = max(steps, estimate["explicit_steps"])
+    return steps + STEPS_PER_BREAK * len(break_times(blocks, T))
+
+
+def estimate_memory(blocks, wires, T, step=None, pace=None, stream_dir=None, chunk_size=STREAM_CHUNK_SIZE,
+                    **options):
+    """
+    Bytes a simulation run in its own process is expected to need at its peak.
+
+    bdsim keeps the time, state and watched signals of every step in lists
+    until the run ends, so memory grows with the horizon and the number of
+    states and SCOPE channels. Signals streamed to disk only hold one chunk.
+    """
+    blocks, wires = flatten_diagram(blocks, wires)
+    steps = estimate_steps(blocks, wires, T, step, pace)
+    try:
+        widths = signal_widths(blocks, wires)
+    except ValueError:
+        widths = {}  # The run itself will report the mismatch
+    states = sum(
+        max(len(np.trim_zeros(block["properties"].get("Denominator", [1, 1]), "f")) - 1, 0)
+        * widths.get(block["name"], 1)
+        for block in blocks if block["type"] == "LTI"
+    )
+    scopes = [block for block in blocks if block["type"] == "SCOPE"]
+    streamed = [block for block in scopes if stream_dir or block["properties"].get("Stream To")]
+    kept = sum(widths.get(block["name"], 1) for block in scopes if block not in streamed)
+    per_step = SIGNAL_BYTES * kept
+    if not streamed:
+        per_step += STEP_BYTES + STATE_BYTES * states  # Streaming discards the time and state history
+    chunks = sum(widths.get(block["name"], 1) for block in streamed) * chunk_size * 8
+    return int(PROCESS_BYTES + steps * per_step + chunks)
+
+
+class StreamFile:
+    """Stands in for a streamed signal sent between processes: the .npy file holding it."""
+
+    def __init__(self, path):
+        self.path = path
+
+
+def _stream_paths(values):
+    """A StreamFile for a memory-mapped streamed signal; other values are sent as they are."""
+    if isinstance(values, np.memmap) and values.filename:
+        return StreamFile(values.filename)
+    return values
+
+
+def _open_streams(values):
+    """Inverse of _stream_paths: map a streamed signal's file again, in this process."""
+    if isinstance(values, StreamFile):
+        return np.load(values.path, mmap_mode="r")
+    return values
+
+
+def _run_job(connection, blocks, wires, T, options):
+    """Worker process body: run one simulation and send back the results."""
+    from backend.simulate import run_bdsim_simulation
+    try:
+        results = run_bdsim_simulation(blocks, wires, T=T, graphics=False, **options)
+        if results is None:
+            connection.send(("failed", "Simulation failed."))
+        else:
+            # Streamed signals can be far larger than memory; send their file paths so
+            # the queue maps them itself, rather than reading them in to pickle them
+            results["t"] = _stream_paths(results["t"])
+            results["scopes"] = {name: _stream_paths(values) for name, values in results["scopes"].items()}
+            connection.send(("done", results))
+    except Exception as e:
+        connection.send(("failed", str(e)))
+    finally:
+        connection.close()
+
+
+class SimulationJob:
+    """One queued simulation and what became of it."""
+
+    def __init__(self, job_id, name, blocks, wires, T, priority, options, memory):
+        self.id = job_id
+        self.name = name
+        self.blocks = blocks
+        self.wires = wires
+        self.T = T
+        self.priority = priority  # Higher runs first
+        self.options = options  # Further run_bdsim_simulation arguments
+        self.memory = memory  # Estimated peak bytes
+        self.state = "queued"
+        self.results = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.process = None
+        self.connection = None
+
+    @property
+    def elapsed(self):
+        """Seconds spent running so far, or in total once finished."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobQueue:
+    """
+    Runs queued simulations in worker processes, a few at a time.
+
+    A job starts when fewer than `concurrency` jobs are running and its
+    estimated memory fits in what the running jobs leave of the budget.
+    Jobs start in order of priority, then submission; a job that does not
+    fit holds back the ones behind it, so large jobs are not starved by a
+    stream of small ones. A job larger than the whole budget runs alone.
+
+    Each job has its own process, so cancelling a running job terminates it
+    at once and a crash cannot take the GUI down. Call poll regularly, e.g.
+    from a timer, to collect finished jobs and start waiting ones.
+    """
+
+    def __init__(self, concurrency=None, memory_budget=None):
+        self.concurrency = concurrency or max(1, (os.cpu_count() or 1) - 1)
+        if memory_budget is None:
+            available = available_memory()
+            memory_budget = available * MEMORY_FRACTION if available else np.inf
+        self.memory_budget = memory_budget
+        self.jobs = []
+        self.ids = itertools.count(1)  # Also the submission order, for ties in priority
+        # Spawned rather than forked, as the GUI process has threads running
+        self.context = multiprocessing.get_context("spawn")
+
+    def submit(self, name, blocks, wires, T, priority=0, **options):
+        """Queue a simulation of a diagram snapshot; returns its SimulationJob."""
+        memory = estimate_memory(blocks, wires, T, **options)
+        job = SimulationJob(next(self.ids), name, blocks, wires, T, priority, options, memory)
+        self.jobs.append(job)
+        return job
+
+    def get(self, job_id):
+        return next((job for job in self.jobs if job.id == job_id), None)
+
+    def running(self):
+        return [job for job in self.jobs if job.state == "running"]
+
+    def waiting(self):
+        """Queued jobs in the order they will start."""
+        queued = [job for job in self.jobs if job.state == "queued"]
+        return sorted(queued, key=lambda job: (-job.priority, job.id))
+
+    def memory_in_use(self):
+        return sum(job.memory for job in self.running())
+
+    def set_priority(self, job_id, priority):
+        job = self.get(job_id)
+        if job is not None and job.state == "queued":
+            job.priority = priority
+
+    def cancel(self, job_id):
+        """Drop a queued job or terminate a running one."""
+        job = self.get(job_id)
+        if job is None or job.state not in ("queued", "running"):
+            return
+        if job.state == "running":
+            job.process.terminate()
+            job.process.join()
+            job.connection.close()
+        job.state = "cancelled"
+        job.finished = time.time()
+
+    def remove_finished(self):
+        """Forget every job that is no longer queued or running."""
+        self.jobs = [job for job in self.jobs if job.state in ("queued", "running")]
+
+    def poll(self):
+        """Collect finished jobs and start waiting ones; returns the jobs that changed state."""
+        changed = []
+        for job in self.running():
+            if job.connection.poll():
+                try:
+                    job.state, payload = job.connection.recv()
+                except (EOFError, OSError):
+                    job.state, payload = "failed", "The worker process exited without a result."
+            elif not job.process.is_alive():
+                job.state, payload = "failed", f"The worker process died (exit code {job.process.exitcode})."
+            else:
+                continue
+            if job.state == "done":
+                payload["t"] = _open_streams(payload["t"])
+                payload["scopes"] = {name: _open_streams(values) for name, values in payload["scopes"].items()}
+                job.results = payload
+            else:
+                job.error = payload
+            job.finished = time.time()
+            job.connection.close()
+            job.process.join()
+            changed.append(job)
+
+        for job in self.waiting():
+            running = self.running()
+            if len(running) >= self.concurrency:
+                break
+            if running and self.memory_in_use() + job.memory > self.memory_budget:
+                break  # Wait for memory rather than let smaller jobs overtake it
+            self.start(job)
+            changed.append(job)
+        return changed
+
+    def start(self, job):
+        receiver, sender = self.context.Pipe(duplex=False)
+        job.process = self.context.Process(
+            target=_run_job, args=(sender, job.blocks, job.wires, job.T, job.options), daemon=True
+        )
+        job.process.start()
+        sender.close()  # The child holds its own copy, so the pipe reports EOF if it dies
+        job.connection = receiver
+        job.state = "running"
+        job.started = time.time()
+
+    def shutdown(self):
+        """Terminate every running job and drop the queued ones."""
+        for job in self.jobs:
+            self.cancel(job.id)
+
+
+def format_bytes(count):
+    """Size in bytes as a short human-readable string."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(count) < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
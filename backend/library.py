@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+
+LIBRARY_EXTENSION = ".bdlib"  # Shared component library files, JSON inside
+
+_loaded_libraries = {}  # Absolute path -> (modification time, library, instanced contents by id)
+
+
+def component_id(contents):
+    """Content hash identifying a subsystem's contents, with nested subsystems already packed."""
+    text = json.dumps(contents, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def pack_blocks(blocks, components, linked=(), ids=None):
+    """
+    Replace the contents of SUBSYSTEM blocks by references into a component table.
+
+    Each distinct contents is stored once in components under its component_id
+    and blocks refer to it with a "component" key, innermost subsystems first.
+    Components whose id is in linked are left out of the table, as they come
+    from a library file. ids caches the id of each contents object, so copies
+    sharing one contents dict are only hashed once.
+    """
+    ids = {} if ids is None else ids
+    packed = []
+    for block in blocks:
+        contents = block.get("contents")
+        if contents is None:
+            packed.append(block)
+            continue
+        key = id(contents)
+        if key not in ids:
+            inner = {**contents, "blocks": pack_blocks(contents.get("blocks", []), components, linked, ids)}
+            ids[key] = component_id(inner)
+            if ids[key] not in linked:
+                components.setdefault(ids[key], inner)
+        reference = {name: value for name, value in block.items() if name != "contents"}
+        reference["component"] = ids[key]
+        packed.append(reference)
+    return packed
+
+
+def pack_diagram(diagram_data, directory=None):
+    """
+    Diagram data with every distinct subsystem stored once, for saving.
+
+    Subsystem contents move into a "components" table keyed by content hash,
+    so a component instanced many times costs one copy plus a reference per
+    instance. Components found in the library files listed under "libraries"
+    are not copied into the table; those paths are written relative to
+    directory, the folder of the file being saved, if given.
+    """
+    libraries = diagram_data.get("libraries", [])
+    linked = set()
+    for path in libraries:
+        try:
+            linked.update(load_library(path)["components"])
+        except (OSError, ValueError):
+            pass  # Missing library: keep its components in the diagram instead
+    components = {}
+    packed = {**diagram_data, "blocks": pack_blocks(diagram_data["blocks"], components, linked)}
+    if components:
+        packed["components"] = components
+    if libraries and directory is not None:
+        packed["libraries"] = [os.path.relpath(path, directory) for path in libraries]
+    return packed
+
+
+def unpack_diagram(diagram_data, directory=""):
+    """
+    Inverse of pack_diagram: give SUBSYSTEM blocks their contents back.
+
+    Each component is resolved once and its contents dict is shared by all
+    blocks instancing it, so memory and load time grow with the distinct
+    components rather than the instances. This relies on contents being
+    replaced rather than edited in place, as the canvas already does.
+    Library paths are made absolute, relative to directory.
+    """
+    libraries = [os.path.join(directory, path) for path in diagram_data.get("libraries", [])]
+    table = diagram_data.get("components", {})
+    resolved = {}
+
+    def find(reference):
+        if reference in table:
+            return table[reference]
+        missing = []
+        for path in libraries:
+            try:
+                components = load_library(path)["components"]
+            except OSError:
+                missing.append(path)
+                continue
+            if reference in components:
+                return components[reference]
+        message = f"Component {reference[:12]} is not in the diagram or its libraries."
+        if missing:
+            message += f" Could not read {', '.join(missing)}."
+        raise ValueError(message)
+
+    def resolve(reference):
+        if reference not in resolved:
+            contents = find(reference)
+            resolved[reference] = {**contents, "blocks": unpack_blocks(contents.get("blocks", []))}
+        return resolved[reference]
+
+    def unpack_blocks(blocks):
+        unpacked = []
+        for block in blocks:
+            if "component" in block:
+                reference = block["component"]
+                block = {name: value for name, value in block.items() if name != "component"}
+                block["contents"] = resolve(reference)
+            unpacked.append(block)
+        return unpacked
+
+    unpacked = {name: value for name, value in diagram_data.items() if name != "components"}
+    unpacked["blocks"] = unpack_blocks(diagram_data["blocks"])
+    if libraries:
+        unpacked["libraries"] = [os.path.abspath(path) for path in libraries]
+    return unpacked
+
+
+def load_library(path):
+    """
+    Read a component library file: {"components": {id: contents}, "names": {id: name}}.
+
+    Libraries are cached by path until the file changes, so diagrams sharing
+    a library parse it once per session.
+    """
+    path = os.path.abspath(path)
+    modified = os.path.getmtime(path)
+    cached = _loaded_libraries.get(path)
+    if cached is None or cached[0] != modified:
+        with open(path, "r") as file:
+            library = json.load(file)
+        library.setdefault("components", {})
+        library.setdefault("names", {})
+        cached = _loaded_libraries[path] = (modified, library, {})
+    return cached[1]
+
+
+def add_to_library(path, contents, name):
+    """Store a subsystem's contents in a library file under a name; returns its component id."""
+    if os.path.exists(path):
+        library = load_library(path)
+        library = {"components": dict(library["components"]), "names": dict(library["names"])}
+    else:
+        library = {"components": {}, "names": {}}
+    # Nested subsystems become components of the library too
+    (reference,) = pack_blocks([{"contents": contents}], library["components"])
+    library["names"][reference["component"]] = name
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(library, file, indent=4)
+    os.replace(temporary, path)
+    return reference["component"]
+
+
+def library_contents(path, reference):
+    """Contents of a library component, ready to instance on the canvas; shared by every instance."""
+    load_library(path)
+    instanced = _loaded_libraries[os.path.abspath(path)][2]
+    if reference not in instanced:
+        diagram = unpack_diagram({"blocks": [{"component": reference}], "libraries": [os.path.abspath(path)]})
+        instanced[reference] = diagram["blocks"][0]["contents"]
+    return instanced[reference]
+
+
+def library_names(path):
+    """(name, component id) of each component in a library file, sorted by name."""
+    return sorted((name, reference) for reference, name in load_library(path)["names"].items())
@@ -0,0 +1,170 @@
+from collections import deque
+from numbers import Number
+
+from backend.subsystem import SINK_TYPES
+
+
+def _is_number(value):
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+
+def prune_dead_blocks(blocks, wires):
+    """
+    Remove blocks whose output cannot reach a SCOPE or EXT_SINK.
+
+    Returns the remaining blocks and wires and the names of the removed blocks.
+    """
+    feeding = {}  # Block name -> names of the blocks wired into it
+    for wire in wires:
+        feeding.setdefault(wire["end"], []).append(wire["start"])
+    live = set()
+    pending = [block["name"] for block in blocks if block["type"] in SINK_TYPES]
+    while pending:
+        name = pending.pop()
+        if name not in live:
+            live.add(name)
+            pending.extend(feeding.get(name, []))
+    pruned = [block["name"] for block in blocks if block["name"] not in live]
+    blocks = [block for block in blocks if block["name"] in live]
+    wires = [wire for wire in wires if wire["start"] in live and wire["end"] in live]
+    return blocks, wires, pruned
+
+
+def fold_constants(blocks, wires):
+    """
+    Replace GAIN and SUM blocks fed only by constants with a CONSTANT.
+
+    A folded block keeps its name, so the wires leaving it are unchanged;
+    the constants that fed it are left for prune_dead_blocks if nothing
+    else reads them. SUM inputs are signed by the port each wire ends at,
+    as build_diagram connects them. Blocks are revisited when one of their
+    inputs folds, so chains of any length collapse in one pass over the
+    diagram. Returns the new blocks and wires and a list of (name, value)
+    folded.
+    """
+    blocks = list(blocks)
+    index = {block["name"]: i for i, block in enumerate(blocks)}
+    constants = {
+        block["name"]: block["properties"].get("Value", 0) for block in blocks
+        if block["type"] == "CONSTANT" and _is_number(block["properties"].get("Value", 0))
+    }
+    inputs = {}  # Block name -> wires into it
+    readers = {}  # Block name -> names of the blocks it feeds
+    for wire in wires:
+        inputs.setdefault(wire["end"], []).append(wire)
+        readers.setdefault(wire["start"], []).append(wire["end"])
+
+    folded = []
+    pending = deque(block["name"] for block in blocks if block["type"] in ("GAIN", "SUM"))
+    while pending:
+        name = pending.popleft()
+        block = blocks[index[name]]
+        into = inputs.get(name, [])
+        if block["type"] not in ("GAIN", "SUM") or not into or any(wire["start"] not in constants for wire in into):
+            continue
+        properties = block["properties"]
+        value = None
+        if block["type"] == "GAIN" and len(into) == 1 and _is_number(properties.get("Gain", 1)):
+            value = properties.get("Gain", 1) * constants[into[0]["start"]]
+        elif block["type"] == "SUM":
+            signs = properties.get("Inputs", "+-")
+            ports = [wire.get("end_port_index", 0) for wire in into]
+            if len(set(ports)) == len(signs) and all(port < len(signs) for port in ports):
+                value = sum(
+                    constants[wire["start"]] * (1 if signs[port] == "+" else -1)
+                    for wire, port in zip(into, ports)
+                )
+        if value is None:
+            continue
+
+        blocks[index[name]] = {**block, "type": "CONSTANT", "properties": {"Value": value}}
+        constants[name] = value
+        del inputs[name]
+        folded.append((name, value))
+        pending.extend(readers.get(name, []))  # Their inputs may all be constant now
+
+    folded_names = set(name for name, _ in folded)
+    wires = [wire for wire in wires if wire["end"] not in folded_names]
+    return blocks, wires, folded
+
+
+def merge_gains(blocks, wires):
+    """
+    Merge each GAIN feeding only another GAIN into it, multiplying the gains.
+
+    The downstream block keeps its name and takes over the upstream block's
+    input. The wire maps are updated in place after each merge, and only the
+    blocks next to it are looked at again. Returns the new blocks and wires
+    and a list of (kept, removed) names.
+    """
+    by_name = {block["name"]: block for block in blocks}
+    wires = list(wires)  # Merged-away wires become None
+    outgoing, incoming = {}, {}  # Block name -> indices into wires
+    for i, wire in enumerate(wires):
+        outgoing.setdefault(wire["start"], []).append(i)
+        incoming.setdefault(wire["end"], []).append(i)
+
+    merged = []
+    pending = deque(block["name"] for block in blocks if block["type"] == "GAIN")
+    while pending:
+        name = pending.popleft()
+        first = by_name.get(name)
+        out = outgoing.get(name, [])
+        into = incoming.get(name, [])
+        if first is None or first["type"] != "GAIN" or len(out) != 1 or len(into) != 1:
+            continue
+        second = by_name[wires[out[0]]["end"]]
+        if not (second["type"] == "GAIN" and second is not first and len(incoming[second["name"]]) == 1
+                and _is_number(first["properties"].get("Gain", 1))
+                and _is_number(second["properties"].get("Gain", 1))):
+            continue
+
+        gain = first["properties"].get("Gain", 1) * second["properties"].get("Gain", 1)
+        by_name[second["name"]] = {**second, "properties": {**second["properties"], "Gain": gain}}
+        del by_name[name]
+        wires[out[0]] = None  # The wire between the two gains
+        (upstream,) = into
+        wires[upstream] = {**wires[upstream], "end": second["name"], "end_port_index": 0}
+        incoming[second["name"]] = [upstream]
+        del incoming[name], outgoing[name]
+        merged.append((second["name"], name))
+        # The merged gain may now merge further, and so may the block feeding it
+        pending.extend((second["name"], wires[upstream]["start"]))
+
+    blocks = [by_name[block["name"]] for block in blocks if block["name"] in by_name]
+    wires = [wire for wire in wires if wire is not None]
+    return blocks, wires, merged
+
+
+def optimize_diagram(blocks, wires):
+    """
+    Simplify a flattened diagram before it is compiled.
+
+    Constant chains are folded, cascaded gains merged and blocks that no
+    longer reach a sink pruned. The scopes see the same signals; only the
+    work bdsim does on every step shrinks. Returns the new blocks and wires
+    and a report dict with the "pruned" block names, the "folded" (name,
+    value) pairs, the "merged" (kept, removed) gain pairs and the block
+    counts "before" and "after".
+    """
+    before = len(blocks)
+    blocks, wires, folded = fold_constants(blocks, wires)
+    blocks, wires, merged = merge_gains(blocks, wires)
+    blocks, wires, pruned = prune_dead_blocks(blocks, wires)
+    return blocks, wires, {
+        "pruned": pruned, "folded": folded, "merged": merged, "before": before, "after": len(blocks),
+    }
+
+
+def format_optimization_report(report):
+    """Describe what optimize_diagram eliminated as text."""
+    if report["before"] == report["after"] and not report["folded"]:
+        return "Diagram not simplified"
+    parts = []
+    if report["pruned"]:
+        parts.append(f"pruned {', '.join(report['pruned'])}")
+    if report["folded"]:
+        parts.append(f"folded {', '.join(f'{name} = {value:g}' for name, value in report['folded'])}")
+    if report["merged"]:
+        parts.append(f"merged gains {', '.join(f'{removed} into {kept}' for kept, removed in report['merged'])}")
+    return f"Simplified {report['before']} blocks to {report['after']}: " + "; ".join(parts)
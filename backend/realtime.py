@@ -0,0 +1,201 @@
+import time
+
+import numpy as np
+import scipy.integrate
+from scipy.integrate import OdeSolver, DenseOutput
+
+from backend.streaming import StreamingBDSim
+
+SPIN_THRESHOLD = 0.002  # Busy-wait the last part of a wait, as sleep overshoots by about this much
+JITTER_BINS_US = [0, 10, 50, 100, 500, 1000, 5000, 10000, 50000, np.inf]  # Histogram bin edges
+RK4_STABILITY = 2.78  # Largest |h * eigenvalue| for which RK4 is stable on the negative real axis
+UNSTABLE_STEPS = 20  # Consecutive growing steps past that limit after which the step is too large
+
+
+class _HermiteOutput(DenseOutput):
+    """Cubic interpolation of one step from the state and its derivative at both ends."""
+
+    def __init__(self, t_old, t, y_old, y, f_old, f):
+        super().__init__(t_old, t)
+        self.h = t - t_old
+        self.ends = (y_old, y, f_old * self.h, f * self.h)
+
+    def _call_impl(self, t):
+        x = (np.asarray(t) - self.t_old) / self.h
+        basis = [2 * x ** 3 - 3 * x ** 2 + 1, -2 * x ** 3 + 3 * x ** 2, x ** 3 - 2 * x ** 2 + x, x ** 3 - x ** 2]
+        return sum(np.multiply.outer(end, b) for end, b in zip(self.ends, basis))
+
+
+class FixedStepRK4(OdeSolver):
+    """
+    scipy ODE solver taking classic fourth-order Runge-Kutta steps of exactly first_step.
+
+    With no error control, a step too large for the fastest mode of the
+    diagram makes the state blow up instead of being rejected. A step is
+    refused with a ValueError once the state is no longer finite, or once it
+    has grown for UNSTABLE_STEPS steps in a row while h times the rate the
+    stages see changing is past RK4_STABILITY. The last stage's derivative
+    is reused as the first of the next step, so each step takes four
+    evaluations of the diagram.
+    """
+
+    def __init__(self, fun, t0, y0, t_bound, first_step=None, max_step=np.inf, vectorized=False, **extraneous):
+        super().__init__(fun, t0, y0, t_bound, vectorized)
+        self.h = first_step or max_step
+        if not 0 < self.h < np.inf:
+            raise ValueError("FixedStepRK4 needs a step size; pass first_step.")
+        self.f = self.fun(self.t, self.y)
+        self.unstable = 0  # Consecutive growing steps past the stability limit
+        self.unstable_since = t0
+        self.previous = None  # (y, f) at the start of the last step, for dense output
+
+    def _step_impl(self):
+        t, y, k1 = self.t, self.y, self.f
+        h = min(self.h, abs(self.t_bound - t)) * self.direction
+        k2 = self.fun(t + h / 2, y + h / 2 * k1)
+        k3 = self.fun(t + h / 2, y + h / 2 * k2)
+        k4 = self.fun(t + h, y + h * k3)
+        y_new = y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        if not np.all(np.isfinite(y_new)):
+            raise ValueError(f"The state stopped being finite at t={t + h:g}; the step of {self.h:g} s is too large.")
+
+        # k2 - k1 is about h/2 times the Jacobian applied to k1, which the fastest mode dominates once it grows
+        rate = np.linalg.norm(k1)
+        growing = np.linalg.norm(y_new) > np.linalg.norm(y)
+        if rate > 0 and growing and 2 * np.linalg.norm(k2 - k1) / rate > RK4_STABILITY:
+            if not self.unstable:
+                self.unstable_since = t
+            self.unstable += 1
+            if self.unstable >= UNSTABLE_STEPS:
+                raise ValueError(
+                    f"The state grew without bound from t={self.unstable_since:g}; "
+                    f"the step of {self.h:g} s is too large."
+                )
+        else:
+            self.unstable = 0
+
+        self.previous = (y, k1)
+        self.t = t + h
+        self.y = y_new
+        self.f = self.fun(self.t, y_new)
+        return True, None
+
+    def _dense_output_impl(self):
+        y_old, f_old = self.previous
+        return _HermiteOutput(self.t_old, self.t, y_old, self.y, f_old, self.f)
+
+
+# bdsim looks integrators up by name in scipy.integrate
+scipy.integrate.FixedStepRK4 = FixedStepRK4
+
+
+def fixed_step_options(step):
+    """BDSim.run arguments that integrate with FixedStepRK4 in steps of exactly `step`."""
+    return {"dt": step, "solver": "FixedStepRK4", "solver_args": {"first_step": step}}
+
+
+class Pacer:
+    """
+    Holds each integration step back until its wall-clock deadline.
+
+    Step k at simulation time t is due at start + t / speed. A step that is
+    ready early waits for its deadline. A step that is ready late is released
+    at once and counted as a deadline miss. Later deadlines are not moved, so
+    a slow step does not make the rest of the run drift.
+
+    Replaces the time list bdsim appends each step's time to, so it sees
+    every step as soon as it has been computed.
+    """
+
+    def __init__(self, speed=1.0, inner=None):
+        self.speed = speed
+        self.inner = inner if inner is not None else []  # The list or recorder being replaced
+        self.start = None
+        self.released = None  # Wall time the previous step was released
+        self.compute = []  # Wall time spent computing each step
+        self.slack = []  # Deadline minus the time each step was ready; negative for a miss
+        self.jitter = []  # Release time minus deadline of each step
+
+    def __len__(self):
+        return len(self.inner)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.inner, dtype=dtype)
+
+    def begin(self, t0=0.0):
+        """Start the clock, aligning simulation time t0 with now."""
+        self.released = time.perf_counter()
+        self.start = self.released - t0 / self.speed
+
+    def append(self, t):
+        """Record a step and wait until it is due."""
+        ready = time.perf_counter()
+        self.inner.append(t)
+        deadline = self.start + t / self.speed
+        self.compute.append(ready - self.released)
+        self.slack.append(deadline - ready)
+
+        if deadline - ready > SPIN_THRESHOLD:
+            time.sleep(deadline - ready - SPIN_THRESHOLD)
+        now = time.perf_counter()
+        while now < deadline:
+            now = time.perf_counter()
+        self.released = now
+        self.jitter.append(now - deadline)
+
+    def report(self, step):
+        """Summarize per-step compute time, deadline misses and release jitter."""
+        compute = np.array(self.compute)
+        slack = np.array(self.slack)
+        jitter = np.array(self.jitter)
+        steps = len(compute)
+        misses = int(np.count_nonzero(slack < 0))
+        counts, _ = np.histogram(jitter * 1e6, bins=JITTER_BINS_US)
+        return {
+            "steps": steps,
+            "step": step,
+            "speed": self.speed,
+            "budget": step / self.speed,  # Wall time available per step
+            "wall_time": (self.released - self.start) if self.start is not None else 0.0,
+            "compute": compute,
+            "compute_mean": float(compute.mean()) if steps else 0.0,
+            "compute_p99": float(np.percentile(compute, 99)) if steps else 0.0,
+            "compute_max": float(compute.max()) if steps else 0.0,
+            "misses": misses,
+            "max_lateness": float(max(0.0, -slack.min())) if steps else 0.0,
+            "jitter": jitter,
+            "jitter_histogram": (counts, JITTER_BINS_US),  # Counts per bin, bin edges in microseconds
+        }
+
+
+def format_timing_report(report):
+    """Describe a Pacer report as text."""
+    steps = report["steps"]
+    lines = [
+        f"{steps} steps of {report['step']:g} s at {report['speed']:g}x real time "
+        f"({report['budget'] * 1e3:.3f} ms per step), {report['wall_time']:.2f} s wall time",
+        f"Compute per step: mean {report['compute_mean'] * 1e3:.3f} ms, "
+        f"p99 {report['compute_p99'] * 1e3:.3f} ms, max {report['compute_max'] * 1e3:.3f} ms",
+        f"Deadline misses: {report['misses']} ({100.0 * report['misses'] / max(steps, 1):.2f}%), "
+        f"worst {report['max_lateness'] * 1e3:.3f} ms late",
+        "Release jitter:",
+    ]
+    counts, edges = report["jitter_histogram"]
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        upper = f"{high:g} us" if np.isfinite(high) else "up"
+        lines.append(f"  {low:g} us - {upper}: {count}")
+    return "\n".join(lines)
+
+
+class PacedBDSim(StreamingBDSim):
+    """BDSim whose integration steps are released in step with the wall clock."""
+
+    def __init__(self, *args, speed=1.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pacer = Pacer(speed)
+
+    def install_recorders(self, simstate):
+        super().install_recorders(simstate)
+        self.pacer.inner = simstate.tlist
+        simstate.tlist = self.pacer
+        self.pacer.begin(self.resume["t"] if self.resume is not None else 0.0)
@@ -3,16 +3,54 @@ import matplotlib.pyplot as plt
 import bdsim
 from bdsim.blocks.displays import Scope
 
-def run_bdsim_simulation(blocks, wires, T=5):
+import os
+
+import numpy as np
+
+from backend.subsystem import flatten_diagram
+from backend.checkpoint import diagram_fingerprint, make_checkpoint, save_checkpoint, load_checkpoint, CHECKPOINT_FILE
+from backend.discontinuities import break_times
+from backend.optimizer import optimize_diagram, format_optimization_report
+from backend.tracing import tracer, span, traced
+from backend.stiffness import (
+    SOLVERS, SolverMonitor, estimate_stiffness, format_solver_report
+)
+from backend.file_source import FromFile
+from backend.vectors import (
+    VectorStep, VectorRamp, VectorWaveform, ElementwiseGain, VectorLTI, channel_values, signal_widths
+)
+from backend.external_io import ExternalSource, Publisher, DEFAULT_UDP_ADDRESS
+from backend.realtime import PacedBDSim, fixed_step_options, format_timing_report
+from backend.streaming import (
+    StreamingBDSim, StreamRecorder, STREAM_CHUNK_SIZE, STREAM_FORMATS, stream_file_name, truncate_stream
+)
+
+
+class SimulationRun:
+    """Handle used to cancel a simulation running on another thread."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.sim = None  # BDSim instance, once the run has started
+
+    def cancel(self):
+        """Ask the simulation to stop at its next integration step."""
+        self.cancelled = True
+        simstate = getattr(self.sim, "simstate", None)
+        if simstate is not None:
+            simstate.stop = "cancelled"  # Checked by bdsim after every step
+
+
+def build_diagram(bd, blocks, wires):
     """
-    Run the BDSim simulation and only display the Matplotlib plot.
+    Create a bdsim block for each block and connect the wires in bd.
 
-    blocks: List of blocks for the block diagram.
-     wires: List of wires connecting the blocks.
-     T: Simulation time (default is 5 seconds).
+    blocks and wires must already be flattened. Returns the bdsim blocks by name.
+
+    Blocks carrying several channels, see vectors.signal_widths, become
+    element-wise blocks that handle all channels in one NumPy call.
     """
-    sim = bdsim.BDSim()  # Create BDSim instance
-    bd = sim.blockdiagram()  # Create block diagram
+    widths = signal_widths(blocks, wires)
 
     # Create block instances
     block_instances = {}
@@ -20,12 +58,47 @@ def run_bdsim_simulation(blocks, wires, T=5):
         block_type = block["type"]
         name = block["name"]
         properties = block["properties"]
+        width = widths[name]
 
         # Define blocks with their properties
-        if block_type == "STEP":
+        if width > 1 and block_type == "STEP":
+            block_instances[name] = VectorStep(
+                T=channel_values(properties.get("Start Time", 0), width),
+                on=channel_values(properties.get("Amplitude", 1), width),
+                name=name, bd=bd,
+            )
+        elif width > 1 and block_type == "RAMP":
+            block_instances[name] = VectorRamp(
+                T=channel_values(properties.get("Start Time", 0), width),
+                slope=channel_values(properties.get("Slope", 1), width),
+                name=name, bd=bd,
+            )
+        elif width > 1 and block_type == "WAVEFORM":
+            block_instances[name] = VectorWaveform(
+                wave=properties.get("Wave Type", "square"),
+                freq=channel_values(properties.get("Frequency", 1), width),
+                amplitude=channel_values(properties.get("Amplitude", 1), width),
+                offset=channel_values(properties.get("Offset", 0), width),
+                phase=channel_values(properties.get("Phase", 0), width),
+                name=name, bd=bd,
+            )
+        elif width > 1 and block_type == "CONSTANT":
+            block_instances[name] = bd.CONSTANT(value=channel_values(properties.get("Value", 0), width), name=name)
+        elif width > 1 and block_type == "GAIN" and isinstance(properties.get("Gain"), list):
+            block_instances[name] = ElementwiseGain(channel_values(properties["Gain"], width), name=name, bd=bd)
+        elif width > 1 and block_type == "LTI":
+            block_instances[name] = VectorLTI(
+                N=properties.get("Numerator", [1]),
+                D=properties.get("Denominator", [1, 1]),
+                width=width,
+                name=name, bd=bd,
+            )
+        elif width > 1 and block_type == "SCOPE":
+            block_instances[name] = bd.SCOPE(vector=width, name=name)
+        elif block_type == "STEP":
             block_instances[name] = bd.STEP(
                 T=properties.get("Start Time", 0),
-                A=properties.get("Amplitude", 1),
+                on=properties.get("Amplitude", 1),
                 name=name,
             )
         elif block_type == "GAIN":
@@ -60,32 +133,53 @@ def run_bdsim_simulation(blocks, wires, T=5):
                 D=properties.get("Denominator", [1, 1]),
                 name=name,
             )
+        elif block_type == "FROM_FILE":
+            block_instances[name] = FromFile(
+                properties.get("File", ""),
+                interpolation=properties.get("Interpolation", "linear"),
+                name=name,
+                bd=bd,
+            )
+        elif block_type == "EXT_SOURCE":
+            block_instances[name] = ExternalSource(
+                transport=properties.get("Transport", "udp"),
+                address=properties.get("Address", DEFAULT_UDP_ADDRESS),
+                width=properties.get("Width", 1),
+                initial=properties.get("Initial", 0),
+                slots=properties.get("Buffer", 1024),
+                name=name,
+                bd=bd,
+            )
+        elif block_type == "EXT_SINK":
+            # Samples are published from the watch list; the block only terminates the wire
+            block_instances[name] = bd.NULL(name=name)
         else:
             raise ValueError(f"Unsupported block type: {block_type}")
     # Connect wires
+    occupied = {}  # Block name -> input ports already connected
     for wire in wires:
         start = wire["start"]
         end = wire["end"]
 
         # Check if the end block is a SUM block or if input-output ports mismatch
         if block_instances[start].nout != block_instances[end].nin or block_instances[end].type == "sum":
-            # Connect specific output of start to an available input port of end
-            start_port = wire.get("start_port", 0)  # Specify which output port to use, default is 0
+            # Connect specific output of start to the input port the wire was drawn to
+            start_port = wire.get("start_port_index", 0)
             end_block = block_instances[end]
+            used = occupied.setdefault(end, set())
 
-            # Find the first available input port for the SUM block
-            available_input_port = None
+            # Wires without a usable port, e.g. from older files, take the first free one
+            available_input_port = wire.get("end_port_index")
             try:
-                for port in range(end_block.nin):
-                    # Check if a wire is already connected to this port
-                    if not any(w.end.port == port for w in bd.wirelist if w.end.block == end_block):
-                        available_input_port = port
-                        break
+                if available_input_port is None or available_input_port >= end_block.nin \
+                        or available_input_port in used:
+                    available_input_port = next((port for port in range(end_block.nin) if port not in used), None)
 
                 if available_input_port is None:
                     raise RuntimeError(f"All input ports on block {end} are already occupied!")
 
-                # Connect start's specific output to the first available input of end
+                # Connect start's specific output to the chosen input of end
+                used.add(available_input_port)
                 bd.connect(block_instances[start][start_port], block_instances[end][available_input_port])
             except AttributeError as e:
                 raise RuntimeError(f"Error connecting to block {end}: {str(e)}")
@@ -93,12 +187,190 @@ def run_bdsim_simulation(blocks, wires, T=5):
         else:
             # Connect entire blocks if inputs and outputs match
             bd.connect(block_instances[start], block_instances[end])
+    return block_instances
+
+
+@traced(category="simulation")
+def run_bdsim_simulation(blocks, wires, T=5, graphics=True, run=None,
+                         stream_dir=None, stream_format="npy", chunk_size=STREAM_CHUNK_SIZE,
+                         step=None, pace=None, solver="auto", optimize=True,
+                         resume=None, checkpoint_every=None, checkpoint_dir=None):
+    """
+    Run the BDSim simulation and only display the Matplotlib plot.
+
+    blocks: List of blocks for the block diagram.
+     wires: List of wires connecting the blocks.
+     T: Simulation time (default is 5 seconds).
+     graphics: Show bdsim graphics; disable when running off the GUI thread.
+     run: Optional SimulationRun used to cancel the simulation.
+     stream_dir: Stream every SCOPE to .npy files in this directory instead of
+      keeping them in memory. SCOPE blocks can also set their own "Stream To".
+     stream_format: "csv" also writes each streamed signal as CSV rows.
+     chunk_size: Samples buffered per signal between writes when streaming.
+     step: Integrate with this fixed step instead of an adaptive one.
+     pace: Lock the run to wall-clock time at this multiple of real time,
+      e.g. 1 for real time. Uses a fixed step, T/1000 unless step is given.
+     solver: scipy integration method for adaptive steps. "auto" picks an
+      explicit or implicit method from the diagram's stiffness, and switches
+      to an implicit one mid-run if the explicit one keeps rejecting steps.
+     optimize: Fold constants, merge cascaded gains and prune blocks that
+      reach no sink before compiling. See optimizer.optimize_diagram.
+     resume: Checkpoint of an earlier run of the same diagram, from
+      checkpoint.make_checkpoint, to carry on from up to the new T. Only
+      the part after the checkpoint is returned, unless the signals are
+      streamed, in which case they are appended to the existing files.
+     checkpoint_every: Also checkpoint the state at multiples of this time.
+     checkpoint_dir: Save each checkpoint to checkpoint.npz in this
+      directory; defaults to the stream directory when streaming.
+
+    Returns a dict with the time vector "t" and the input signal of each SCOPE
+    under "scopes", or None if the simulation failed or was cancelled. Streamed
+    signals are returned as read-only memory-mapped arrays. Paced runs also
+    return a timing report from Pacer.report under "timing". Adaptive runs
+    describe the method used under "solver". The state at the end is returned
+    as a checkpoint under "checkpoint", to extend the run later with resume.
+    """
+    # Inline subsystems so only simulatable blocks remain
+    blocks, wires = flatten_diagram(blocks, wires)
+    fingerprint = diagram_fingerprint(blocks, wires)
+    if resume is not None:
+        if resume["fingerprint"] != fingerprint:
+            raise ValueError("The checkpoint was saved from a different diagram.")
+        if resume["t"] >= T:
+            raise ValueError(f"The checkpoint is already at t={resume['t']:g}; extend to a later time.")
+    optimization = None
+    if optimize:
+        with span("optimize", "simulation", blocks=len(blocks)):
+            blocks, wires, optimization = optimize_diagram(blocks, wires)
+
+    if pace:
+        step = step or T / 1000
+        sim_class = lambda **options: PacedBDSim(speed=pace, **options)
+    else:
+        sim_class = StreamingBDSim
+    if graphics:
+        sim = sim_class()  # Create BDSim instance
+    else:
+        sim = sim_class(graphics=False, progress=False, hold=False, quiet=True, banner=False)
+    bd = sim.blockdiagram()  # Create block diagram
+
+    with span("build_diagram", "simulation", blocks=len(blocks), wires=len(wires)):
+        block_instances = build_diagram(bd, blocks, wires)
+
+    # Record the signal feeding each scope
+    scope_names = []
+    watch = []
+    for wire in wires:
+        if block_instances[wire["end"]].type == "scope":
+            scope_names.append(wire["end"])
+            watch.append(block_instances[wire["start"]][wire.get("start_port_index", 0)])
+
+    # External sinks publish the signal feeding them after every step, via the watch list
+    properties_by_name = {block["name"]: block["properties"] for block in blocks}
+    for block in blocks:
+        if block["type"] != "EXT_SINK":
+            continue
+        for wire in wires:
+            if wire["end"] == block["name"]:
+                properties = block["properties"]
+                sim.watch_recorders[len(watch)] = Publisher(
+                    properties.get("Transport", "udp"),
+                    properties.get("Address", DEFAULT_UDP_ADDRESS),
+                    properties.get("Width", 1),
+                    properties.get("Buffer", 1024),
+                )
+                watch.append(block_instances[wire["start"]][wire.get("start_port_index", 0)])
+
+    # Scopes streamed to disk, keyed by their index in the watch list. Every
+    # directory gets its own time.npy, so its files can be loaded on their own
+    time_recorders = {}  # Stream directory -> recorder of the time vector there
+    kept = {}  # Stream directory -> samples streamed before the checkpoint being resumed from
+    for i, name in enumerate(scope_names):
+        properties = properties_by_name[name]
+        directory = stream_dir or properties.get("Stream To", "")
+        if not directory:
+            continue
+        directory = os.path.abspath(directory)
+        fmt = stream_format if stream_dir else properties.get("Stream Format", "npy")
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, stream_file_name(name))
+        if directory not in time_recorders:
+            time_path = os.path.join(directory, "time.npy")
+            kept[directory] = 0
+            if resume is not None and os.path.exists(time_path):
+                # Drop whatever was streamed after the checkpoint, e.g. by a longer run since
+                kept[directory] = int(np.searchsorted(np.load(time_path, mmap_mode="r"), resume["t"], side="right"))
+                truncate_stream(time_path, kept[directory])
+            recorder = StreamRecorder(time_path, chunk_size, append=resume is not None)
+            if sim.time_recorder is None:
+                sim.time_recorder = recorder
+            else:
+                sim.time_recorder.mirrors.append(recorder)
+            time_recorders[directory] = recorder
+        if resume is not None and os.path.exists(stem + ".npy"):
+            truncate_stream(stem + ".npy", kept[directory])
+        sim.watch_recorders[i] = StreamRecorder(
+            stem + ".npy", chunk_size,
+            csv_path=stem + ".csv" if fmt == "csv" else None,
+            time_recorder=time_recorders[directory],
+            append=resume is not None,
+        )
 
     # Compile and run the simulation
-    bd.compile()
+    with span("compile", "simulation"):
+        bd.compile()
+    # Integrate piecewise between the jumps and kinks of the sources
+    sim.break_times = break_times(blocks, T)
+    if resume is not None:
+        if len(resume["x"]) != bd.nstates:
+            raise ValueError(f"The checkpoint has {len(resume['x'])} states; the diagram has {bd.nstates}.")
+        sim.resume = resume
+    if checkpoint_every:
+        sim.checkpoint_times = np.arange(checkpoint_every, T, checkpoint_every)
+    checkpoint_dir = checkpoint_dir or stream_dir
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    if run is not None:
+        if run.cancelled:
+            return None
+        run.sim = sim
+        sim.run_handle = run
 
     try:
-        results = sim.run(bd, T=T, block=False)  # Pass user-defined simulation time
+        solver_report = None
+        if step:
+            solver_options = fixed_step_options(step)
+        elif solver == "auto":
+            with span("estimate_stiffness", "simulation"):
+                estimate = estimate_stiffness(blocks, wires, T)
+            # Carry on with the method and step size the checkpointed run had reached
+            resumed = resume or {}
+            monitor = SolverMonitor(resumed.get("method") or estimate["method"])
+            solver_options = {
+                "solver": "SwitchingSolver",
+                "solver_args": {"monitor": monitor, "first_step": resumed.get("step_size") or estimate["first_step"]},
+            }
+            solver_report = {"estimate": estimate, "monitor": monitor}
+        else:
+            solver_options = {"solver": solver}
+        monitor = solver_report["monitor"] if solver_report else None
+
+        checkpoints = []
+
+        def on_checkpoint(t, x):
+            checkpoint = make_checkpoint(
+                t, x, fingerprint,
+                method=monitor.method if monitor else (None if step else solver),
+                step_size=monitor.step_size if monitor else None,
+            )
+            checkpoints.append(checkpoint)
+            if checkpoint_dir:
+                save_checkpoint(os.path.join(checkpoint_dir, CHECKPOINT_FILE), checkpoint)
+
+        sim.checkpoint_handler = on_checkpoint
+        with span("integrate", "simulation", T=T, step=step):
+            results = sim.run(bd, T=T, block=False, watch=watch, **solver_options)  # Pass user-defined simulation time
         '''If ever need to display in screen take every alternate value in results and plot only if ever needed'''
         # # Collect and plot scope data
         # for block_name, block in block_instances.items():
@@ -116,6 +388,91 @@ def run_bdsim_simulation(blocks, wires, T=5):
 
     except Exception as e:
         print(f"Simulation failed: {e}")
+        return None
+    finally:
+        sim.close_recorders()
+        for instance in block_instances.values():
+            if isinstance(instance, ExternalSource):
+                instance.close()
+
+    if run is not None and run.cancelled:
+        return None
+
+    def signal(i):
+        if i in sim.watch_recorders:
+            return sim.watch_recorders[i].view()
+        return results["y" + str(i)]
+
+    output = {
+        "t": sim.time_recorder.view() if sim.time_recorder else results.t,
+        "scopes": {name: signal(i) for i, name in enumerate(scope_names)},
+    }
+    if pace:
+        output["timing"] = sim.pacer.report(step)
+    if solver_report is not None:
+        monitor = solver_report.pop("monitor")
+        solver_report.update({
+            "method": solver_report["estimate"]["method"],
+            "steps": monitor.steps,
+            "rejections": monitor.rejections,
+            "switches": monitor.switches,
+            "segments": sim.segment_count,
+        })
+        output["solver"] = solver_report
+    if optimization is not None:
+        output["optimization"] = optimization
+    if checkpoints:
+        output["checkpoint"] = checkpoints[-1]
+    return output
+
+
+if __name__ == "__main__":
+    # Headless run of a saved diagram, e.g. for horizons too long to keep in memory:
+    #   python -m backend.simulate diagram.json -T 36000 --stream-dir results
+    import argparse
+    from GUI.diagram_file import load_diagram
+
+    parser = argparse.ArgumentParser(description="Simulate a saved block diagram without the GUI.")
+    parser.add_argument("diagram", help="Diagram file (.json or compact .bdz)")
+    parser.add_argument("-T", type=float, default=5, help="Simulation time")
+    parser.add_argument("--stream-dir", help="Stream SCOPE signals to .npy files in this directory")
+    parser.add_argument("--format", choices=STREAM_FORMATS, default="npy", help="Also write CSV files")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE, help="Samples per write")
+    parser.add_argument("--step", type=float, help="Fixed integration step")
+    parser.add_argument("--pace", type=float, help="Run at this multiple of real time, e.g. 1")
+    parser.add_argument("--solver", choices=SOLVERS, default="auto", help="Integration method")
+    parser.add_argument("--no-optimize", action="store_true", help="Simulate the diagram exactly as drawn")
+    parser.add_argument("--checkpoint-every", type=float, help="Also checkpoint the state at multiples of this time")
+    parser.add_argument("--checkpoint-dir", help="Save checkpoints here (default: the stream directory)")
+    parser.add_argument("--resume", help="Carry on from this checkpoint.npz up to T")
+    parser.add_argument("--trace", help="Write a Chrome trace of the run to this JSON file")
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enable()
+
+    diagram = load_diagram(args.diagram)
+    results = run_bdsim_simulation(
+        diagram["blocks"], diagram["wires"], T=args.T, graphics=False,
+        stream_dir=args.stream_dir, stream_format=args.format, chunk_size=args.chunk_size,
+        step=args.step, pace=args.pace, solver=args.solver, optimize=not args.no_optimize,
+        resume=load_checkpoint(args.resume) if args.resume else None,
+        checkpoint_every=args.checkpoint_every, checkpoint_dir=args.checkpoint_dir,
+    )
+    if args.trace:
+        tracer.export_chrome_trace(args.trace)
+    if results is None:
+        raise SystemExit(1)
+    print(f"{len(results['t'])} time steps")
+    for name, values in results["scopes"].items():
+        print(f"{name}: final value {values[-1] if len(values) else None}")
+    if "optimization" in results:
+        print(format_optimization_report(results["optimization"]))
+    if "solver" in results:
+        print(format_solver_report(results["solver"]))
+    if "timing" in results:
+        print(format_timing_report(results["timing"]))
+    if "checkpoint" in results:
+        print(f"Checkpoint at t={results['checkpoint']['t']:g}")
 
 
 
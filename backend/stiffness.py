@@ -0,0 +1,188 @@
+from collections import deque
+
+import numpy as np
+import scipy.integrate
+from scipy.integrate import OdeSolver
+
+from backend.subsystem import flatten_diagram
+from backend.frequency import signal_model, closed_loop_matrix
+from backend.vectors import property_channels, channel_blocks
+
+EXPLICIT_METHOD = "RK45"
+IMPLICIT_METHOD = "BDF"
+SOLVERS = ("auto", "RK45", "RK23", "DOP853", "Radau", "BDF", "LSODA")
+STIFFNESS_RATIO = 1000  # Fastest over slowest decay rate above which a diagram may be stiff
+STIFF_STEPS = 10000  # ...and it is if staying stable would take an explicit method more steps than this
+RK45_STABILITY = 3.3  # Largest |h * eigenvalue| for which RK45 is stable on the negative real axis
+REJECTION_WINDOW = 100  # Recent steps in which rejected attempts are counted
+REJECTION_LIMIT = 0.1  # Rejected attempts per accepted step that make an explicit method switch...
+LIMITED_FRACTION = 0.5  # ...if at least this fraction of those steps were held back by stability
+
+
+def estimate_stiffness(blocks, wires, T):
+    """
+    Choose an integration method and first step from the eigenvalues of the linearized diagram.
+
+    The eigenvalues come from every LTI denominator with the loops closed
+    through the gains and sums around them, for each channel where blocks
+    have per-channel values. A diagram is treated as stiff when its fastest
+    and slowest time scales are far apart and an explicit method would need
+    many steps just to stay stable. Time scales slower
+    than the run itself are counted as the length of the run.
+
+    Returns a dict with the chosen "method", whether the diagram is "stiff",
+    the "fastest" and "slowest" rates in 1/s, their "ratio", the number of
+    "explicit_steps" stability would need, the "first_step" and a "reason".
+    """
+    estimate = {
+        "method": EXPLICIT_METHOD, "stiff": False, "fastest": 0.0, "slowest": 0.0, "ratio": 1.0,
+        "explicit_steps": 0, "first_step": None,
+    }
+    try:
+        blocks, wires = flatten_diagram(blocks, wires)
+        # Channels may have different gains, so each one has its own eigenvalues
+        channels = property_channels(blocks)
+        eigenvalues = np.concatenate([
+            np.linalg.eigvals(closed_loop_matrix(signal_model(channel_blocks(blocks, channel), wires)))
+            for channel in range(channels)
+        ])
+    except (ValueError, np.linalg.LinAlgError) as e:
+        estimate["reason"] = f"stiffness not estimated: {e}"
+        return estimate
+    if not len(eigenvalues):
+        estimate["reason"] = "no continuous states"
+        return estimate
+
+    fastest = float(np.abs(eigenvalues).max())
+    decay = np.abs(eigenvalues.real)
+    slowest = float(max(decay[decay > 1e-12].min(initial=np.inf), 1.0 / T))
+    slowest = min(slowest, fastest) if fastest > 0 else slowest
+    ratio = fastest / slowest if slowest > 0 else 1.0
+    explicit_steps = int(fastest * T / RK45_STABILITY)
+    stiff = ratio > STIFFNESS_RATIO and explicit_steps > STIFF_STEPS
+    estimate.update({
+        "method": IMPLICIT_METHOD if stiff else EXPLICIT_METHOD,
+        "stiff": stiff,
+        "fastest": fastest,
+        "slowest": slowest,
+        "ratio": ratio,
+        "explicit_steps": explicit_steps,
+        # Short enough to resolve the fastest transient at the start. Explicit methods pick
+        # their own from the derivatives, which also suits restarts just after a jump.
+        "first_step": min(1.0 / fastest, T / 100) if stiff else None,
+        "reason": (f"time scales {ratio:.3g}x apart, explicit steps would be limited to "
+                   f"{RK45_STABILITY / fastest:.3g} s" if stiff else
+                   f"time scales {ratio:.3g}x apart, not stiff"),
+    })
+    return estimate
+
+
+class SolverMonitor:
+    """Method in use and step statistics, carried across the integration intervals of one run."""
+
+    def __init__(self, method=EXPLICIT_METHOD):
+        self.method = method
+        self.steps = 0
+        self.rejections = 0
+        self.step_size = None  # Of the latest step, to resume from a checkpoint with
+        self.switches = []  # (time, from method, to method)
+
+
+def stability_limited(solver):
+    """
+    Whether the last step of an explicit Runge-Kutta solver was near its stability limit.
+
+    The stiffness test of Hairer and Wanner: the last two stages are both
+    evaluated at the end of the step, so their difference over the
+    difference of the states they were evaluated at estimates the largest
+    eigenvalue the step felt. Methods without such a stage count as limited.
+    """
+    if solver.C[-1] != 1:
+        return True
+    h = solver.h_previous
+    K = solver.K
+    stage_y = solver.y_old + h * (K[:-2].T @ solver.A[-1, :len(K) - 2])
+    distance = np.linalg.norm(solver.y - stage_y)
+    if distance == 0:
+        return False
+    return h * np.linalg.norm(K[-1] - K[-2]) / distance > 0.8 * RK45_STABILITY
+
+
+class SwitchingSolver(OdeSolver):
+    """
+    scipy ODE solver that runs another method and switches to an implicit
+    one when the explicit method starts rejecting many steps.
+
+    Rejected attempts are found from the extra function evaluations an
+    accepted step took. Rejections alone also happen at kinks in the input
+    and in fast oscillations, so a switch also needs most recent steps to
+    have been held back by stability. bdsim restarts the integrator after
+    each event, so the method in use is kept on the monitor passed in
+    solver_args.
+    """
+
+    def __init__(self, fun, t0, y0, t_bound, monitor=None, first_step=None, max_step=np.inf,
+                 rtol=1e-3, atol=1e-6, vectorized=False, **extraneous):
+        super().__init__(fun, t0, y0, t_bound, vectorized)
+        self.monitor = monitor if monitor is not None else SolverMonitor()
+        self.raw_fun = fun
+        self.options = {"max_step": max_step, "rtol": rtol, "atol": atol}
+        self.recent = deque(maxlen=REJECTION_WINDOW)  # (rejected attempts, stability limited) of recent steps
+        self.inner = self.start(self.monitor.method, t0, y0, first_step)
+
+    def start(self, method, t, y, first_step=None):
+        """Create the solver doing the work from time t."""
+        options = dict(self.options)
+        if first_step:
+            options["first_step"] = min(first_step, abs(self.t_bound - t), options["max_step"])
+        return getattr(scipy.integrate, method)(self.raw_fun, t, y, self.t_bound, **options)
+
+    def _step_impl(self):
+        inner = self.inner
+        nfev = inner.nfev
+        message = inner.step()
+        if inner.status == "failed":
+            return False, message
+        self.t = inner.t
+        self.y = inner.y
+        self.monitor.steps += 1
+        self.monitor.step_size = inner.step_size
+
+        stages = getattr(inner, "n_stages", None)  # Explicit Runge-Kutta methods only
+        if stages:
+            rejected = max(round((inner.nfev - nfev) / stages) - 1, 0)
+            self.monitor.rejections += rejected
+            self.recent.append((rejected, stability_limited(inner)))
+            if len(self.recent) == REJECTION_WINDOW:
+                rejections = sum(r for r, _ in self.recent) / REJECTION_WINDOW
+                limited = sum(l for _, l in self.recent) / REJECTION_WINDOW
+                if rejections > REJECTION_LIMIT and limited >= LIMITED_FRACTION:
+                    self.switch(IMPLICIT_METHOD)
+        return True, None
+
+    def switch(self, method):
+        """Carry on from the current point with another method."""
+        self.monitor.switches.append((float(self.t), self.monitor.method, method))
+        self.monitor.method = method
+        self.inner = self.start(method, self.t, self.y, first_step=self.inner.step_size)
+        self.recent.clear()
+
+    def _dense_output_impl(self):
+        return self.inner.dense_output()
+
+
+# bdsim looks integrators up by name in scipy.integrate
+scipy.integrate.SwitchingSolver = SwitchingSolver
+
+
+def format_solver_report(report):
+    """Describe the solver chosen for a run, and any switch made during it, as text."""
+    estimate = report["estimate"]
+    text = f"Solver {report['method']} ({estimate['reason']})"
+    if report.get("steps"):
+        text += f", {report['steps']} steps, {report['rejections']} rejected"
+    if report.get("segments", 0) > 1:
+        text += f" over {report['segments']} segments between source edges"
+    for t, old, new in report.get("switches", []):
+        text += f"; switched {old} -> {new} at t={t:.4g} after repeated rejections"
+    return text
@@ -0,0 +1,262 @@
+import os
+import re
+
+import numpy as np
+import bdsim
+
+from backend.discontinuities import EDGE_MARGIN, OneSided, segments
+
+STREAM_CHUNK_SIZE = 65536  # Samples buffered in memory before they are written out
+STREAM_FORMATS = ("npy", "csv")
+NPY_HEADER_SIZE = 128  # Fixed so the header can be rewritten once the final length is known
+
+
+def _npy_header(dtype, shape):
+    """Return an .npy version 1.0 header padded to exactly NPY_HEADER_SIZE bytes."""
+    header = repr({
+        "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        "fortran_order": False,
+        "shape": tuple(shape),
+    })
+    prefix = np.lib.format.MAGIC_PREFIX + bytes([1, 0])
+    length = NPY_HEADER_SIZE - len(prefix) - 2
+    if len(header) + 1 > length:
+        raise ValueError(f"Array shape {shape} too large for the stream header.")
+    header = header.ljust(length - 1) + "\n"
+    return prefix + length.to_bytes(2, "little") + header.encode("latin1")
+
+
+def stream_file_name(name):
+    """File name stem for a signal, with subsystem path separators flattened."""
+    return re.sub(r"[^\w.\- ]", "_", name)
+
+
+class StreamRecorder:
+    """
+    Collects samples of one signal and writes them to disk in fixed-size chunks.
+
+    Samples go to an .npy file whose header is rewritten with the final
+    length when the recorder is closed, so the finished file can be memory
+    mapped with np.load. With the "csv" format, each chunk is also appended
+    to a CSV file as rows of time and value.
+
+    bdsim appends to these in place of the lists it normally keeps in memory,
+    so converting one to an array gives an empty array; use view() instead.
+
+    With append=True, samples are added after those already in the files,
+    for runs resumed from a checkpoint. Recorders in mirrors receive every
+    sample too, e.g. to write the time vector into several directories.
+    """
+
+    def __init__(self, path, chunk_size=STREAM_CHUNK_SIZE, csv_path=None, time_recorder=None, append=False):
+        self.path = path
+        self.append_to_file = append and os.path.exists(path)
+        self.chunk_size = chunk_size
+        self.csv_path = csv_path
+        self.time_recorder = time_recorder  # Supplies the time column of CSV rows
+        self.count = 0  # Samples written to disk
+        self.buffer = None  # Allocated once the first sample fixes the shape and type
+        self.times = None  # Time of each buffered sample, for CSV rows
+        self.filled = 0
+        self.last = None  # Most recent sample
+        self.file = None
+        self.csv_file = None
+        self.mirrors = []
+
+    def __len__(self):
+        return self.count + self.filled
+
+    def __array__(self, dtype=None, copy=None):
+        return np.empty(0, dtype=dtype or np.float64)
+
+    def append(self, value):
+        """Add a sample, writing out the buffer whenever it is full."""
+        if self.buffer is None:
+            value = np.asarray(value)
+            dtype = np.float64 if value.dtype.kind in "biu" else value.dtype
+            if self.append_to_file:
+                self.file = open(self.path, "r+b")
+                np.lib.format.read_magic(self.file)
+                shape, _, dtype = np.lib.format.read_array_header_1_0(self.file)
+                self.count = shape[0]
+                self.file.seek(0, os.SEEK_END)
+            else:
+                self.file = open(self.path, "wb")
+                self.file.write(_npy_header(dtype, (0,) + value.shape))
+            self.buffer = np.empty((self.chunk_size,) + value.shape, dtype=dtype)
+            if self.csv_path:
+                self.csv_file = open(self.csv_path, "a" if self.append_to_file else "w")
+                self.times = np.empty(self.chunk_size)
+        self.buffer[self.filled] = value
+        if self.times is not None and self.time_recorder is not None:
+            self.times[self.filled] = self.time_recorder.last  # bdsim records the time first
+        self.last = value
+        for mirror in self.mirrors:
+            mirror.append(value)
+        self.filled += 1
+        if self.filled == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered samples to disk."""
+        if not self.filled:
+            return
+        chunk = self.buffer[:self.filled]
+        self.file.write(chunk.tobytes())
+        if self.csv_file:
+            rows = chunk.reshape(self.filled, -1)
+            if self.time_recorder is not None:
+                rows = np.column_stack([self.times[:self.filled], rows])
+            np.savetxt(self.csv_file, rows, delimiter=",")
+        self.count += self.filled
+        self.filled = 0
+
+    def close(self):
+        """Write out the remaining samples and record the final length in the header."""
+        for mirror in self.mirrors:
+            mirror.close()
+        if self.file is None:
+            return
+        self.flush()
+        self.file.seek(0)
+        self.file.write(_npy_header(self.buffer.dtype, (self.count,) + self.buffer.shape[1:]))
+        self.file.close()
+        self.file = None
+        if self.csv_file:
+            self.csv_file.close()
+            self.csv_file = None
+        self.buffer = None
+        self.times = None
+
+    def view(self):
+        """Memory-mapped view of the recorded samples, once closed."""
+        if self.count == 0:
+            return np.empty(0)
+        return np.load(self.path, mmap_mode="r")
+
+
+def truncate_stream(path, count):
+    """Cut a finished .npy stream file down to its first count samples, e.g. to resume a run from earlier on."""
+    with open(path, "r+b") as file:
+        np.lib.format.read_magic(file)
+        shape, _, dtype = np.lib.format.read_array_header_1_0(file)
+        count = min(count, shape[0])
+        file.seek(0)
+        file.write(_npy_header(dtype, (count,) + shape[1:]))
+        file.truncate(NPY_HEADER_SIZE + count * dtype.itemsize * int(np.prod(shape[1:], dtype=int)))
+
+
+class _Discard:
+    """Stands in for a history list bdsim would otherwise keep in memory."""
+
+    def __len__(self):
+        return 0
+
+    def __array__(self, dtype=None, copy=None):
+        return np.empty(0, dtype=dtype or np.float64)
+
+    def append(self, value):
+        pass
+
+
+class StreamingBDSim(bdsim.BDSim):
+    """
+    BDSim that streams the time vector and chosen watched signals to disk.
+
+    bdsim records every integration step in lists on its simulation state.
+    These are swapped for StreamRecorders when integration starts, so memory
+    use stays flat however long the simulated horizon is. The state history
+    is discarded, as nothing here uses it.
+
+    Each interval is also integrated piecewise between the known
+    discontinuities in break_times, restarting the solver at every edge and
+    evaluating the diagram only strictly inside each piece.
+
+    A cancelled run_handle (simulate.SimulationRun) stops the simulation
+    before its next interval, even if it was cancelled before bdsim had made
+    the simulation state that SimulationRun.cancel stops.
+
+    Setting resume to a checkpoint skips the part of the run before its
+    time and starts from its state. The state at each of checkpoint_times,
+    and at the end of the run, is passed to checkpoint_handler(t, x).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.time_recorder = None
+        self.watch_recorders = {}  # Watch list index -> StreamRecorder, or anything else with append
+        self.break_times = np.empty(0)  # From discontinuities.break_times
+        self.segment_count = 0
+        self.resume = None  # Checkpoint dict from backend.checkpoint
+        self.checkpoint_times = np.empty(0)
+        self.checkpoint_handler = None
+        self.run_handle = None
+
+    def run_interval(self, bd, t0, T, x0, simstate=None):
+        if not getattr(simstate, "recorders_installed", False):
+            self.install_recorders(simstate)
+            simstate.recorders_installed = True
+        if self.run_handle is not None and self.run_handle.cancelled:
+            simstate.stop = "cancelled"
+        if simstate.stop is not None:
+            return x0  # bdsim carries on through the remaining event intervals after a stop
+        if self.resume is not None:
+            if T <= self.resume["t"]:
+                return self.resume["x"]  # Already integrated before the checkpoint
+            if t0 < self.resume["t"]:
+                t0, x0 = self.resume["t"], self.resume["x"]
+        if bd.nstates == 0:
+            return self.run_stateless(bd, t0, T, x0, simstate)
+        x = x0
+        for start, end in segments(t0, T, np.union1d(self.break_times, self.checkpoint_times)):
+            self.segment_count += 1
+            with OneSided(bd, start, end):
+                x = super().run_interval(bd, start, end, x, simstate=simstate)
+            if simstate.stop is not None:
+                break
+            if self.checkpoint_handler is not None and self.is_checkpoint(end, simstate.T):
+                self.checkpoint_handler(end, x)
+        return x
+
+    def is_checkpoint(self, t, T):
+        """Whether the state at time t should be checkpointed: at a checkpoint time or the end."""
+        margin = EDGE_MARGIN * max(1.0, abs(T))
+        if t >= T - margin:
+            return True
+        return bool(len(self.checkpoint_times)) and np.min(np.abs(self.checkpoint_times - t)) <= margin
+
+    def run_stateless(self, bd, t0, T, x0, simstate):
+        """
+        Evaluate a diagram without continuous states every dt over the interval.
+
+        Stands in for bdsim's own loop for this case, which reads the
+        integrator it never created. Diagrams reduced to sources and gains
+        by optimize_diagram end up here.
+        """
+        for t in np.arange(t0, T, simstate.dt):
+            simstate.t = t
+            simstate.count += 1
+            bd.schedule_evaluate([], t)
+            simstate.tlist.append(t)
+            for i, p in enumerate(simstate.watchlist):
+                simstate.plist[i].append(p.block.output(t, p.block.inputs, p.block._x)[p.port])
+            bd.step(t)
+            self.progress.update(t)
+            if simstate.stop is not None:
+                break
+        return x0
+
+    def install_recorders(self, simstate):
+        """Replace the history lists of a run that is about to start integrating."""
+        if self.time_recorder is not None:
+            simstate.tlist = self.time_recorder
+            simstate.xlist = _Discard()
+        for i, recorder in self.watch_recorders.items():
+            simstate.plist[i] = recorder
+
+    def close_recorders(self):
+        """Finish all stream files and close any other recorders."""
+        for recorder in self.watch_recorders.values():
+            recorder.close()
+        if self.time_recorder is not None:
+            self.time_recorder.close()
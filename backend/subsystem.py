@@ -0,0 +1,167 @@
+import threading
+
+BOUNDARY_TYPES = ("INPORT", "OUTPORT")
+SINK_TYPES = ("SCOPE", "EXT_SINK")  # Blocks that record or send a signal and have no output
+
+
+def boundary_ports(contents, block_type):
+    """
+    Return the names of a subsystem's INPORT or OUTPORT blocks in port order.
+
+    Subsystem port k corresponds to the k-th boundary block when sorted by
+    its "Port" property, with the block name breaking ties.
+    """
+    ports = [
+        block for block in contents.get("blocks", [])
+        if block["type"] == block_type
+    ]
+    ports.sort(key=lambda block: (block["properties"].get("Port", 0), block["name"]))
+    return [block["name"] for block in ports]
+
+
+def subsystem_port_counts(contents):
+    """Return the number of input and output ports a subsystem exposes."""
+    return len(boundary_ports(contents, "INPORT")), len(boundary_ports(contents, "OUTPORT"))
+
+
+COMPONENT_CACHE_SIZE = 64  # Flattened subsystem contents kept between runs
+
+# id(contents) -> (contents, flattened contents). Contents are only ever
+# replaced, never edited in place, so the same dict always flattens the same
+# way; holding it keeps its id from being reused. Instances of a library
+# component share one contents dict, so it is flattened once for all of them.
+_flattened_components = {}
+_flattened_lock = threading.Lock()  # Runs on worker threads flatten too
+
+
+def _collect(blocks, wires):
+    """
+    Gather a diagram's blocks and wires with the contents of subsystems inlined.
+
+    Returns (kinds, flat blocks, wires, inputs, outputs) with inner names
+    qualified by their subsystem path, as used by flatten_diagram.
+    """
+    kinds = {}
+    flat_blocks = []
+    all_wires = []
+    inputs = {}  # INPORT block name -> (subsystem, input port)
+    outputs = {}  # (subsystem, output port) -> OUTPORT block name
+    for block in blocks:
+        name = block["name"]
+        kinds[name] = block["type"]
+        if block["type"] == "SUBSYSTEM":
+            contents = block.get("contents") or {}
+            prefix = name + "/"
+            # Subsystem port k is bridged to its k-th boundary block
+            for k, port_name in enumerate(boundary_ports(contents, "INPORT")):
+                inputs[prefix + port_name] = (name, k)
+            for k, port_name in enumerate(boundary_ports(contents, "OUTPORT")):
+                outputs[(name, k)] = prefix + port_name
+            inner_kinds, inner_blocks, inner_wires, inner_inputs, inner_outputs = _collect_contents(contents)
+            kinds.update((prefix + inner, kind) for inner, kind in inner_kinds.items())
+            flat_blocks.extend({**inner, "name": prefix + inner["name"]} for inner in inner_blocks)
+            all_wires.extend(
+                (prefix + start, start_port, prefix + end, end_port)
+                for start, start_port, end, end_port in inner_wires
+            )
+            inputs.update(
+                (prefix + port, (prefix + subsystem, k)) for port, (subsystem, k) in inner_inputs.items()
+            )
+            outputs.update(
+                ((prefix + subsystem, k), prefix + port) for (subsystem, k), port in inner_outputs.items()
+            )
+        elif block["type"] not in BOUNDARY_TYPES:
+            flat_blocks.append(dict(block))
+
+    for wire in wires:
+        all_wires.append((wire["start"], wire["start_port_index"], wire["end"], wire["end_port_index"]))
+    return kinds, flat_blocks, all_wires, inputs, outputs
+
+
+def _collect_contents(contents):
+    """_collect for a subsystem's contents, reusing the result for contents seen before."""
+    with _flattened_lock:
+        cached = _flattened_components.get(id(contents))
+    if cached is not None and cached[0] is contents:
+        return cached[1]
+    collected = _collect(contents.get("blocks", []), contents.get("wires", []))
+    with _flattened_lock:
+        if len(_flattened_components) >= COMPONENT_CACHE_SIZE:
+            del _flattened_components[next(iter(_flattened_components))]  # Oldest first
+        _flattened_components[id(contents)] = (contents, collected)
+    return collected
+
+
+def flatten_diagram(blocks, wires):
+    """
+    Inline SUBSYSTEM blocks so the diagram only contains simulatable blocks.
+
+    Inner blocks are renamed "<subsystem>/<block>", and wires that pass through
+    subsystem boundaries are rewired between the real blocks on either side.
+    Diagrams without subsystems are returned unchanged.
+    """
+    if not any(block["type"] in ("SUBSYSTEM",) + BOUNDARY_TYPES for block in blocks):
+        return blocks, wires
+
+    kinds, flat_blocks, all_wires, inputs, outputs = _collect(blocks, wires)
+    resolve = _source_resolver(kinds, all_wires, inputs, outputs)
+
+    flat_wires = []
+    for start, start_port, end, end_port in all_wires:
+        if kinds.get(end) in ("SUBSYSTEM",) + BOUNDARY_TYPES:
+            continue  # Wires into boundaries are followed from the consuming block instead
+        source = resolve((start, start_port))
+        if source is None:
+            continue
+        flat_wires.append({
+            "start": source[0],
+            "end": end,
+            "start_port_index": source[1],
+            "end_port_index": end_port,
+        })
+
+    return flat_blocks, flat_wires
+
+
+def wire_sources(blocks, wires):
+    """
+    The real block output carried by every wire of a diagram, at any depth.
+
+    Returns {(start, start port): (block, port)} keyed by path-qualified
+    wire starts, as named by flatten_diagram, with None for signals that
+    come from an unconnected subsystem boundary.
+    """
+    kinds, _, all_wires, inputs, outputs = _collect(blocks, wires)
+    resolve = _source_resolver(kinds, all_wires, inputs, outputs)
+    return {(start, start_port): resolve((start, start_port)) for start, start_port, _, _ in all_wires}
+
+
+def _source_resolver(kinds, all_wires, inputs, outputs):
+    """Function following a (block, port) source through subsystem boundaries, from _collect's results."""
+    for name, block_type in kinds.items():
+        if block_type in BOUNDARY_TYPES and "/" not in name:
+            raise ValueError(f"{block_type} block {name} is only allowed inside a subsystem.")
+
+    # The source feeding each boundary input: subsystem inputs and OUTPORT inputs
+    drivers = {}
+    for start, start_port, end, end_port in all_wires:
+        if kinds.get(end) in ("SUBSYSTEM", "OUTPORT"):
+            drivers[(end, end_port)] = (start, start_port)
+
+    def resolve(source):
+        """Follow a source through boundary blocks until it reaches a real block output."""
+        for _ in range(len(kinds) + 1):
+            name, port = source
+            kind = kinds.get(name)
+            if kind == "SUBSYSTEM":
+                boundary = outputs.get((name, port))
+                source = drivers.get((boundary, 0)) if boundary else None
+            elif kind == "INPORT":
+                source = drivers.get(inputs[name]) if name in inputs else None
+            else:
+                return source
+            if source is None:
+                return None  # Boundary left unconnected
+        raise ValueError("Subsystem boundary ports form a loop.")
+
+    return resolve
@@ -0,0 +1,92 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from backend.distributed import (
+    PROTOCOL_VERSION, WorkerServer, check_request, receive_message, run_sweep, send_message, sweep_grid,
+)
+
+GAINS = [0.5, 1, 2, 3, 4, 5, 6, 7]
+
+
+def block(block_type, name, **properties):
+    return {"type": block_type, "name": name, "properties": properties, "x": 0, "y": 0}
+
+
+def wire(start, end):
+    return {"start": start, "start_port_index": 0, "end": end, "end_port_index": 0}
+
+
+BLOCKS = [block("STEP", "STEP 1", **{"Start Time": 0}), block("GAIN", "GAIN 1", Gain=1), block("SCOPE", "SCOPE 1")]
+WIRES = [wire("STEP 1", "GAIN 1"), wire("GAIN 1", "SCOPE 1")]
+
+
+class DyingServer(WorkerServer):
+    """Worker that stops listening and drops its connection once it is sent a job, as if killed mid-run."""
+
+    def __init__(self):
+        super().__init__("127.0.0.1:0")
+        self.killed = threading.Event()
+        self.RequestHandlerClass = self.die
+
+    def die(self, request, client_address, server):
+        send_message(request, {"type": "hello", "protocol": PROTOCOL_VERSION, "host": "dying"})
+        receive_message(request)
+        self.socket.close()
+        request.close()
+        self.killed.set()
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.address
+
+
+def unreachable_address():
+    """A localhost port nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+@pytest.fixture
+def workers():
+    servers = [WorkerServer("127.0.0.1:0") for _ in range(2)]
+    yield [serve(server) for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_sweep_survives_lost_workers(workers):
+    dying = DyingServer()
+    addresses = workers + [serve(dying), unreachable_address()]
+    points = sweep_grid({("GAIN 1", "Gain", None): GAINS})
+
+    jobs = run_sweep(BLOCKS, WIRES, 1, points, addresses, options={"step": 0.01})
+
+    assert dying.killed.is_set()
+    for job, gain in zip(jobs, GAINS):
+        assert job.error is None
+        assert job.worker in workers
+        np.testing.assert_allclose(job.results["scopes"]["SCOPE 1"][-1], gain)
+    # The job the dying worker took was run again elsewhere
+    assert any(job.attempts == 2 for job in jobs)
+
+
+def test_workers_refuse_local_io():
+    with pytest.raises(ValueError, match="option 'stream_dir'"):
+        check_request({"blocks": BLOCKS, "wires": WIRES, "options": {"step": 0.01, "stream_dir": "/tmp"}})
+    with pytest.raises(ValueError, match="Stream To"):
+        check_request({
+            "blocks": BLOCKS, "wires": WIRES, "overrides": [("SCOPE 1", "Stream To", None, "/tmp")],
+        })
+    with pytest.raises(ValueError, match="FROM_FILE"):
+        check_request({
+            "blocks": BLOCKS + [block("FROM_FILE", "FROM_FILE 1", File="/etc/passwd")],
+            "wires": WIRES + [wire("FROM_FILE 1", "SCOPE 1")],
+        })
+    blocks, options = check_request({"blocks": BLOCKS, "wires": WIRES, "options": {"step": 0.01, "solver": "RK45"}})
+    assert options == {"step": 0.01, "solver": "RK45"}
@@ -0,0 +1,122 @@
+import socket
+import threading
+import uuid
+
+import numpy as np
+import pytest
+
+from backend.external_io import SharedMemoryRing, UdpChannel
+from backend.simulate import run_bdsim_simulation
+
+SAMPLE = [1.5, -2.0]
+GAIN = 3
+
+
+def block(block_type, name, **properties):
+    return {"type": block_type, "name": name, "properties": properties, "x": 0, "y": 0}
+
+
+def wire(start, end):
+    return {"start": start, "start_port_index": 0, "end": end, "end_port_index": 0}
+
+
+def free_address():
+    """A localhost UDP address nothing is bound to."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+def loop_diagram(transport, source_address, sink_address):
+    """External source -> gain -> external sink, with a scope on the gain."""
+    io = {"Transport": transport, "Width": len(SAMPLE)}
+    blocks = [
+        block("EXT_SOURCE", "EXT_SOURCE 1", Address=source_address, **io),
+        block("GAIN", "GAIN 1", Gain=GAIN),
+        block("EXT_SINK", "EXT_SINK 1", Address=sink_address, **io),
+        block("SCOPE", "SCOPE 1"),
+    ]
+    wires = [wire("EXT_SOURCE 1", "GAIN 1"), wire("GAIN 1", "EXT_SINK 1"), wire("GAIN 1", "SCOPE 1")]
+    return blocks, wires
+
+
+def test_udp_drops_datagrams_of_the_wrong_size():
+    address = free_address()
+    channel = UdpChannel(address, len(SAMPLE), receive=True)
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        host, port = channel.address
+        sender.sendto(np.array(SAMPLE, dtype="<f8").tobytes(), (host, port))
+        sender.sendto(np.array([9.0], dtype="<f8").tobytes(), (host, port))
+        sender.sendto(np.array([9.0, 9.0, 9.0], dtype="<f8").tobytes(), (host, port))
+        threading.Event().wait(0.1)
+        assert channel.receive_latest()
+        np.testing.assert_array_equal(channel.buffer, SAMPLE)
+
+        sender.sendto(np.array([9.0], dtype="<f8").tobytes(), (host, port))
+        threading.Event().wait(0.1)
+        assert not channel.receive_latest()
+        np.testing.assert_array_equal(channel.buffer, SAMPLE)
+    finally:
+        sender.close()
+        channel.close()
+
+
+def test_udp_round_trip():
+    source_address, sink_address = free_address(), free_address()
+    peer = UdpChannel(sink_address, len(SAMPLE), receive=True)
+    sender = UdpChannel(source_address, len(SAMPLE))
+    # The source only binds once the run starts, so keep sending until it is over
+    done = threading.Event()
+
+    def send():
+        while not done.wait(0.005):
+            sender.send(SAMPLE)
+
+    thread = threading.Thread(target=send, daemon=True)
+    thread.start()
+    try:
+        blocks, wires = loop_diagram("udp", source_address, sink_address)
+        result = run_bdsim_simulation(blocks, wires, T=0.5, graphics=False, pace=1)
+    finally:
+        done.set()
+        thread.join()
+        sender.close()
+    try:
+        assert result is not None
+        np.testing.assert_allclose(result["scopes"]["SCOPE 1"][-1], np.multiply(SAMPLE, GAIN))
+        threading.Event().wait(0.1)
+        assert peer.receive_latest()
+        np.testing.assert_allclose(peer.buffer, np.multiply(SAMPLE, GAIN))
+    finally:
+        peer.close()
+
+
+def test_shared_memory_round_trip():
+    source_name, sink_name = f"bdsim-test-{uuid.uuid4().hex[:8]}", f"bdsim-test-{uuid.uuid4().hex[:8]}"
+    source = SharedMemoryRing(source_name, len(SAMPLE), slots=16)
+    sink = SharedMemoryRing(sink_name, len(SAMPLE), slots=16)
+    try:
+        source.send(SAMPLE)
+        blocks, wires = loop_diagram("shm", source_name, sink_name)
+        result = run_bdsim_simulation(blocks, wires, T=1, graphics=False, step=0.01)
+
+        assert result is not None
+        np.testing.assert_allclose(result["scopes"]["SCOPE 1"][-1], np.multiply(SAMPLE, GAIN))
+        assert sink.receive_latest()
+        np.testing.assert_allclose(sink.buffer, np.multiply(SAMPLE, GAIN))
+        assert int(sink.count[0]) >= len(result["t"])
+    finally:
+        source.close()
+        sink.close()
+
+
+@pytest.mark.parametrize("width", [1, 3])
+def test_shared_memory_refuses_other_widths(width):
+    name = f"bdsim-test-{uuid.uuid4().hex[:8]}"
+    ring = SharedMemoryRing(name, 2, slots=4)
+    try:
+        with pytest.raises(ValueError, match="2-wide"):
+            SharedMemoryRing(name, width)
+    finally:
+        ring.close()
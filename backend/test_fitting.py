@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from backend.fitting import FitModel, fit_parameters, format_fit_report, set_parameter
+
+T = 5
+
+
+def block(block_type, name, **properties):
+    return {"type": block_type, "name": name, "properties": properties, "x": 0, "y": 0}
+
+
+def wire(start, end):
+    return {"start": start, "start_port_index": 0, "end": end, "end_port_index": 0}
+
+
+# Two channels, so build_diagram compiles a VectorStep and a VectorLTI
+BLOCKS = [
+    block("STEP", "STEP 1", **{"Amplitude": [1, 2], "Start Time": [0.5, 1]}),
+    block("LTI", "LTI 1", Numerator=[2], Denominator=[1, 3, 2]),
+    block("SCOPE", "SCOPE 1"),
+]
+WIRES = [wire("STEP 1", "LTI 1"), wire("LTI 1", "SCOPE 1")]
+TIMES = np.linspace(0, T, 200)
+
+
+def rebuilt(parameter, value):
+    """Scope signal of a model compiled from scratch with a parameter set to value."""
+    blocks = [{**b, "properties": dict(b["properties"])} for b in BLOCKS]
+    set_parameter(next(b for b in blocks if b["name"] == parameter[0])["properties"], parameter, value)
+    model = FitModel(blocks, WIRES, [parameter], "SCOPE 1", TIMES, T=T)
+    return model.simulate([value])
+
+
+@pytest.mark.parametrize("parameter, value", [
+    (("LTI 1", "Denominator", 1), 4.0),
+    (("LTI 1", "Numerator", 0), 3.0),
+    (("STEP 1", "Amplitude", 1), 0.5),
+    (("STEP 1", "Start Time", 0), 2.0),
+])
+def test_updated_vector_blocks_match_rebuilt_ones(parameter, value):
+    model = FitModel(BLOCKS, WIRES, [parameter], "SCOPE 1", TIMES, T=T)
+    before = model.simulate(model.initial_values())
+    after = model.simulate([value])
+    assert after.shape == (len(TIMES), 2)
+    assert not np.allclose(after, before)
+    np.testing.assert_allclose(after, rebuilt(parameter, value), atol=1e-9)
+
+
+def test_fit_vector_lti():
+    parameter = ("LTI 1", "Denominator", 1)
+    measured = (TIMES, rebuilt(parameter, 4.0))
+    result = fit_parameters(BLOCKS, WIRES, [parameter], "SCOPE 1", measured, T=T, workers=2, max_evaluations=60)
+    assert result["values"][0] == pytest.approx(4.0, rel=1e-3)
+    assert result["error"] < 1e-4
+
+
+def test_failed_simulations_are_counted():
+    # Most of this range is too stiff for the fixed step, so those runs fail
+    parameter = ("LTI 1", "Denominator", 1)
+    measured = (TIMES, rebuilt(parameter, 4.0))
+    result = fit_parameters(
+        BLOCKS, WIRES, [parameter], "SCOPE 1", measured, T=T, bounds=[(1, 1e4)],
+        method="differential_evolution", workers=2, max_evaluations=30,
+    )
+    assert 0 < result["failures"] < result["evaluations"]
+    assert "too large" in result["first_failure"]
+    assert f"{result['failures']} simulations failed" in format_fit_report(result)
@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+import pytest
+
+from backend.optimizer import optimize_diagram
+from backend.simulate import run_bdsim_simulation
+
+
+def block(block_type, name, **properties):
+    return {"type": block_type, "name": name, "properties": properties, "x": 0, "y": 0}
+
+
+def wire(start, end, end_port=0):
+    return {"start": start, "start_port_index": 0, "end": end, "end_port_index": end_port}
+
+
+def gain_chain(count):
+    blocks = [block("STEP", "STEP 1")] + [block("GAIN", f"GAIN {i}", Gain=1.001) for i in range(count)]
+    blocks.append(block("SCOPE", "SCOPE 1"))
+    names = [b["name"] for b in blocks]
+    return blocks, [wire(start, end) for start, end in zip(names, names[1:])]
+
+
+CASES = {
+    # The wire into port 1 is listed first, so port order and wire order disagree
+    "sum by port": (
+        [block("CONSTANT", "C1", Value=1), block("CONSTANT", "C2", Value=5),
+         block("SUM", "SUM 1", Inputs="+-"), block("SCOPE", "SCOPE 1")],
+        [wire("C1", "SUM 1", 1), wire("C2", "SUM 1", 0), wire("SUM 1", "SCOPE 1")],
+    ),
+    "constant chain": (
+        [block("CONSTANT", "C1", Value=2), block("GAIN", "G1", Gain=3), block("CONSTANT", "C2", Value=1),
+         block("SUM", "SUM 1", Inputs="-+"), block("GAIN", "G2", Gain=-0.5), block("SCOPE", "SCOPE 1")],
+        [wire("C1", "G1"), wire("C2", "SUM 1", 1), wire("G1", "SUM 1", 0),
+         wire("SUM 1", "G2"), wire("G2", "SCOPE 1")],
+    ),
+    "gain chain": gain_chain(5),
+    "dead blocks": (
+        [block("STEP", "STEP 1", **{"Start Time": 1}), block("GAIN", "G1", Gain=2), block("GAIN", "G2", Gain=4),
+         block("SCOPE", "SCOPE 1"), block("RAMP", "RAMP 1"), block("GAIN", "G3", Gain=2)],
+        [wire("STEP 1", "G1"), wire("G1", "G2"), wire("G2", "SCOPE 1"), wire("RAMP 1", "G3")],
+    ),
+    "merge beside a sum": (
+        [block("STEP", "STEP 1"), block("RAMP", "RAMP 1"), block("GAIN", "G1", Gain=2),
+         block("GAIN", "G2", Gain=3), block("SUM", "SUM 1", Inputs="+-"), block("SCOPE", "SCOPE 1")],
+        [wire("G2", "SUM 1", 1), wire("STEP 1", "G1"), wire("G1", "G2"),
+         wire("RAMP 1", "SUM 1", 0), wire("SUM 1", "SCOPE 1")],
+    ),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_optimized_diagram_computes_the_same(case):
+    blocks, wires = CASES[case]
+    plain = run_bdsim_simulation(blocks, wires, T=2, graphics=False, step=0.01, optimize=False)
+    optimized = run_bdsim_simulation(blocks, wires, T=2, graphics=False, step=0.01, optimize=True)
+    assert optimized["optimization"]["after"] < optimized["optimization"]["before"]
+    np.testing.assert_allclose(optimized["t"], plain["t"])
+    np.testing.assert_allclose(optimized["scopes"]["SCOPE 1"], plain["scopes"]["SCOPE 1"])
+
+
+def test_sum_folds_by_port():
+    blocks, wires = CASES["sum by port"]
+    _, _, report = optimize_diagram(blocks, wires)
+    assert report["folded"] == [("SUM 1", 4)]
+
+
+def test_long_gain_chain_is_fast():
+    blocks, wires = gain_chain(4000)
+    start = time.perf_counter()
+    blocks, wires, report = optimize_diagram(blocks, wires)
+    assert time.perf_counter() - start < 1.0
+    assert len(report["merged"]) == 3999
+    (gain,) = [b for b in blocks if b["type"] == "GAIN"]
+    assert gain["properties"]["Gain"] == pytest.approx(1.001 ** 4000)
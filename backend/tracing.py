@@ -0,0 +1,126 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+MAX_EVENTS = 200000  # Spans kept for export; the oldest are dropped beyond this
+SLOW_SPAN_MS = 16.0  # Spans longer than a 60 Hz frame are listed as slow
+TRACE_ENV = "BDSIM_GUI_TRACE"  # Set to 1 to trace from startup
+
+
+class Tracer:
+    """
+    Records timed spans of named operations for the performance overlay and
+    Chrome trace export.
+
+    While disabled, span() and traced functions only test the enabled flag,
+    so the instrumentation can stay in hot paths such as paint and item
+    change handlers. Spans from any thread are kept in one bounded deque,
+    which is safe to append to without a lock.
+    """
+
+    def __init__(self):
+        self.enabled = os.environ.get(TRACE_ENV, "") not in ("", "0")
+        self.events = deque(maxlen=MAX_EVENTS)  # (name, category, start ns, duration ns, thread id, args)
+        self.slow = deque(maxlen=50)  # (name, duration ms, wall time) of recent slow spans
+        self.origin = time.perf_counter_ns()
+        self.thread_names = {}
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def clear(self):
+        self.events.clear()
+        self.slow.clear()
+
+    def record(self, name, category, start, duration, args=None):
+        """Add a finished span; start and duration are perf_counter_ns values."""
+        thread = threading.get_ident()
+        if thread not in self.thread_names:
+            self.thread_names[thread] = threading.current_thread().name
+        self.events.append((name, category, start, duration, thread, args))
+        if duration >= SLOW_SPAN_MS * 1e6:
+            self.slow.append((name, duration / 1e6, time.time()))
+
+    def span(self, name, category="gui", **args):
+        """Context manager timing the enclosed code as one span."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args or None)
+
+    def traced(self, name=None, category="gui"):
+        """Decorator that records each call of a function as a span."""
+        def decorate(function):
+            label = name or function.__qualname__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter_ns()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(label, category, start, time.perf_counter_ns() - start)
+            return wrapper
+        return decorate
+
+    def chrome_trace(self):
+        """The recorded spans in Chrome's trace event format, for chrome://tracing or Perfetto."""
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread, "args": {"name": thread_name}}
+            for thread, thread_name in self.thread_names.items()
+        ]
+        for name, category, start, duration, thread, args in list(self.events):
+            event = {
+                "name": name, "cat": category, "ph": "X", "pid": pid, "tid": thread,
+                "ts": (start - self.origin) / 1e3, "dur": duration / 1e3,  # Microseconds
+            }
+            if args:
+                event["args"] = args
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        """Write the recorded spans to a Chrome trace JSON file."""
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file, default=str)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.category, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+# Shared by the whole application
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
@@ -0,0 +1,268 @@
+import math
+import os
+
+import numpy as np
+import scipy.signal
+from bdsim.components import SourceBlock, FunctionBlock, TransferBlock, EventSource
+
+from backend.file_source import load_recording
+from backend.subsystem import SINK_TYPES
+
+# Properties that may hold one value per channel instead of a single value
+CHANNEL_PROPERTIES = {
+    "STEP": ("Start Time", "Amplitude"),
+    "RAMP": ("Start Time", "Slope"),
+    "WAVEFORM": ("Frequency", "Amplitude", "Offset", "Phase"),
+    "CONSTANT": ("Value",),
+    "GAIN": ("Gain",),
+}
+ELEMENTWISE_TYPES = ("GAIN", "SUM", "LTI")  # Blocks whose output is as wide as their inputs
+_recording_widths = {}  # (path, modification time) -> channels, so each recording is opened once
+
+
+def channel_values(value, width):
+    """A property as an array with one value per channel; single values are repeated."""
+    values = np.asarray(value, dtype=float).reshape(-1)
+    if len(values) == 1:
+        return np.full(width, values[0])
+    if len(values) != width:
+        raise ValueError(f"Expected 1 or {width} values, got {len(values)}.")
+    return values
+
+
+def combine_widths(name, widths):
+    """
+    Width of a signal made from signals of the given widths, channel by channel.
+
+    Single-channel signals are repeated to match the others, as NumPy
+    broadcasts them, but two different widths above one cannot be combined.
+    """
+    wide = set(width for width in widths if width > 1)
+    if len(wide) > 1:
+        raise ValueError(f"{name} combines signals of widths {' and '.join(map(str, sorted(wide)))}.")
+    return wide.pop() if wide else 1
+
+
+def _recording_width(path):
+    """Channels of a recording for FROM_FILE, or 1 if it cannot be opened; see load_recording."""
+    try:
+        key = (os.path.abspath(path), os.path.getmtime(path))
+    except OSError:
+        return 1  # Reported when the run opens the file
+    if key not in _recording_widths:
+        try:
+            _, y = load_recording(path)
+        except (OSError, ValueError):
+            return 1
+        _recording_widths[key] = 1 if y.ndim == 1 else y.shape[1]
+    return _recording_widths[key]
+
+
+def _own_width(block):
+    """Width a block's properties give its output, before looking at its inputs."""
+    properties = block["properties"]
+    if block["type"] == "EXT_SOURCE":
+        return int(properties.get("Width", 1))
+    if block["type"] == "FROM_FILE":
+        return _recording_width(properties.get("File", ""))
+    return combine_widths(block["name"], [
+        len(properties[prop]) for prop in CHANNEL_PROPERTIES.get(block["type"], ())
+        if isinstance(properties.get(prop), list)
+    ])
+
+
+def signal_widths(blocks, wires):
+    """
+    Infer the number of channels of every block's signal.
+
+    Sources take their width from list-valued properties, such as a STEP
+    with one Amplitude per channel, or from their Width or recording.
+    GAIN, SUM and LTI blocks are as wide as their inputs, and sinks record
+    the width of the signal they receive. Widths are propagated around
+    feedback loops until they settle.
+
+    blocks and wires must already be flattened. Returns the width by block
+    name, and raises ValueError where signals of different widths meet or
+    an EXT_SINK's Width does not match its input.
+    """
+    sources = {block["name"]: [] for block in blocks}
+    for wire in wires:
+        if wire["end"] in sources:
+            sources[wire["end"]].append(wire["start"])
+    own = {block["name"]: _own_width(block) for block in blocks}
+
+    widths = {}
+    for _ in range(len(blocks) + 1):
+        changed = False
+        for block in blocks:
+            name = block["name"]
+            width = own[name]
+            if block["type"] in ELEMENTWISE_TYPES + SINK_TYPES:
+                incoming = [widths[source] for source in sources[name] if source in widths]
+                width = combine_widths(name, [width] + incoming)
+            if widths.get(name) != width:
+                widths[name] = width
+                changed = True
+        if not changed:
+            break
+
+    for block in blocks:
+        if block["type"] == "EXT_SINK" and sources[block["name"]]:
+            width = int(block["properties"].get("Width", 1))
+            if widths[block["name"]] not in (1, width):
+                raise ValueError(
+                    f"{block['name']} sends {width} values per sample but its input has "
+                    f"{widths[block['name']]} channels."
+                )
+    return widths
+
+
+def property_channels(blocks):
+    """Most values any block has for a per-channel property, or 1 if none has several."""
+    return max((
+        len(block["properties"][prop]) for block in blocks
+        for prop in CHANNEL_PROPERTIES.get(block["type"], ())
+        if isinstance(block["properties"].get(prop), list)
+    ), default=1)
+
+
+def channel_blocks(blocks, channel):
+    """Copy of flattened blocks with every per-channel property reduced to one channel's value."""
+    reduced = []
+    for block in blocks:
+        properties = block["properties"]
+        lists = [prop for prop in CHANNEL_PROPERTIES.get(block["type"], ()) if isinstance(properties.get(prop), list)]
+        if lists:
+            properties = dict(properties)
+            for prop in lists:
+                values = properties[prop]
+                properties[prop] = values[channel] if len(values) > 1 else values[0]
+            block = {**block, "properties": properties}
+        reduced.append(block)
+    return reduced
+
+
+class VectorStep(SourceBlock, EventSource):
+    """STEP with a start time and amplitude per channel."""
+    nin = 0
+    nout = 1
+
+    def __init__(self, T, on, **blockargs):
+        super().__init__(**blockargs)
+        self.T = T
+        self.on = on
+
+    def start(self, simstate):
+        for t in np.unique(self.T):
+            simstate.declare_event(self, t)
+
+    def output(self, t, inports, x):
+        return [np.where(t >= self.T, self.on, 0.0)]
+
+
+class VectorRamp(SourceBlock, EventSource):
+    """RAMP with a start time and slope per channel."""
+    nin = 0
+    nout = 1
+
+    def __init__(self, T, slope, **blockargs):
+        super().__init__(**blockargs)
+        self.T = T
+        self.slope = slope
+
+    def start(self, simstate):
+        for t in np.unique(self.T):
+            simstate.declare_event(self, t)
+
+    def output(self, t, inports, x):
+        return [np.where(t >= self.T, self.slope * (t - self.T), 0.0)]
+
+
+class VectorWaveform(SourceBlock, EventSource):
+    """WAVEFORM with a frequency, amplitude, offset and phase per channel, as bdsim computes it."""
+    nin = 0
+    nout = 1
+
+    def __init__(self, wave, freq, amplitude, offset, phase, duty=0.5, **blockargs):
+        super().__init__(**blockargs)
+        if wave not in ("square", "triangle", "sine"):
+            raise ValueError("bad waveform")
+        self.wave = wave
+        self.freq = freq
+        self.amplitude = amplitude
+        self.offset = offset
+        self.phase = phase
+        self.duty = duty
+
+    def start(self, simstate):
+        if self.wave == "square":
+            edges = (0.0, self.duty)
+        elif self.wave == "triangle":
+            edges = (0.25, 0.75)
+        else:
+            return
+        for freq, phase in set(zip(self.freq, self.phase)):
+            periods = np.arange(math.ceil(simstate.T * freq) + 1)
+            for edge in edges:
+                for t in (periods + edge + phase) / freq:
+                    if t < simstate.T:
+                        simstate.declare_event(self, t)
+
+    def output(self, t, inports, x):
+        phase = (t * self.freq - self.phase) % 1.0
+        if self.wave == "square":
+            out = np.where(phase < self.duty, 1.0, -1.0)
+        elif self.wave == "triangle":
+            out = np.select(
+                [phase < 0.25, phase < 0.75],
+                [phase * 4, 1 - 4 * (phase - 0.25)],
+                -1 + 4 * (phase - 0.75),
+            )
+        else:
+            out = np.sin(phase * 2 * math.pi)
+        return [out * self.amplitude + self.offset]
+
+
+class ElementwiseGain(FunctionBlock):
+    """GAIN with one gain per channel; bdsim's GAIN would take an array gain as a matrix product."""
+    nin = 1
+    nout = 1
+
+    def __init__(self, K, **blockargs):
+        super().__init__(**blockargs)
+        self.K = K
+
+    def output(self, t, inports, x):
+        return [self.K * inports[0]]
+
+
+class VectorLTI(TransferBlock):
+    """
+    The same strictly proper transfer function applied to every channel.
+
+    The states of all channels are one (channels, order) array, so every
+    evaluation is a single matrix product instead of one block per channel.
+    """
+    nin = 1
+    nout = 1
+
+    def __init__(self, N, D, width, **blockargs):
+        super().__init__(**blockargs)
+        A, B, C, D = scipy.signal.tf2ss(N, D)
+        if len(np.flatnonzero(D)) > 0:
+            raise ValueError("D matrix is not zero")
+        self.A = A
+        self.B = B[:, 0]
+        self.C = C[0]
+        self.width = width
+        self.order = A.shape[0]
+        self.nstates = width * self.order
+        self._x0 = np.zeros(self.nstates)
+
+    def output(self, t, inports, x):
+        return [x.reshape(self.width, self.order) @ self.C]
+
+    def deriv(self, t, inports, x):
+        states = x.reshape(self.width, self.order)
+        u = np.broadcast_to(np.asarray(inports[0], dtype=float), (self.width,))
+        return (states @ self.A.T + np.outer(u, self.B)).reshape(-1)
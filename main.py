@@ -1,22 +1,51 @@
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QWidget, QSplitter, QToolBar,
-    QComboBox, QLabel, QAction, QLineEdit, QMessageBox, QFileDialog, QHBoxLayout
+    QComboBox, QLabel, QAction, QLineEdit, QMessageBox, QFileDialog, QHBoxLayout, QProgressBar,
+    QDockWidget, QInputDialog
 )
-from PyQt5.QtCore import Qt
-import json
+from PyQt5.QtCore import Qt, QTimer
+import os
 
 from GUI.canvas import DiagramCanvas
 from GUI.properties import PropertiesEditor
 from GUI.blocks import Block
+from GUI.diagram_file import DiagramFileWorker, COMPACT_EXTENSION
+from GUI.journal import DiagramJournal, AUTOSAVE_DIR
+from GUI.simulation_worker import SimulationWorker, FitWorker
+from GUI.fit_dialog import FitDialog
+from GUI.results_viewer import ResultsViewer
+from GUI.minimap import Minimap
+from GUI.frequency_viewer import FrequencyViewer
+from GUI.performance_overlay import PerformanceOverlay
+from GUI.job_panel import JobPanel
+from GUI.diagram_file import load_diagram
 from backend.simulate import run_bdsim_simulation
+from backend.realtime import format_timing_report
+from backend.fitting import format_fit_report, set_parameter
+from backend.frequency import analyze_frequency_response
+from backend.tracing import tracer, span
+from backend.stiffness import SOLVERS, format_solver_report
+from backend.optimizer import format_optimization_report
+from backend.subsystem import flatten_diagram
+from backend.vectors import signal_widths
+from backend.job_queue import JobQueue
+from backend.library import LIBRARY_EXTENSION, add_to_library, library_contents, library_names
+from backend.checkpoint import diagram_fingerprint, save_run, load_run, run_directory, append_results
+
+
+DIAGRAM_FILE_FILTER = (
+    f"JSON Files (*.json);;Compact Diagram Files (*{COMPACT_EXTENSION});;All Files (*)"
+)
+LIBRARY_FILE_FILTER = f"Component Libraries (*{LIBRARY_EXTENSION});;All Files (*)"
 
 
 class MainWindow(QMainWindow):
     """Main application window."""
 
-    def __init__(self):
+    def __init__(self, autosave_dir=AUTOSAVE_DIR):
         super().__init__()
         self.setWindowTitle("BDSim GUI")
+        self.autosave_dir = autosave_dir  # Where this window's autosave session directory is made
         self.resize(1200, 800)
 
         # Initialize UI components
@@ -25,6 +54,24 @@ class MainWindow(QMainWindow):
         # Set default block type
         self.current_block_type = self.block_type_selector.currentText()
 
+        # Background diagram load/save
+        self.file_worker = None
+
+        # Background real-time run
+        self.paced_worker = None
+
+        # Background parameter fit
+        self.fit_worker = None
+
+        # Results and final checkpoint of the latest run, to extend it
+        self.last_run = None
+
+        # Autosave journal and crash recovery
+        self.setup_autosave()
+
+        # Live re-simulation
+        self.setup_live_simulation()
+
     def setup_ui(self):
         """Setup the main UI components."""
         # Create the central layout
@@ -52,6 +99,27 @@ class MainWindow(QMainWindow):
         self.central_widget.setLayout(self.layout)
         self.setCentralWidget(self.central_widget)
 
+        # Add the simulation results panel
+        self.setup_results_panel()
+
+        # Add the diagram overview
+        self.setup_minimap()
+
+        # Add the frequency-response panel
+        self.setup_frequency_panel()
+        self.setup_job_panel()
+
+        # Frame time and slow operation overlay, shown while tracing
+        self.performance_overlay = PerformanceOverlay(self.canvas)
+        if tracer.enabled:
+            self.performance_action.setChecked(True)
+
+        # Progress bar for background file operations
+        self.file_progress = QProgressBar()
+        self.file_progress.setMaximumWidth(200)
+        self.file_progress.hide()
+        self.statusBar().addPermanentWidget(self.file_progress)
+
     def setup_toolbars(self):
         """Setup toolbars with grouped actions split into two rows."""
         # First Toolbar: Block Operations and Edit Operations
@@ -63,7 +131,10 @@ class MainWindow(QMainWindow):
         self.block_toolbar.addWidget(block_label)
 
         self.block_type_selector = QComboBox()
-        self.block_type_selector.addItems(["STEP", "GAIN", "SUM", "SCOPE", "RAMP", "WAVEFORM", "CONSTANT", "LTI"])
+        self.block_type_selector.addItems([
+            "STEP", "GAIN", "SUM", "SCOPE", "RAMP", "WAVEFORM", "CONSTANT", "LTI", "FROM_FILE",
+            "SUBSYSTEM", "INPORT", "OUTPORT", "EXT_SOURCE", "EXT_SINK",
+        ])
         self.block_type_selector.currentTextChanged.connect(self.set_block_type)
         self.block_toolbar.addWidget(self.block_type_selector)
 
@@ -84,6 +155,30 @@ class MainWindow(QMainWindow):
         ungroup_action.triggered.connect(self.ungroup_selected_items)
         self.block_toolbar.addAction(ungroup_action)
 
+        # Subsystem Buttons
+        create_subsystem_action = QAction("Make Subsystem", self)
+        create_subsystem_action.triggered.connect(self.create_subsystem)
+        self.block_toolbar.addAction(create_subsystem_action)
+
+        open_subsystem_action = QAction("Open Subsystem", self)
+        open_subsystem_action.triggered.connect(self.open_subsystem)
+        self.block_toolbar.addAction(open_subsystem_action)
+
+        close_subsystem_action = QAction("Close Subsystem", self)
+        close_subsystem_action.triggered.connect(self.close_subsystem)
+        self.block_toolbar.addAction(close_subsystem_action)
+
+        # Library components: subsystems stored once and instanced by reference
+        save_component_action = QAction("Save to Library", self)
+        save_component_action.setToolTip("Store the selected subsystem in a component library file")
+        save_component_action.triggered.connect(self.save_to_library)
+        self.block_toolbar.addAction(save_component_action)
+
+        insert_component_action = QAction("Insert Component", self)
+        insert_component_action.setToolTip("Add an instance of a component from a library file")
+        insert_component_action.triggered.connect(self.insert_component)
+        self.block_toolbar.addAction(insert_component_action)
+
         # Second Toolbar: File and Simulation Operations
         self.main_toolbar = QToolBar("Main Operations")
         self.addToolBar(Qt.TopToolBarArea, self.main_toolbar)
@@ -108,10 +203,60 @@ class MainWindow(QMainWindow):
         self.sim_time_input = QLineEdit("5")
         self.main_toolbar.addWidget(self.sim_time_input)
 
+        self.main_toolbar.addWidget(QLabel("Step:"))
+        self.step_input = QLineEdit()
+        self.step_input.setPlaceholderText("adaptive")
+        self.step_input.setMaximumWidth(80)
+        self.main_toolbar.addWidget(self.step_input)
+
+        self.main_toolbar.addWidget(QLabel("Solver:"))
+        self.solver_selector = QComboBox()
+        self.solver_selector.addItems(SOLVERS)
+        self.solver_selector.setToolTip("auto picks an explicit or implicit method from the diagram's stiffness")
+        self.main_toolbar.addWidget(self.solver_selector)
+
+        self.main_toolbar.addWidget(QLabel("Pace:"))
+        self.pace_selector = QComboBox()
+        self.pace_selector.addItem("As fast as possible", None)
+        for speed in (0.5, 1, 2, 10):
+            self.pace_selector.addItem(f"{speed:g}x real time", float(speed))
+        self.main_toolbar.addWidget(self.pace_selector)
+
         simulate_action = QAction("Simulate", self)
         simulate_action.triggered.connect(self.simulate)
         self.main_toolbar.addAction(simulate_action)
 
+        extend_action = QAction("Extend", self)
+        extend_action.setToolTip("Carry on the latest run of this diagram up to the simulation time")
+        extend_action.triggered.connect(self.extend_simulation)
+        self.main_toolbar.addAction(extend_action)
+
+        self.live_action = QAction("Live", self)
+        self.live_action.setCheckable(True)
+        self.live_action.setToolTip("Re-simulate automatically after property edits and new wires")
+        self.live_action.toggled.connect(self.set_live_simulation)
+        self.main_toolbar.addAction(self.live_action)
+
+        queue_action = QAction("Queue", self)
+        queue_action.setToolTip("Queue a background run of the diagram with the current settings")
+        queue_action.triggered.connect(self.queue_simulation)
+        self.main_toolbar.addAction(queue_action)
+
+        queue_files_action = QAction("Queue Files", self)
+        queue_files_action.setToolTip("Queue background runs of saved diagrams with the current settings")
+        queue_files_action.triggered.connect(self.queue_files)
+        self.main_toolbar.addAction(queue_files_action)
+
+        fit_action = QAction("Fit Parameters", self)
+        fit_action.setToolTip("Fit block parameters so a SCOPE matches measured data")
+        fit_action.triggered.connect(self.fit_parameters)
+        self.main_toolbar.addAction(fit_action)
+
+        frequency_action = QAction("Frequency Response", self)
+        frequency_action.setToolTip("Bode, Nyquist and pole-zero plots of a linear diagram")
+        frequency_action.triggered.connect(self.show_frequency_panel)
+        self.main_toolbar.addAction(frequency_action)
+
         # Undo/Redo Actions
         undo_action = QAction("Undo", self)
         undo_action.triggered.connect(self.undo_action)
@@ -121,6 +266,18 @@ class MainWindow(QMainWindow):
         redo_action.triggered.connect(self.redo_action)
         self.main_toolbar.addAction(redo_action)
 
+        # Performance tracing
+        self.performance_action = QAction("Performance", self)
+        self.performance_action.setCheckable(True)
+        self.performance_action.setToolTip("Trace operations and show frame times and slow operations")
+        self.performance_action.toggled.connect(self.set_performance_overlay)
+        self.main_toolbar.addAction(self.performance_action)
+
+        export_trace_action = QAction("Export Trace", self)
+        export_trace_action.setToolTip("Save the traced operations as Chrome trace JSON")
+        export_trace_action.triggered.connect(self.export_trace)
+        self.main_toolbar.addAction(export_trace_action)
+
     def setup_properties_panel(self):
         """Setup the properties panel."""
         self.right_panel = QWidget()
@@ -132,6 +289,132 @@ class MainWindow(QMainWindow):
         self.splitter.addWidget(self.right_panel)
         self.splitter.setSizes([800, 400])  # Initial sizes for splitter sections
 
+    def setup_results_panel(self):
+        """Setup the docked panel showing SCOPE signals from the latest simulation."""
+        self.results_viewer = ResultsViewer()
+        self.results_dock = QDockWidget("Results", self)
+        self.results_dock.setWidget(self.results_viewer)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.results_dock)
+        self.results_dock.hide()  # Shown once there are results
+
+    def setup_minimap(self):
+        """Setup the docked overview of the whole diagram."""
+        self.minimap = Minimap(self.canvas)
+        self.minimap_dock = QDockWidget("Overview", self)
+        self.minimap_dock.setWidget(self.minimap)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.minimap_dock)
+
+    def setup_frequency_panel(self):
+        """Setup the docked frequency-response plots."""
+        self.frequency_viewer = FrequencyViewer()
+        self.frequency_viewer.analyze_requested.connect(self.analyze_frequency_response)
+        self.frequency_dock = QDockWidget("Frequency Response", self)
+        self.frequency_dock.setWidget(self.frequency_viewer)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.frequency_dock)
+        self.frequency_dock.hide()  # Shown by the Frequency Response action
+
+    def show_frequency_panel(self):
+        """Show the frequency-response panel with the current diagram's blocks to choose from."""
+        blocks, _ = flatten_diagram(*self.canvas.get_blocks_and_wires())
+        self.frequency_viewer.set_blocks(blocks)
+        self.frequency_dock.show()
+
+    def analyze_frequency_response(self, input_name, output_name):
+        """Compute and plot the frequency response between two blocks of the current diagram."""
+        if not input_name or not output_name:
+            self.show_error_message("Choose an input and an output block.")
+            return
+        try:
+            analysis = analyze_frequency_response(
+                *self.canvas.get_blocks_and_wires(), input_name, output_name
+            )
+        except ValueError as e:
+            self.show_error_message(f"Frequency response: {e}")
+            return
+        self.frequency_viewer.set_analysis(analysis)
+
+    def setup_job_panel(self):
+        """Setup the docked queue of background simulations."""
+        self.job_queue = JobQueue()
+        self.job_panel = JobPanel(self.job_queue)
+        self.job_panel.job_finished.connect(self.job_finished)
+        self.job_panel.show_requested.connect(lambda job: self.show_results(job.results))
+        self.job_dock = QDockWidget("Simulation Queue", self)
+        self.job_dock.setWidget(self.job_panel)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.job_dock)
+        self.job_dock.hide()  # Shown once something is queued
+
+    def queue_options(self):
+        """Simulation time and run_bdsim_simulation options from the toolbar, or None if invalid."""
+        sim_time = self.get_simulation_time()
+        step = self.get_step() if sim_time is not None else False
+        if step is False:
+            return None
+        return sim_time, {"step": step, "solver": self.solver_selector.currentText()}
+
+    def queue_simulation(self):
+        """Queue a run of a snapshot of the current diagram."""
+        diagram = self.canvas.get_blocks_and_wires()
+        blocks, wires = flatten_diagram(*diagram)
+        if not self.validate_blocks_and_wires(blocks, wires, diagram):
+            return
+        settings = self.queue_options()
+        if settings is None:
+            return
+        sim_time, options = settings
+        self.job_queue.submit(f"Diagram ({len(blocks)} blocks)", blocks, wires, sim_time, **options)
+        self.job_panel.refresh()
+        self.job_dock.show()
+
+    def queue_files(self):
+        """Queue runs of saved diagrams, such as variants of the current one."""
+        file_names, _ = QFileDialog.getOpenFileNames(self, "Queue Diagrams", "", DIAGRAM_FILE_FILTER)
+        settings = self.queue_options() if file_names else None
+        if settings is None:
+            return
+        sim_time, options = settings
+        for file_name in file_names:
+            try:
+                diagram = load_diagram(file_name)
+                blocks, wires = flatten_diagram(diagram["blocks"], diagram["wires"])
+                error, _ = self.check_blocks_and_wires(blocks, wires)
+                if error:
+                    raise ValueError(error)
+                self.job_queue.submit(os.path.basename(file_name), blocks, wires, sim_time, **options)
+            except Exception as e:
+                self.show_error_message(f"Could not queue {file_name}: {e}")
+        self.job_panel.refresh()
+        self.job_dock.show()
+
+    def job_finished(self, job):
+        """Report a queued simulation that has finished."""
+        if job.state == "done":
+            self.statusBar().showMessage(f"Queued job {job.id} ({job.name}) finished in {job.elapsed:.1f} s", 5000)
+        else:
+            self.statusBar().showMessage(f"Queued job {job.id} ({job.name}) failed: {job.error}", 10000)
+
+    def set_performance_overlay(self, enabled):
+        """Turn tracing and the performance overlay on or off."""
+        self.performance_overlay.set_active(enabled)
+
+    def export_trace(self):
+        """Save the spans traced so far for chrome://tracing or Perfetto."""
+        if not tracer.events:
+            self.show_error_message("Nothing has been traced yet. Turn on Performance first.")
+            return
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Trace", "trace.json", "Chrome Trace (*.json)")
+        if file_name:
+            try:
+                tracer.export_chrome_trace(file_name)
+                self.statusBar().showMessage(f"Trace with {len(tracer.events)} spans saved to {file_name}", 5000)
+            except OSError as e:
+                self.show_error_message(f"Failed to export trace: {e}")
+
+    def show_results(self, results):
+        """Show simulation results in the results panel."""
+        self.results_viewer.set_results(results)
+        self.results_dock.show()
+
     # Event Handlers
     def set_block_type(self, block_type):
         """Set the current block type from the dropdown menu."""
@@ -153,6 +436,64 @@ class MainWindow(QMainWindow):
         """Ungroup selected items."""
         self.canvas.ungroup_selected_items()
 
+    def create_subsystem(self):
+        """Collapse the selected blocks into a subsystem."""
+        self.canvas.create_subsystem()
+
+    def open_subsystem(self):
+        """Open the selected subsystem."""
+        self.canvas.open_subsystem()
+
+    def close_subsystem(self):
+        """Return from a subsystem to its parent diagram."""
+        self.canvas.close_subsystem()
+
+    def save_to_library(self):
+        """Store the selected subsystem in a component library file under a name."""
+        subsystems = [block for block in self.canvas.selected_blocks() if block.block_type == "SUBSYSTEM"]
+        if len(subsystems) != 1:
+            self.show_error_message("Select one subsystem to save to a library.")
+            return
+        subsystem = subsystems[0]
+        name, ok = QInputDialog.getText(self, "Save to Library", "Component name:", text=subsystem.name)
+        if not ok or not name:
+            return
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, "Component Library", "", LIBRARY_FILE_FILTER, options=QFileDialog.DontConfirmOverwrite
+        )
+        if not file_name:
+            return
+        if not os.path.splitext(file_name)[1]:
+            file_name += LIBRARY_EXTENSION
+        try:
+            self.canvas.sync_subsystems()
+            reference = add_to_library(file_name, subsystem.contents, name)
+            # The subsystem becomes an instance of the stored component
+            subsystem.contents = library_contents(file_name, reference)
+            if os.path.abspath(file_name) not in self.canvas.libraries:
+                self.canvas.libraries.append(os.path.abspath(file_name))
+            self.statusBar().showMessage(f"Saved {name} to {file_name}", 5000)
+        except (OSError, ValueError) as e:
+            self.show_error_message(f"Failed to save to the library: {e}")
+
+    def insert_component(self):
+        """Add an instance of a component chosen from a library file."""
+        file_name, _ = QFileDialog.getOpenFileName(self, "Component Library", "", LIBRARY_FILE_FILTER)
+        if not file_name:
+            return
+        try:
+            components = library_names(file_name)
+            if not components:
+                self.show_error_message("The library has no components.")
+                return
+            name, ok = QInputDialog.getItem(
+                self, "Insert Component", "Component:", [name for name, _ in components], 0, False
+            )
+            if ok:
+                self.canvas.add_component(file_name, dict(components)[name])
+        except (OSError, ValueError) as e:
+            self.show_error_message(f"Failed to read the library: {e}")
+
     def undo_action(self):
         """Perform undo action."""
         self.canvas.undo_action()
@@ -163,10 +504,10 @@ class MainWindow(QMainWindow):
 
     def simulate(self):
         """Run the simulation using bdsim."""
-        blocks, wires = self.canvas.get_blocks_and_wires()
-
         try:
-            if not self.validate_blocks_and_wires(blocks, wires):
+            diagram = self.canvas.get_blocks_and_wires()
+            blocks, wires = flatten_diagram(*diagram)
+            if not self.validate_blocks_and_wires(blocks, wires, diagram):
                 return
 
             # Get simulation time
@@ -174,70 +515,425 @@ class MainWindow(QMainWindow):
             if sim_time is None:
                 return
 
+            step = self.get_step()
+            if step is False:
+                return
+
+            # Paced runs take as long as the simulated time, so they run in the background
+            pace = self.pace_selector.currentData()
+            if pace:
+                self.start_paced_simulation(blocks, wires, sim_time, step, pace)
+                return
+
             # Run the simulation
-            run_bdsim_simulation(blocks, wires, T=sim_time)
+            results = run_bdsim_simulation(
+                blocks, wires, T=sim_time, step=step, solver=self.solver_selector.currentText()
+            )
+            if results is not None:
+                self.simulation_done(results)
 
         except Exception as e:
             self.show_error_message(str(e))
 
-    def validate_blocks_and_wires(self, blocks, wires):
-        """Validate blocks and wires before simulation."""
-        scope_present = any(block["type"] == "SCOPE" for block in blocks)
-        if not scope_present:
-            self.show_error_message("Simulation Error: No SCOPE block present.")
+    def extend_simulation(self):
+        """Resume the latest run of the diagram from its final state up to the simulation time."""
+        try:
+            diagram = self.canvas.get_blocks_and_wires()
+            blocks, wires = flatten_diagram(*diagram)
+            if not self.validate_blocks_and_wires(blocks, wires, diagram):
+                return
+            sim_time = self.get_simulation_time()
+            if sim_time is None:
+                return
+            step = self.get_step()
+            if step is False:
+                return
+
+            # The run kept in memory, or the one saved by an earlier session
+            fingerprint = diagram_fingerprint(blocks, wires)
+            previous = self.last_run
+            if previous is None or previous["checkpoint"]["fingerprint"] != fingerprint:
+                directory = run_directory(fingerprint)
+                if not os.path.isdir(directory):
+                    self.show_error_message("Simulate this diagram before extending the run.")
+                    return
+                results, checkpoint = load_run(directory)
+                previous = dict(results, checkpoint=checkpoint)
+            checkpoint = previous["checkpoint"]
+            if sim_time <= checkpoint["t"]:
+                self.show_error_message(
+                    f"The run already reaches t={checkpoint['t']:g}; set a longer simulation time to extend it."
+                )
+                return
+
+            results = run_bdsim_simulation(
+                blocks, wires, T=sim_time, step=step, solver=self.solver_selector.currentText(), resume=checkpoint
+            )
+            if results is not None:
+                self.simulation_done(append_results(previous, results))
+
+        except Exception as e:
+            self.show_error_message(str(e))
+
+    def simulation_done(self, results):
+        """Show a finished run and keep it, with its final checkpoint, so it can be extended later."""
+        self.show_results(results)
+        reports = []
+        if results.get("optimization"):
+            reports.append(format_optimization_report(results["optimization"]))
+        if "solver" in results:
+            reports.append(format_solver_report(results["solver"]))
+        if reports:
+            self.statusBar().showMessage(". ".join(reports), 10000)
+
+        if "checkpoint" not in results:
+            return  # Stopped before the end
+        self.last_run = results
+        try:
+            save_run(run_directory(results["checkpoint"]["fingerprint"]), results, results["checkpoint"])
+        except OSError as e:
+            print(f"Failed to save the run for extending later: {e}")
+
+    def validate_blocks_and_wires(self, blocks, wires, diagram):
+        """Validate flattened blocks and wires before simulation; diagram is the canvas's unflattened pair."""
+        error, widths = self.check_blocks_and_wires(blocks, wires)
+        if error:
+            self.show_error_message(error)
             return False
+        self.canvas.show_signal_widths(widths, *diagram)
+        return True
+
+    def check_blocks_and_wires(self, blocks, wires):
+        """Return (a description of what prevents simulating the diagram or None, signal widths by block name)."""
+        scope_present = any(block["type"] in ("SCOPE", "EXT_SINK") for block in blocks)
+        if not scope_present:
+            return "Simulation Error: No SCOPE or EXT_SINK block present.", None
 
         block_names = {block["name"] for block in blocks}
         for wire in wires:
             if wire["start"] not in block_names or wire["end"] not in block_names:
-                self.show_error_message(
-                    f"Simulation Error: Invalid connection {wire['start']} -> {wire['end']}."
-                )
-                return False
+                return f"Simulation Error: Invalid connection {wire['start']} -> {wire['end']}.", None
 
-        return True
+        # Channel widths are inferred here so mismatched vector signals fail before the run
+        try:
+            return None, signal_widths(blocks, wires)
+        except ValueError as e:
+            return f"Simulation Error: {e}", None
 
     def get_simulation_time(self):
         """Retrieve and validate the simulation time."""
         try:
-            sim_time = float(self.sim_time_input.text())
-            if sim_time <= 0:
-                raise ValueError("Simulation time must be greater than zero.")
-            return sim_time
+            return self.parse_simulation_time()
         except ValueError as e:
             self.show_error_message(f"Invalid simulation time: {e}")
             return None
 
-    def save_to_file(self):
-        """Save the current block diagram to a file."""
+    def get_step(self):
+        """Return the fixed step, None for adaptive steps, or False if it is invalid."""
+        text = self.step_input.text().strip()
+        if not text:
+            return None
+        try:
+            step = float(text)
+            if step <= 0:
+                raise ValueError("Step must be greater than zero.")
+            return step
+        except ValueError as e:
+            self.show_error_message(f"Invalid step: {e}")
+            return False
+
+    def start_paced_simulation(self, blocks, wires, sim_time, step, pace):
+        """Run the diagram locked to the wall clock on a background thread."""
+        if self.paced_worker:
+            self.show_error_message("A real-time run is already in progress.")
+            return
+        self.paced_worker = SimulationWorker(blocks, wires, sim_time, step=step, pace=pace)
+        self.paced_worker.succeeded.connect(self.paced_simulation_done)
+        self.paced_worker.failed.connect(self.show_error_message)
+        self.paced_worker.finished.connect(self.paced_worker_finished)
+        self.statusBar().showMessage(f"Running at {pace:g}x real time...")
+        self.paced_worker.start()
+
+    def paced_simulation_done(self, results):
+        """Show the results and timing statistics of a real-time run."""
+        self.show_results(results)
+        report = format_timing_report(results["timing"])
+        print(report)
+        QMessageBox.information(self, "Real-time Run", report)
+
+    def paced_worker_finished(self):
+        """Forget the real-time worker once its thread has stopped."""
+        self.paced_worker.deleteLater()
+        self.paced_worker = None
+        self.statusBar().clearMessage()
+
+    def fit_parameters(self):
+        """Ask which parameters to fit to which measured data, then fit them in the background."""
+        if self.fit_worker:
+            self.fit_worker.cancel()
+            self.statusBar().showMessage("Cancelling parameter fit...")
+            return
+
+        step = self.get_step()
+        if step is False:
+            return
+
         blocks, wires = self.canvas.get_blocks_and_wires()
-        diagram_data = {"blocks": blocks, "wires": wires}
+        dialog = FitDialog(blocks, self)
+        if not dialog.exec_():
+            return
+        try:
+            options = dialog.options()
+        except ValueError as e:
+            self.show_error_message(str(e))
+            return
+
+        # The worker gets its own copy of the properties, as fitted values are applied as edits
+        for block in blocks:
+            block["properties"] = dict(block["properties"])
+
+        self.fit_worker = FitWorker(blocks, wires, step=step, **options)
+        self.fit_worker.progressed.connect(self.fit_progressed)
+        self.fit_worker.succeeded.connect(self.fit_done)
+        self.fit_worker.failed.connect(self.show_error_message)
+        self.fit_worker.finished.connect(self.fit_worker_finished)
+        self.statusBar().showMessage("Fitting parameters... (Fit Parameters again to cancel)")
+        self.fit_worker.start()
+
+    def fit_progressed(self, evaluations, error):
+        self.statusBar().showMessage(f"Fitting parameters: {evaluations} simulations, RMS error {error:.6g}")
+
+    def fit_done(self, result):
+        """Write fitted values back as property edits, so they are journaled like edits made by hand."""
+        blocks = {
+            item.name: item for item in self.canvas.root_scene().items() if isinstance(item, Block)
+        }
+        for parameter, value in zip(result["parameters"], result["values"]):
+            name, prop, _ = parameter
+            block = blocks.get(name)
+            if block is None:
+                continue  # Deleted while the fit ran
+            properties = dict(block.properties)
+            set_parameter(properties, parameter, value)
+            self.properties_editor.apply_property([block], prop, properties[prop])
+        if self.properties_editor.blocks:
+            self.properties_editor.set_blocks(self.properties_editor.blocks)  # Show the new values
+        report = format_fit_report(result)
+        print(report)
+        QMessageBox.information(self, "Parameter Fit", report)
+
+    def fit_worker_finished(self):
+        """Forget the fit worker once its thread has stopped."""
+        self.fit_worker.deleteLater()
+        self.fit_worker = None
+        self.statusBar().clearMessage()
+
+    def parse_simulation_time(self):
+        """Return the simulation time entered in the toolbar, raising ValueError if invalid."""
+        sim_time = float(self.sim_time_input.text())
+        if sim_time <= 0:
+            raise ValueError("Simulation time must be greater than zero.")
+        return sim_time
+
+    def setup_live_simulation(self):
+        """Prepare debounced re-simulation for the Live toggle."""
+        self.live_workers = []  # Runs still in flight, including cancelled ones
+        self.live_results = None  # Results of the latest completed live run
+
+        # Edits within the debounce window are coalesced into one run
+        self.live_timer = QTimer(self)
+        self.live_timer.setSingleShot(True)
+        self.live_timer.setInterval(300)
+        self.live_timer.timeout.connect(self.run_live_simulation)
+
+        self.canvas.simulation_changed.connect(self.schedule_live_simulation)
+
+    def set_live_simulation(self, enabled):
+        """Turn live re-simulation on or off."""
+        if enabled:
+            self.schedule_live_simulation()
+        else:
+            self.live_timer.stop()
+            self.cancel_live_simulations()
+
+    def schedule_live_simulation(self, *args):
+        """Re-simulate once no further edits arrive within the debounce window."""
+        if self.live_action.isChecked():
+            self.live_timer.start()
+
+    def cancel_live_simulations(self):
+        """Cancel every live run that is still in flight."""
+        for worker in self.live_workers:
+            worker.cancel()
+
+    def run_live_simulation(self):
+        """Start a background run of the current diagram, cancelling older runs."""
+        self.cancel_live_simulations()
 
-        file_name, _ = QFileDialog.getSaveFileName(
-            self, "Save Diagram", "", "JSON Files (*.json);;All Files (*)"
+        try:
+            diagram = self.canvas.get_blocks_and_wires()
+            blocks, wires = flatten_diagram(*diagram)
+            sim_time = self.parse_simulation_time()
+        except ValueError as e:
+            self.statusBar().showMessage(f"Live simulation: {e}")
+            return
+        error, widths = self.check_blocks_and_wires(blocks, wires)
+        if error:
+            self.statusBar().showMessage(f"Live simulation: {error}")
+            return
+        self.canvas.show_signal_widths(widths, *diagram)
+
+        # Properties are copied so later edits can't race with the worker
+        for block in blocks:
+            block["properties"] = dict(block["properties"])
+
+        worker = SimulationWorker(
+            blocks, wires, sim_time, version=self.canvas.simulation_version,
+            solver=self.solver_selector.currentText(),
+        )
+        worker.succeeded.connect(lambda results: self.live_simulation_done(worker, results))
+        worker.failed.connect(lambda error: self.live_simulation_failed(worker, error))
+        worker.finished.connect(lambda: self.live_worker_finished(worker))
+        self.live_workers.append(worker)
+        self.statusBar().showMessage("Live simulation running...")
+        worker.start()
+
+    def live_simulation_done(self, worker, results):
+        """Apply results of a live run if the simulated diagram hasn't changed since it started."""
+        if worker.version != self.canvas.simulation_version:
+            return  # Stale: the edit that made it so scheduled a newer run
+        self.live_results = results
+        self.show_results(results)
+        self.statusBar().showMessage(f"Live simulation updated ({len(results['t'])} time steps)", 5000)
+
+    def live_simulation_failed(self, worker, error):
+        """Report a failed live run if it is still current."""
+        if worker.version == self.canvas.simulation_version:
+            self.statusBar().showMessage(f"Live simulation failed: {error}")
+
+    def live_worker_finished(self, worker):
+        """Release a live worker once its thread has stopped."""
+        self.live_workers.remove(worker)
+        worker.deleteLater()
+
+    def save_to_file(self):
+        """Save the current block diagram to a file on a background thread."""
+        if self.file_worker:
+            QMessageBox.warning(self, "Busy", "A diagram file operation is already in progress.")
+            return
+
+        file_name, selected_filter = QFileDialog.getSaveFileName(
+            self, "Save Diagram", "", DIAGRAM_FILE_FILTER
         )
 
         if file_name:
-            try:
-                with open(file_name, "w") as file:
-                    json.dump(diagram_data, file, indent=4)
-                QMessageBox.information(self, "Success", f"Diagram saved to {file_name}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to save file: {e}")
+            if COMPACT_EXTENSION in selected_filter and not os.path.splitext(file_name)[1]:
+                file_name += COMPACT_EXTENSION
+
+            # Snapshot the diagram on the GUI thread; encoding and writing happen in the worker
+            diagram_data = self.canvas.get_diagram_data()
+
+            self.start_file_worker(
+                DiagramFileWorker(file_name, diagram_data),
+                lambda _: QMessageBox.information(self, "Success", f"Diagram saved to {file_name}"),
+                lambda error: QMessageBox.critical(self, "Error", f"Failed to save file: {error}"),
+            )
 
     def load_from_file(self):
-        """Load a block diagram from a file."""
+        """Load a block diagram from a file, reading it on a background thread."""
+        if self.file_worker:
+            QMessageBox.warning(self, "Busy", "A diagram file operation is already in progress.")
+            return
+
         file_name, _ = QFileDialog.getOpenFileName(
-            self, "Load Diagram", "", "JSON Files (*.json);;All Files (*)"
+            self, "Load Diagram", "", DIAGRAM_FILE_FILTER
         )
 
         if file_name:
-            try:
-                Block.reset_instance_counter()
-                self.canvas.load_from_file(file_name)
-                QMessageBox.information(self, "Success", f"Diagram loaded from {file_name}")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to load file: {e}")
+            def finish_load(diagram_data):
+                try:
+                    Block.reset_instance_counter()
+                    with span("MainWindow.load_from_file", file=file_name):
+                        self.canvas.load_diagram(diagram_data)
+                    QMessageBox.information(self, "Success", f"Diagram loaded from {file_name}")
+                except Exception as e:
+                    QMessageBox.critical(self, "Error", f"Failed to load file: {e}")
+
+            self.start_file_worker(
+                DiagramFileWorker(file_name),
+                finish_load,
+                lambda error: QMessageBox.critical(self, "Error", f"Failed to load file: {error}"),
+            )
+
+    def start_file_worker(self, worker, on_success, on_failure):
+        """Run a diagram file worker while showing its progress in the status bar."""
+        self.file_worker = worker
+        self.file_progress.setRange(0, 0)  # Busy until the first progress report
+        self.file_progress.show()
+
+        worker.progress.connect(self.update_file_progress)
+        worker.succeeded.connect(on_success)
+        worker.failed.connect(on_failure)
+        worker.finished.connect(self.file_worker_finished)
+        worker.start()
+
+    def update_file_progress(self, done, total):
+        """Show the progress reported by the file worker."""
+        self.file_progress.setRange(0, max(total, 1))
+        self.file_progress.setValue(done)
+
+    def file_worker_finished(self):
+        """Hide the progress bar once the file worker thread has stopped."""
+        self.file_progress.hide()
+        self.file_worker.deleteLater()
+        self.file_worker = None
+
+    def setup_autosave(self):
+        """Attach the autosave journal to the canvas, offering to recover a crashed session first."""
+        self.journal = DiagramJournal(self.autosave_dir)
+
+        if self.journal.has_recovery():
+            answer = QMessageBox.question(
+                self, "Recover Diagram",
+                "The editor did not shut down cleanly. Recover the autosaved diagram?"
+            )
+            if answer == QMessageBox.Yes:
+                try:
+                    diagram_data = self.journal.recover()
+                    self.canvas.journal = self.journal
+                    self.canvas.load_diagram(diagram_data)  # Also compacts the recovered journal
+                except Exception as e:
+                    QMessageBox.critical(self, "Error", f"Failed to recover diagram: {e}")
+                    self.journal.discard()
+            else:
+                self.journal.discard()
+        self.canvas.journal = self.journal
+
+        # Compact the journal into a snapshot in the background from time to time
+        self.compact_timer = QTimer(self)
+        self.compact_timer.timeout.connect(self.compact_journal)
+        self.compact_timer.start(5000)
+
+    def compact_journal(self):
+        """Write a snapshot of the diagram on a background thread if enough edits are pending."""
+        if self.journal.compacting() or not self.journal.needs_compaction():
+            return
+        self.journal.compact(self.canvas.get_diagram_data())
+
+    def closeEvent(self, event):
+        """Drop the autosave journal on a clean shutdown."""
+        self.cancel_live_simulations()
+        for worker in self.live_workers:
+            worker.wait()
+        if self.paced_worker:
+            self.paced_worker.cancel()
+            self.paced_worker.wait()
+        if self.fit_worker:
+            self.fit_worker.cancel()
+            self.fit_worker.wait()
+        self.job_queue.shutdown()
+        self.journal.close()
+        super().closeEvent(event)
 
     def new_diagram(self):
         """Start a new diagram with a fresh canvas."""